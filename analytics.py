@@ -0,0 +1,336 @@
+"""Vectorized analytics over a columnar snapshot of the post and reaction tables.
+
+The snapshot keeps every numeric column of ``post`` and ``reaction`` as a raw
+NumPy array file under Data/columns/, with the row counts and high-water marks
+in columns.json. ``refresh_snapshot`` appends only the rows added since the
+last refresh (late commits below the mark included, see exporter.HighWater), and ``load_snapshot`` maps the files into memory without copying
+them. Every report is computed from one load of the snapshot with NumPy and
+pandas, none of them queries the database.
+
+The snapshot holds the history: reactions archived out of the hot table (see
+archive.py) stay in it. Rows updated in place aren't refreshed, posts and
+reactions never are.
+
+    python analytics.py refresh
+    python analytics.py report category_scores hourly_activity --csv
+"""
+import argparse
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from exporter import HighWater, data_path
+from validators import CATEGORY_NAMES
+
+SNAPSHOT_FOLDER = "columns"  # inside the data folder
+SNAPSHOT_META = "columns.json"
+SNAPSHOT_BATCH_SIZE = 50000  # rows fetched per round trip when refreshing
+CATEGORY_ORDER = sorted(CATEGORY_NAMES)  # category codes of the snapshot
+
+# table: (high-water column, query for the rows added after a high-water mark, {column: dtype});
+# the query selects the columns in this order, timestamps become epoch seconds
+SNAPSHOT_TABLES = {
+    "post": ("post_id", "SELECT post_id, user_id, category, timestamp FROM post WHERE post_id > %s ORDER BY post_id",
+             {"post_id": "int64", "user_id": "int64", "category": "int8", "timestamp": "int64"}),
+    "reaction": ("reaction_id", "SELECT reaction_id, post_id, user_id, reaction_score, timestamp FROM reaction "
+                                "WHERE reaction_id > %s ORDER BY reaction_id",
+                 {"reaction_id": "int64", "post_id": "int64", "user_id": "int64", "reaction_score": "int8",
+                  "timestamp": "int64"}),
+}
+
+# the charts of concurrent exports refresh it from several threads (see scheduler.py), a
+# refresh cuts the files back and appends to them, so refreshes and loads take turns
+snapshot_lock = threading.Lock()
+
+
+def snapshot_path(filename: str) -> str:
+    folder = data_path(SNAPSHOT_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, filename)
+
+
+def column_file(table: str, column: str) -> str:
+    return snapshot_path(f"{table}.{column}.bin")
+
+
+def load_meta() -> Dict[str, Dict[str, Any]]:
+    """Returns {table: {"rows": ..., "high_water": ..., "pending": [...]}} of the snapshot."""
+    try:
+        with open(snapshot_path(SNAPSHOT_META), encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_meta(meta: Dict[str, Dict[str, Any]]) -> None:
+    path = snapshot_path(SNAPSHOT_META)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(meta, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+# REFRESH ===============================================================================
+
+def to_columns(table: str, rows: List[tuple]) -> Dict[str, np.ndarray]:
+    """Converts fetched rows to the column arrays of the snapshot."""
+    dtypes = SNAPSHOT_TABLES[table][2]
+    values = dict(zip(dtypes, zip(*rows)))
+    columns = {}
+    for column, dtype in dtypes.items():
+        if column == "category":
+            codes = {category: code for code, category in enumerate(CATEGORY_ORDER)}
+            columns[column] = np.array([codes.get(category, -1) for category in values[column]], dtype=dtype)
+        elif column == "timestamp":
+            # ISO text (SQLite) and datetimes (MySQL) both parse to datetime64
+            columns[column] = np.array(values[column], dtype="datetime64[s]").astype(dtype)
+        else:
+            columns[column] = np.array(values[column], dtype=dtype)
+    return columns
+
+
+def refresh_table(pool: Any, table: str, meta: Dict[str, Dict[str, Any]],
+                  batch_size: int = SNAPSHOT_BATCH_SIZE) -> int:
+    """Appends the rows added to a table since the last refresh, returns their number.
+
+    The column files are cut back to the committed row count first, a refresh
+    that died halfway leaves no rows behind. The meta file is written after
+    the column files, so a crash never counts rows that aren't there.
+    """
+    key, query, dtypes = SNAPSHOT_TABLES[table]
+    entry = meta.setdefault(table, {"rows": 0, "high_water": 0})
+    keys = HighWater(entry["high_water"], entry.get("pending", []))
+    files = {}
+    for column, dtype in dtypes.items():
+        path = column_file(table, column)
+        files[column] = open(path, "ab")
+        files[column].truncate(entry["rows"] * np.dtype(dtype).itemsize)
+
+    added = 0
+    try:
+        with pool.cursor(buffered=False, readonly=True) as cursor:
+            cursor.execute(query, (keys.start(),))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                rows = keys.new_rows(rows)
+                if not rows:
+                    continue
+                for column, values in to_columns(table, rows).items():
+                    files[column].write(values.tobytes())
+                added += len(rows)
+    finally:
+        for file in files.values():
+            file.flush()
+            os.fsync(file.fileno())
+            file.close()
+    entry["rows"] += added
+    entry["high_water"] = keys.mark
+    entry["pending"] = sorted(keys.pending)
+    return added
+
+
+def refresh_snapshot(pool: Any) -> Dict[str, int]:
+    """Brings the snapshot up to date, returns the rows added per table."""
+    with snapshot_lock:
+        meta = load_meta()
+        added = {table: refresh_table(pool, table, meta) for table in SNAPSHOT_TABLES}
+        save_meta(meta)
+    return added
+
+
+# SNAPSHOT ==============================================================================
+
+class Snapshot(NamedTuple):
+    """The snapshot as DataFrames, numeric columns mapped from the files without a copy."""
+    posts: pd.DataFrame  # post_id, user_id, category (categorical), timestamp (datetime64)
+    reactions: pd.DataFrame  # reaction_id, post_id, user_id, reaction_score, timestamp, category
+
+
+def load_columns(table: str, rows: int) -> Dict[str, np.ndarray]:
+    columns = {}
+    for column, dtype in SNAPSHOT_TABLES[table][2].items():
+        path = column_file(table, column)
+        if rows:
+            columns[column] = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+        else:
+            columns[column] = np.empty(0, dtype=dtype)
+    return columns
+
+
+def load_snapshot() -> Snapshot:
+    """Maps the snapshot into memory, refresh_snapshot() has to have run once.
+
+    Later refreshes only append past the mapped rows, the mapping stays valid.
+    """
+    with snapshot_lock:
+        meta = load_meta()
+        post = load_columns("post", meta.get("post", {}).get("rows", 0))
+        reaction = load_columns("reaction", meta.get("reaction", {}).get("rows", 0))
+
+    post_categories = pd.Categorical.from_codes(post["category"], categories=CATEGORY_ORDER)
+    # reactions get the category of their post through a post_id indexed lookup array
+    category_by_post = np.full(int(post["post_id"].max(initial=0)) + 1, -1, dtype=np.int8)
+    category_by_post[post["post_id"]] = post["category"]
+    reaction_codes = np.where(reaction["post_id"] < len(category_by_post),
+                              category_by_post[np.minimum(reaction["post_id"], len(category_by_post) - 1)], -1)
+
+    posts = pd.DataFrame({
+        "post_id": post["post_id"], "user_id": post["user_id"], "category": post_categories,
+        "timestamp": post["timestamp"].astype("datetime64[s]"),
+    }, copy=False)
+    reactions = pd.DataFrame({
+        "reaction_id": reaction["reaction_id"], "post_id": reaction["post_id"], "user_id": reaction["user_id"],
+        "reaction_score": reaction["reaction_score"], "timestamp": reaction["timestamp"].astype("datetime64[s]"),
+        "category": pd.Categorical.from_codes(reaction_codes.astype(np.int8), categories=CATEGORY_ORDER),
+    }, copy=False)
+    return Snapshot(posts, reactions)
+
+
+# REPORTS ===============================================================================
+
+def category_scores(snapshot: Snapshot) -> pd.DataFrame:
+    """Total and average reaction score, reactions and posts per category."""
+    reactions = snapshot.reactions.groupby("category", observed=False)["reaction_score"]
+    report = pd.DataFrame({
+        "total_score": reactions.sum(),
+        "reaction_count": reactions.count(),
+        "avg_score": reactions.mean().round(3),
+        "posts": snapshot.posts.groupby("category", observed=False)["post_id"].count(),
+    })
+    return report.sort_values("total_score", ascending=False).rename_axis("category").reset_index()
+
+
+def score_distribution(snapshot: Snapshot) -> pd.DataFrame:
+    """Share of each reaction score (1-5) per category."""
+    report = pd.crosstab(snapshot.reactions["category"], snapshot.reactions["reaction_score"], normalize="index")
+    return report.round(4).rename_axis(columns=None).reset_index()
+
+
+def hourly_activity(snapshot: Snapshot) -> pd.DataFrame:
+    """Posts and reactions per hour of the day."""
+    hours = pd.RangeIndex(24, name="hour")
+    return pd.DataFrame({
+        "posts": np.bincount(snapshot.posts["timestamp"].dt.hour, minlength=24),
+        "reactions": np.bincount(snapshot.reactions["timestamp"].dt.hour, minlength=24),
+    }, index=hours).reset_index()
+
+
+def daily_activity(snapshot: Snapshot) -> pd.DataFrame:
+    """Posts, reactions and average score per day."""
+    reactions = snapshot.reactions.groupby(snapshot.reactions["timestamp"].dt.floor("D"))["reaction_score"]
+    report = pd.DataFrame({
+        "posts": snapshot.posts.groupby(snapshot.posts["timestamp"].dt.floor("D"))["post_id"].count(),
+        "reactions": reactions.count(),
+        "avg_score": reactions.mean().round(3),
+    })
+    report.index.name = "day"
+    return report.fillna({"posts": 0, "reactions": 0}).astype({"posts": "int64", "reactions": "int64"}).reset_index()
+
+
+def weekday_category_activity(snapshot: Snapshot) -> pd.DataFrame:
+    """Reactions per weekday (0 = Monday) and category."""
+    reactions = snapshot.reactions
+    report = pd.crosstab(reactions["timestamp"].dt.dayofweek.rename("weekday"), reactions["category"])
+    return report.rename_axis(columns=None).reset_index()
+
+
+def user_engagement(snapshot: Snapshot) -> pd.DataFrame:
+    """Quantiles of reactions given per user, posts written per author and average score given."""
+    reactions = snapshot.reactions.groupby("user_id")["reaction_score"]
+    given, average = reactions.count(), reactions.mean()
+    written = snapshot.posts.groupby("user_id")["post_id"].count()
+    quantiles = [0.0, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+    return pd.DataFrame({
+        "reactions_given": given.quantile(quantiles),
+        "avg_score_given": average.quantile(quantiles).round(3),
+        "posts_written": written.quantile(quantiles),
+    }).rename_axis("quantile").reset_index()
+
+
+def top_users(snapshot: Snapshot, limit: int = 20) -> pd.DataFrame:
+    """Users giving the most reactions, with their average score."""
+    reactions = snapshot.reactions.groupby("user_id")["reaction_score"]
+    report = pd.DataFrame({"reactions": reactions.count(), "avg_score": reactions.mean().round(3)})
+    return report.nlargest(limit, "reactions").reset_index()
+
+
+def post_engagement(snapshot: Snapshot) -> pd.DataFrame:
+    """Posts by number of reactions received, in power of two buckets."""
+    post_ids = snapshot.posts["post_id"].to_numpy()
+    counts = np.bincount(snapshot.reactions["post_id"].to_numpy(), minlength=int(post_ids.max(initial=0)) + 1)[post_ids]
+    buckets = np.where(counts > 0, np.floor(np.log2(np.maximum(counts, 1))).astype(np.int64) + 1, 0)
+    histogram = np.bincount(buckets)
+    lower = [0] + [2 ** (bucket - 1) for bucket in range(1, len(histogram))]
+    return pd.DataFrame({"min_reactions": lower, "posts": histogram})
+
+
+def top_posts(snapshot: Snapshot, limit: int = 20, min_reactions: int = 10) -> pd.DataFrame:
+    """Best rated posts with at least ``min_reactions`` reactions."""
+    reactions = snapshot.reactions.groupby("post_id")["reaction_score"]
+    report = pd.DataFrame({"reactions": reactions.count(), "avg_score": reactions.mean().round(3)})
+    report = report[report["reactions"] >= min_reactions]
+    return report.sort_values(["avg_score", "reactions"], ascending=False).head(limit).reset_index()
+
+
+# report name: function of the snapshot returning a DataFrame
+REPORTS: Dict[str, Callable[[Snapshot], pd.DataFrame]] = {
+    "category_scores": category_scores,
+    "score_distribution": score_distribution,
+    "hourly_activity": hourly_activity,
+    "daily_activity": daily_activity,
+    "weekday_category_activity": weekday_category_activity,
+    "user_engagement": user_engagement,
+    "top_users": top_users,
+    "post_engagement": post_engagement,
+    "top_posts": top_posts,
+}
+
+
+def run_reports(snapshot: Snapshot, names: Optional[Sequence[str]] = None) -> Dict[str, pd.DataFrame]:
+    """Computes the named reports (all if None) from one loaded snapshot."""
+    unknown = set(names or ()) - set(REPORTS)
+    if unknown:
+        raise ValueError(f"unknown reports: {', '.join(sorted(unknown))}")
+    return {name: REPORTS[name](snapshot) for name in (names or REPORTS)}
+
+
+def main() -> None:
+    from time import perf_counter
+
+    from database import open_pool
+
+    parser = argparse.ArgumentParser(description="Columnar snapshot of posts and reactions, and the reports over it.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("refresh", help="append the rows added since the last refresh")
+    report_parser = subparsers.add_parser("report", help="print reports computed from the snapshot")
+    report_parser.add_argument("names", nargs="*", help=f"any of {', '.join(REPORTS)}, all if none given")
+    report_parser.add_argument("--csv", action="store_true", help="also save each report as Data/report-<name>.csv")
+    args = parser.parse_args()
+
+    if args.command == "refresh":
+        pool = open_pool(size=1)
+        start = perf_counter()
+        added = refresh_snapshot(pool)
+        pool.close()
+        print(f" Snapshot refreshed in {perf_counter() - start:.2f}s: "
+              + ", ".join(f"{rows} new {table} rows" for table, rows in added.items()))
+        return
+
+    start = perf_counter()
+    snapshot = load_snapshot()
+    reports = run_reports(snapshot, args.names or None)
+    for name, report in reports.items():
+        print(f"\n {name}\n{report.to_string(index=False)}")
+        if args.csv:
+            report.to_csv(data_path(f"report-{name}.csv"), index=False)
+    print(f"\n {len(reports)} reports over {len(snapshot.posts)} posts and {len(snapshot.reactions)} reactions "
+          f"in {perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Monthly partitioning of the post and reaction tables and archival of old reactions.
+
+On MySQL both tables can be partitioned by month on their timestamp, so date
+range queries only read the matching partitions. The archival job moves the
+reactions of every month older than ``--keep-months`` out of the hot table, into
+the compressed ``reaction_archive`` table or a Parquet file under Data/, and
+keeps their score totals per post in ``reaction_archive_summary``. The rollup
+rebuild combines those summaries with a scan of the remaining hot reactions.
+
+Posts are partitioned but never archived, they are the content the users read.
+Which user reacted to which post is kept in ``reaction_archive_seen`` for every
+archived reaction, so the feeds keep leaving out the posts a user has seen.
+
+    python archive.py partition post reaction
+    python archive.py archive --keep-months 6 --target parquet
+"""
+import argparse
+import os
+from datetime import date, datetime
+from typing import Any, List, Optional, Tuple
+
+from exporter import data_path
+from ingest import placeholders
+from validators import parse_timestamp
+
+PARTITIONED_TABLES = {"post": "post_id", "reaction": "reaction_id"}  # table: auto increment key
+PARTITION_MONTHS_AHEAD = 3  # empty partitions kept ready for the coming months
+ARCHIVE_KEEP_MONTHS = 6  # months of reactions kept in the hot table
+ARCHIVE_TARGETS = ("table", "parquet")
+ARCHIVE_BATCH_SIZE = 10000  # reactions deleted per transaction
+REACTION_COLUMNS = "reaction_id, post_id, user_id, reaction_score, timestamp"
+
+# reaction_archive, reaction_archive_summary, reaction_archive_seen and archive_log
+# are created by migrations 6 and 12, see migrations.py
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def next_month(value: date) -> date:
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+def oldest_month(cursor: Any, table: str) -> Optional[date]:
+    """Returns the first day of the month of the oldest row, None for an empty table."""
+    cursor.execute(f"SELECT MIN(timestamp) FROM {table}")
+    oldest = parse_timestamp(cursor.fetchone()[0])
+    return month_start(oldest) if oldest else None
+
+
+# PARTITIONING ==========================================================================
+
+def partition_definitions(months: List[date]) -> str:
+    definitions = [f"PARTITION {partition_name(month)} VALUES LESS THAN ('{next_month(month)}')" for month in months]
+    definitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return ", ".join(definitions)
+
+
+def partition_table(pool: Any, table: str, months_ahead: int = PARTITION_MONTHS_AHEAD) -> bool:
+    """Partitions a table by month of its timestamp, MySQL only.
+
+    The timestamp has to be part of the primary key of a partitioned table, so
+    the key becomes (id, timestamp). So it has to be part of every unique index:
+    the unique reaction index of migration 7 is dropped, the primary key of
+    reaction_pair keeps one reaction per user and post instead. MySQL rebuilds the whole table
+    and blocks writes while doing so, run it in a maintenance window.
+
+    Returns:
+        bool: False when the table was already partitioned
+    """
+    if pool.backend.name != "mysql":
+        raise ValueError(f"the {pool.backend.name} backend has no native partitioning")
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"table '{table}' can't be partitioned")
+
+    from migrations import UNIQUE_INDEXES  # migrations imports this module
+
+    key = PARTITIONED_TABLES[table]
+    with pool.cursor() as cursor:
+        if pool.backend.partitions(cursor, table):
+            return False
+        first = oldest_month(cursor, table) or month_start(date.today())
+        # primary key columns can't be NULL, the first partition has no lower bound
+        cursor.execute(f"UPDATE {table} SET timestamp = %s WHERE timestamp IS NULL", (first,))
+        months = [first]
+        while months[-1] < add_months(date.today(), months_ahead):
+            months.append(next_month(months[-1]))
+
+        for index, (indexed, columns) in UNIQUE_INDEXES.items():
+            if indexed == table and "timestamp" not in columns and pool.backend.index_exists(cursor, table, index):
+                pool.backend.drop_index(cursor, table, index)
+                print(f"Unique index '{index}' dropped, the application enforces it on the partitioned table...")
+        cursor.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY ({key}, timestamp)")
+        cursor.execute(f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS(timestamp) ({partition_definitions(months)})")
+    print(f"Table '{table}' partitioned into {len(months)} months...")
+    return True
+
+
+def add_partitions(pool: Any, table: str, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """Splits the upcoming months out of the catch-all partition of a partitioned table.
+
+    Returns:
+        int: number of partitions added
+    """
+    with pool.cursor() as cursor:
+        names = [name for name in pool.backend.partitions(cursor, table) if name != "pmax"]
+        if not names:
+            return 0
+        last = date(int(names[-1][1:5]), int(names[-1][5:7]), 1)
+        months = []
+        while last < add_months(date.today(), months_ahead):
+            last = next_month(last)
+            months.append(last)
+        if months:
+            cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({partition_definitions(months)})")
+    return len(months)
+
+
+# ARCHIVAL ==============================================================================
+
+def write_parquet(pool: Any, month: date, month_end: date) -> str:
+    """Writes the reactions older than month_end to Data/reaction-archive-YYYYMM.parquet."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("the parquet archive target needs pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([("reaction_id", pa.int64()), ("post_id", pa.int64()), ("user_id", pa.int64()),
+                        ("reaction_score", pa.int8()), ("timestamp", pa.timestamp("s"))])
+    filepath = data_path(f"reaction-archive-{month:%Y%m}.parquet")
+    with pool.cursor(buffered=False) as cursor:
+        cursor.execute(f"SELECT {REACTION_COLUMNS} FROM reaction WHERE timestamp < %s ORDER BY reaction_id",
+                       (month_end,))
+        # written under a temporary name, a failed run leaves no archive behind
+        with pq.ParquetWriter(filepath + ".part", schema, compression="zstd") as writer:
+            while True:
+                rows = cursor.fetchmany(ARCHIVE_BATCH_SIZE)
+                if not rows:
+                    break
+                columns = [list(column) for column in zip(*rows)]
+                columns[4] = [parse_timestamp(value) for value in columns[4]]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+    os.replace(filepath + ".part", filepath)
+    return filepath
+
+
+def delete_archived(pool: Any, month: date, month_end: date, batch_size: int = ARCHIVE_BATCH_SIZE) -> None:
+    """Removes the archived reactions from the hot table.
+
+    A partitioned table drops the partition of the month at once, otherwise the
+    rows are deleted in batches of their keys, one transaction each.
+    """
+    with pool.cursor() as cursor:
+        if partition_name(month) in pool.backend.partitions(cursor, "reaction"):
+            cursor.execute(f"ALTER TABLE reaction DROP PARTITION {partition_name(month)}")
+            return
+
+    while True:
+        with pool.cursor() as cursor:
+            cursor.execute("SELECT reaction_id FROM reaction WHERE timestamp < %s LIMIT %s", (month_end, batch_size))
+            reaction_ids = [row[0] for row in cursor.fetchall()]
+            if reaction_ids:
+                cursor.execute(f"DELETE FROM reaction WHERE reaction_id IN ({placeholders(len(reaction_ids))})",
+                               reaction_ids)
+        if len(reaction_ids) < batch_size:
+            return
+
+
+# a pair already there comes from a duplicate reaction stored before reaction_pair
+# (migration 14) kept them out
+ARCHIVE_SEEN_QUERY = """
+INSERT INTO reaction_archive_seen (user_id, post_id)
+SELECT DISTINCT r.user_id, r.post_id
+FROM reaction r
+WHERE r.timestamp < %s
+AND NOT EXISTS (
+    SELECT 1 FROM reaction_archive_seen a WHERE a.user_id = r.user_id AND a.post_id = r.post_id
+)
+"""
+
+
+def archive_month(pool: Any, month: date, target: str = "table") -> int:
+    """Archives the reactions older than the end of the given month.
+
+    Earlier months are archived already, so these are the reactions of the
+    month itself plus any stray older row. The summary, the copy into
+    reaction_archive, the seen pairs and the archive_log entry are committed
+    together, a run interrupted after that only has the deletion left to do.
+
+    Returns:
+        int: number of reactions archived
+    """
+    month_end = next_month(month)
+    with pool.cursor() as cursor:
+        cursor.execute("SELECT row_count FROM archive_log WHERE table_name = 'reaction' AND month = %s", (month,))
+        logged = cursor.fetchone()
+
+    if logged is None:
+        if target == "parquet":
+            write_parquet(pool, month, month_end)
+        with pool.cursor() as cursor:
+            cursor.execute("""
+            INSERT INTO reaction_archive_summary (month, post_id, total_score, reaction_count)
+            SELECT %s, post_id, SUM(reaction_score), COUNT(*)
+            FROM reaction
+            WHERE timestamp < %s
+            GROUP BY post_id
+            """, (month, month_end))
+            if target == "table":
+                cursor.execute(f"INSERT INTO reaction_archive ({REACTION_COLUMNS}) "
+                               f"SELECT {REACTION_COLUMNS} FROM reaction WHERE timestamp < %s", (month_end,))
+            cursor.execute(ARCHIVE_SEEN_QUERY, (month_end,))
+            cursor.execute("SELECT COUNT(*) FROM reaction WHERE timestamp < %s", (month_end,))
+            row_count = cursor.fetchone()[0]
+            cursor.execute("INSERT INTO archive_log (table_name, month, month_end, target, row_count, archived_at) "
+                           "VALUES ('reaction', %s, %s, %s, %s, %s)",
+                           (month, month_end, target, row_count, datetime.now().replace(microsecond=0)))
+    else:
+        row_count = logged[0]
+
+    delete_archived(pool, month, month_end)
+    return row_count
+
+
+def archive_reactions(pool: Any, keep_months: int = ARCHIVE_KEEP_MONTHS,
+                      target: str = "table") -> List[Tuple[date, int]]:
+    """Archives every month of reactions older than the last ``keep_months`` months.
+
+    Args:
+        pool (Any): the connection pool
+        keep_months (int): months kept in the hot table, the current one included
+        target (str): one of ARCHIVE_TARGETS
+
+    Returns:
+        List[Tuple[date, int]]: (month, reactions archived) per month that had reactions
+    """
+    if target not in ARCHIVE_TARGETS:
+        raise ValueError(f"unknown archive target '{target}'")
+
+    cutoff = add_months(month_start(date.today()), -(keep_months - 1))
+    archived = []
+    while True:
+        # the month of the oldest reaction left, months without reactions are skipped and never logged
+        with pool.cursor() as cursor:
+            month = oldest_month(cursor, "reaction")
+        if month is None or month >= cutoff:
+            return archived
+        if archived and month <= archived[-1][0]:
+            raise RuntimeError(f"reactions of {month:%Y-%m} are still there after archiving them")
+        archived.append((month, archive_month(pool, month, target)))
+
+
+def main() -> None:
+    from database import open_pool
+
+    parser = argparse.ArgumentParser(description="Partitioning and archival of the post and reaction tables.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    partition_parser = subparsers.add_parser("partition", help="partition tables by month (MySQL)")
+    partition_parser.add_argument("tables", nargs="*", default=list(PARTITIONED_TABLES))
+    archive_parser = subparsers.add_parser("archive", help="archive the reactions of old months")
+    archive_parser.add_argument("--keep-months", type=int, default=ARCHIVE_KEEP_MONTHS)
+    archive_parser.add_argument("--target", choices=ARCHIVE_TARGETS, default="table")
+    args = parser.parse_args()
+
+    pool = open_pool(size=1)
+    if args.command == "partition":
+        for table in args.tables:
+            if not partition_table(pool, table):
+                print(f" Table '{table}' is partitioned already, {add_partitions(pool, table)} partitions added")
+    else:
+        for month, row_count in archive_reactions(pool, args.keep_months, args.target):
+            print(f" {month:%Y-%m}: {row_count} reactions archived")
+        for table in PARTITIONED_TABLES:
+            add_partitions(pool, table)
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+from functools import lru_cache
+from time import perf_counter
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+import profiler
+
+# storage backend selection, see create_backend()
+DEFAULT_BACKEND = os.environ.get("NEXVERSE_BACKEND", "mysql")
+SQLITE_FOLDER = os.environ.get("NEXVERSE_SQLITE_DIR", ".")
+
+# pragmas applied to every SQLite connection: WAL lets readers run alongside the
+# writer, NORMAL sync is durable across application crashes in WAL mode
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -64000,  # KiB, i.e. 64MB of page cache
+    "mmap_size": 268435456,  # 256MB
+    "busy_timeout": 5000,  # ms to wait for the writer lock
+}
+SQLITE_STATEMENT_CACHE = 256  # prepared statements kept per connection
+
+# SQLite has no date types, DATETIME/DATE columns hold ISO 8601 text that sorts
+# chronologically; the adapters make sure datetimes are always written that way
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" ", timespec="seconds"))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+
+class Cursor:
+    """Wraps a driver cursor so every query goes through the backend's dialect.
+
+    Queries are written once with ``%s`` placeholders and MySQL flavoured DDL,
+    the backend translates them for its driver. While profiling is on, every
+    statement is recorded by profiler.query_profiler under ``name``, by default
+    the module and function running it.
+    """
+
+    def __init__(self, cursor: Any, backend: "Backend"):
+        self._cursor = cursor
+        self.backend = backend
+        self._call: Optional[profiler.Call] = None  # statement being profiled
+
+    def execute(self, query: str, params: Sequence = (), name: Optional[str] = None) -> Any:
+        if profiler.query_profiler is None and self._call is None:
+            return self._cursor.execute(self.backend.translate(query), tuple(params))
+        return self._profile(self._cursor.execute, query, tuple(params), name, many=False)
+
+    def executemany(self, query: str, seq_of_params: Sequence[Sequence], name: Optional[str] = None) -> Any:
+        if profiler.query_profiler is None and self._call is None:
+            return self._cursor.executemany(self.backend.translate(query), seq_of_params)
+        return self._profile(self._cursor.executemany, query, seq_of_params, name, many=True)
+
+    def _profile(self, method: Callable, query: str, params: Any, name: Optional[str], many: bool) -> Any:
+        self._finish_call()
+        query_profiler = profiler.query_profiler
+        if query_profiler is None:
+            return method(self.backend.translate(query), params)
+        stats = query_profiler.statement(query, name)
+        query = self.backend.translate(query)
+        start = perf_counter()
+        try:
+            result = method(query, params)
+        except BaseException:
+            query_profiler.record(stats, perf_counter() - start, 0, failed=True)
+            raise
+        seconds = perf_counter() - start
+        # writes report the rows they changed, queries count the rows fetched
+        rows = max(self._cursor.rowcount, 0) if self._cursor.description is None else 0
+        self._call = query_profiler.start(stats, query, None if many else params, seconds, rows, not many)
+        return result
+
+    def _finish_call(self) -> None:
+        call, self._call = self._call, None
+        if call is not None:
+            call.finish(self._cursor, self.backend)
+
+    def _fetch(self, method: Callable, *args: Any) -> Any:
+        call = self._call
+        if call is None:
+            return method(*args)
+        start = perf_counter()
+        rows = method(*args)
+        call.fetched(len(rows) if isinstance(rows, list) else int(rows is not None), perf_counter() - start)
+        return rows
+
+    def fetchone(self) -> Optional[tuple]:
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size: int = 1) -> List[tuple]:
+        return self._fetch(self._cursor.fetchmany, size)
+
+    def fetchall(self) -> List[tuple]:
+        return self._fetch(self._cursor.fetchall)
+
+    def close(self) -> Any:
+        self._finish_call()
+        return self._cursor.close()
+
+    def __iter__(self) -> Iterator[tuple]:
+        if self._call is None:
+            return iter(self._cursor)
+        return self._iterate(self._call)
+
+    def _iterate(self, call: "profiler.Call") -> Iterator[tuple]:
+        for row in self._cursor:
+            call.rows += 1
+            yield row
+
+    def __getattr__(self, name: str) -> Any:
+        # fetchone, fetchall, fetchmany, description, rowcount, lastrowid, close...
+        return getattr(self._cursor, name)
+
+
+class Backend:
+    """A database engine the connection pool can open connections to."""
+
+    name = ""
+    explain_prefix = "EXPLAIN "  # turns a statement into the query of its plan
+    Error = Exception  # base class of the driver's errors
+    IntegrityError = Exception
+    connection_errors = ()  # errors after which a connection can't be trusted anymore
+
+    def connect(self) -> Any:
+        raise NotImplementedError
+
+    def cursor(self, conn: Any, buffered: bool = True) -> Cursor:
+        raise NotImplementedError
+
+    def check_connection(self, conn: Any) -> Tuple[Any, bool]:
+        """Returns a working connection, conn itself or a new one, and whether it
+        had to reconnect."""
+        return conn, False
+
+    def ensure_database(self) -> None:
+        """Creates the database if it doesn't exist yet."""
+
+    def drop_database(self) -> None:
+        raise NotImplementedError
+
+    def replica(self, address: str) -> "Backend":
+        """Returns a backend on a replica of this database, see replicas.py."""
+        raise NotImplementedError
+
+    def translate(self, query: str) -> str:
+        return query
+
+    def table_exists(self, cursor: Cursor, table: str) -> bool:
+        raise NotImplementedError
+
+    def index_exists(self, cursor: Cursor, table: str, index: str) -> bool:
+        raise NotImplementedError
+
+    def column_type(self, cursor: Cursor, table: str, column: str) -> Optional[str]:
+        """Returns the lower cased type of a column, None if the column doesn't exist."""
+        raise NotImplementedError
+
+    def column_definitions(self, attributes: str) -> str:
+        """Translates the column definitions of a CREATE TABLE statement."""
+        return attributes
+
+    def cast_temporal(self, expression: str, sql_type: str) -> str:
+        """Returns the SQL converting a legacy 'YYYY-MM-DD[ HH:MM]' string to DATETIME or DATE."""
+        raise NotImplementedError
+
+    def drop_index(self, cursor: Cursor, table: str, index: str) -> None:
+        raise NotImplementedError
+
+    def widen_column(self, cursor: Cursor, table: str, column: str, sql_type: str) -> None:
+        """Changes the type of a column to a wider one of the same kind, keeping the data."""
+        raise NotImplementedError
+
+    def duplicate_key(self, error: Exception) -> Optional[str]:
+        """Returns what a duplicate key error is about (index or columns), None for
+        any other error."""
+        return None
+
+    def partitions(self, cursor: Cursor, table: str) -> List[str]:
+        """Returns the partition names of a table in range order, engines without
+        native partitioning have none."""
+        return []
+
+    def compressed_table_options(self) -> str:
+        """Returns the CREATE TABLE options of a compressed table."""
+        return ""
+
+    def upsert_clause(self, key: str, assignments: str) -> str:
+        """Returns the clause turning an INSERT into an update of the row with the same key."""
+        raise NotImplementedError
+
+
+class MySQLBackend(Backend):
+    """MySQL server through mysql-connector-python."""
+
+    name = "mysql"
+
+    def __init__(self, host: str, user: str, passwd: str, database: str, **connect_args: Any):
+        import mysql.connector as sql
+
+        self.sql = sql
+        self.Error = sql.Error
+        self.IntegrityError = sql.errors.IntegrityError
+        self.connection_errors = (sql.errors.OperationalError, sql.errors.InterfaceError)
+        self.database = database
+        self.server_args = dict(host=host, user=user, passwd=passwd, **connect_args)
+
+    def connect(self) -> Any:
+        return self.sql.connect(database=self.database, **self.server_args)
+
+    def cursor(self, conn: Any, buffered: bool = True) -> Cursor:
+        return Cursor(conn.cursor(buffered=buffered), self)
+
+    def check_connection(self, conn: Any) -> Tuple[Any, bool]:
+        try:
+            conn.ping(reconnect=False)
+            return conn, False
+        except self.Error:
+            pass
+        try:
+            conn.reconnect(attempts=3, delay=1)
+            return conn, True
+        except self.Error:
+            return self.connect(), True  # last resort, a brand new connection
+
+    def replica(self, address: str) -> "Backend":
+        # "host[:port]", same credentials and database name as the primary
+        host, _, port = address.partition(":")
+        server_args = dict(self.server_args, host=host)
+        if port:
+            server_args["port"] = int(port)
+        return MySQLBackend(database=self.database, **server_args)
+
+    def ensure_database(self) -> None:
+        db_conn = self.sql.connect(**self.server_args)
+        cursor = db_conn.cursor()
+        # query to check the existance of database
+        cursor.execute("SELECT SCHEMA_NAME FROM information_schema.SCHEMATA WHERE SCHEMA_NAME = %s", (self.database,))
+        result = cursor.fetchone()  # if not found result is None
+
+        if not result:
+            print("Database does not exist!\nRunning creation query...")
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.database}")  # creating database
+            print("Database created successfully...")
+        db_conn.commit()
+        db_conn.close()
+
+    def drop_database(self) -> None:
+        db_conn = self.sql.connect(**self.server_args)
+        db_conn.cursor().execute(f"DROP DATABASE IF EXISTS {self.database}")
+        db_conn.close()
+
+    def table_exists(self, cursor: Cursor, table: str) -> bool:
+        cursor.execute("SHOW TABLES LIKE %s", (table,))
+        return cursor.fetchone() is not None
+
+    def index_exists(self, cursor: Cursor, table: str, index: str) -> bool:
+        cursor.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (index,))
+        return bool(cursor.fetchall())
+
+    def column_type(self, cursor: Cursor, table: str, column: str) -> Optional[str]:
+        cursor.execute("SELECT DATA_TYPE FROM information_schema.COLUMNS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s", (table, column))
+        row = cursor.fetchone()
+        return row[0].lower() if row else None
+
+    def cast_temporal(self, expression: str, sql_type: str) -> str:
+        return f"CAST(NULLIF({expression}, '') AS {sql_type})"
+
+    def drop_index(self, cursor: Cursor, table: str, index: str) -> None:
+        cursor.execute(f"DROP INDEX {index} ON {table}")
+
+    def widen_column(self, cursor: Cursor, table: str, column: str, sql_type: str) -> None:
+        cursor.execute(f"ALTER TABLE {table} MODIFY COLUMN {column} {sql_type}")
+
+    def duplicate_key(self, error: Exception) -> Optional[str]:
+        # 1062: Duplicate entry 'bob' for key 'account.uq_account_username'
+        if isinstance(error, self.IntegrityError) and getattr(error, "errno", None) == 1062:
+            return str(error).rpartition(" for key ")[2].strip("'")
+        return None
+
+    def partitions(self, cursor: Cursor, table: str) -> List[str]:
+        cursor.execute("SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+                       "ORDER BY PARTITION_ORDINAL_POSITION", (table,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def compressed_table_options(self) -> str:
+        return "ROW_FORMAT=COMPRESSED"
+
+    def upsert_clause(self, key: str, assignments: str) -> str:
+        return f"ON DUPLICATE KEY UPDATE {assignments}"
+
+
+class SQLiteBackend(Backend):
+    """Embedded SQLite database file, the whole application runs in-process.
+
+    Connections use WAL mode and the pragmas of SQLITE_PRAGMAS. sqlite3 keeps
+    the compiled statements of every connection in a cache, so the fixed query
+    strings of the application are prepared only once per connection.
+    """
+
+    name = "sqlite"
+    explain_prefix = "EXPLAIN QUERY PLAN "
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+    connection_errors = (sqlite3.InterfaceError,)
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def connect(self) -> Any:
+        # pooled connections move between threads, the pool guarantees exclusive use
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        for pragma, value in SQLITE_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def cursor(self, conn: Any, buffered: bool = True) -> Cursor:
+        # rows are always read lazily by sqlite3, there is no separate unbuffered mode
+        return Cursor(conn.cursor(), self)
+
+    def replica(self, address: str) -> "Backend":
+        # another database file of the same folder, nothing replicates to it by itself
+        return SQLiteBackend(os.path.join(os.path.dirname(self.path), f"{address}.db"))
+
+    def ensure_database(self) -> None:
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def drop_database(self) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def translate(self, query: str) -> str:
+        return sqlite_query(query)
+
+    def table_exists(self, cursor: Cursor, table: str) -> bool:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s", (table,))
+        return cursor.fetchone() is not None
+
+    def index_exists(self, cursor: Cursor, table: str, index: str) -> bool:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+                       (table, index))
+        return cursor.fetchone() is not None
+
+    def column_type(self, cursor: Cursor, table: str, column: str) -> Optional[str]:
+        cursor.execute(f"PRAGMA table_info({table})")
+        for _, name, column_type, *_ in cursor.fetchall():
+            if name == column:
+                return column_type.lower()
+        return None
+
+    def column_definitions(self, attributes: str) -> str:
+        attributes = re.sub(r"INT\(\d+\) AUTO_INCREMENT PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT", attributes)
+        # text is UTF-8 and compared byte for byte (BINARY) already
+        attributes = re.sub(r" CHARACTER SET \w+| COLLATE \w+", "", attributes)
+        return re.sub(r"INT\(\d+\)", "INTEGER", attributes)
+
+    def cast_temporal(self, expression: str, sql_type: str) -> str:
+        # datetime() and date() normalise the text to the format the adapters write
+        function = "date" if sql_type.upper() == "DATE" else "datetime"
+        return f"{function}(NULLIF({expression}, ''))"
+
+    def drop_index(self, cursor: Cursor, table: str, index: str) -> None:
+        cursor.execute(f"DROP INDEX {index}")
+
+    def widen_column(self, cursor: Cursor, table: str, column: str, sql_type: str) -> None:
+        pass  # SQLite doesn't enforce VARCHAR lengths
+
+    def duplicate_key(self, error: Exception) -> Optional[str]:
+        # UNIQUE constraint failed: account.username
+        message = str(error)
+        if isinstance(error, sqlite3.IntegrityError) and message.startswith("UNIQUE constraint failed: "):
+            return message[len("UNIQUE constraint failed: "):]
+        return None
+
+    def upsert_clause(self, key: str, assignments: str) -> str:
+        return f"ON CONFLICT({key}) DO UPDATE SET {assignments}"
+
+
+@lru_cache(maxsize=1024)
+def sqlite_query(query: str) -> str:
+    """Swaps the %s placeholders for sqlite3's ?."""
+    return query.replace("%s", "?")
+
+
+def create_backend(name: Optional[str] = None, database: str = "", **mysql_args: Any) -> Backend:
+    """Returns the backend selected by name or by the NEXVERSE_BACKEND variable.
+
+    For SQLite the database is the file ``<database>.db`` in NEXVERSE_SQLITE_DIR.
+    """
+    name = name or DEFAULT_BACKEND
+    if name == "mysql":
+        return MySQLBackend(database=database, **mysql_args)
+    if name == "sqlite":
+        return SQLiteBackend(os.path.join(SQLITE_FOLDER, f"{database}.db"))
+    raise ValueError(f"unknown backend '{name}'")
+
+
+def database_errors() -> tuple:
+    """Returns the base error classes of every available driver."""
+    errors = [sqlite3.Error]
+    try:
+        import mysql.connector as sql
+        errors.append(sql.Error)
+    except ImportError:
+        pass
+    return tuple(errors)
@@ -0,0 +1,85 @@
+"""Feed latency against post count.
+
+Fills a scratch database with N posts (the benchmark user has already reacted to
+half of them) and times the legacy one-lookup-per-post feed against the
+anti-join/keyset feed from ``feed.py``.
+
+Run from the project root:
+
+    python -m benchmarks.feed_latency --sizes 1000 10000 100000
+"""
+import argparse
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from utils import DATABASE
+from migrations import migrate
+from database import open_pool
+from feed import fetch_unseen_page, iter_unseen_posts
+
+BENCH_USER_ID = 2
+
+
+def populate(cursor, n_posts):
+    cursor.execute("DELETE FROM post")
+    cursor.execute("DELETE FROM reaction")
+    start = datetime(2024, 1, 1)
+    posts = [
+        (1, f"benchmark post {i}", "technology", start + timedelta(minutes=i))
+        for i in range(n_posts)
+    ]
+    cursor.executemany("INSERT INTO post (user_id, content, category, timestamp) VALUES (%s, %s, %s, %s)", posts)
+    cursor.execute("SELECT post_id FROM post ORDER BY post_id")
+    post_ids = [row[0] for row in cursor.fetchall()]
+    reactions = [(post_id, BENCH_USER_ID, 3, start) for post_id in post_ids[::2]]
+    cursor.executemany("INSERT INTO reaction (post_id, user_id, reaction_score, timestamp) VALUES (%s, %s, %s, %s)", reactions)
+
+
+def legacy_feed(cursor, user_id):
+    cursor.execute("SELECT post_id, content, timestamp FROM post ORDER BY timestamp DESC")
+    unseen = []
+    for post in cursor.fetchall():
+        cursor.execute("SELECT reaction_id FROM reaction WHERE post_id = %s AND user_id = %s", (post[0], user_id))
+        if not cursor.fetchone():
+            unseen.append(post)
+    return unseen
+
+
+def timed(func, *args):
+    start = perf_counter()
+    result = func(*args)
+    return perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--database", default=f"{DATABASE}_bench", help="scratch database, dropped data!")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], help="NEXVERSE_BACKEND if not given")
+    parser.add_argument("--skip-legacy-above", type=int, default=100000,
+                        help="don't run the N+1 feed for larger tables")
+    args = parser.parse_args()
+
+    pool = open_pool(args.database, size=1, backend=args.backend)
+    migrate(pool)
+
+    print(f"{'posts':>10} {'legacy full':>12} {'first page':>12} {'full drain':>12}")
+    for size in args.sizes:
+        with pool.cursor() as cursor:
+            populate(cursor, size)
+
+        with pool.cursor() as cursor:
+            legacy = "skipped"
+            if size <= args.skip_legacy_above:
+                elapsed, unseen = timed(legacy_feed, cursor, BENCH_USER_ID)
+                legacy = f"{elapsed * 1000:.1f}ms"
+            first_page, _ = timed(fetch_unseen_page, cursor, BENCH_USER_ID)
+        drain, unseen = timed(lambda: list(iter_unseen_posts(pool, BENCH_USER_ID)))
+        assert len(unseen) == size // 2, len(unseen)
+        print(f"{size:>10} {legacy:>12} {first_page * 1000:>10.1f}ms {drain * 1000:>10.1f}ms")
+
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Password verifications per second at the configured cost parameters.
+
+Times ``passwords.check_passwd`` on one core for each algorithm, then the
+throughput of the verification pool with concurrent callers, as the session
+server runs logins. No database is needed.
+
+Run from the project root:
+
+    python -m benchmarks.password_hashing --workers 1 2 4 --seconds 5
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import passwords
+from passwords import Verifier, check_passwd, current_params, get_legacy_passwd_hash, get_passwd_hash
+
+PASSWORD = "Benchmark#2024"
+
+
+def per_core(stored, seconds):
+    """Returns verifications per second in this process."""
+    count, start = 0, perf_counter()
+    while perf_counter() - start < seconds:
+        assert check_passwd(PASSWORD, stored)
+        count += 1
+    return count / (perf_counter() - start)
+
+
+def pooled(stored, workers, seconds):
+    """Returns verifications per second through a Verifier with as many callers as it queues."""
+    verifier = Verifier(workers)
+    verifier.verify(PASSWORD, stored)  # starts the processes
+    callers = max(workers, 1) * passwords.VERIFY_QUEUE
+    deadline = perf_counter() + seconds
+
+    def caller():
+        count = 0
+        while perf_counter() < deadline:
+            verifier.verify(PASSWORD, stored)
+            count += 1
+        return count
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as threads:
+        total = sum(threads.map(lambda _: caller(), range(callers)))
+    elapsed = perf_counter() - start
+    verifier.close()
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="verification pool sizes to time")
+    parser.add_argument("--seconds", type=float, default=3.0, help="per measurement")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, current algorithm {passwords.ALGORITHM} {current_params()}")
+    hashes = {"sha256 (legacy)": get_legacy_passwd_hash(PASSWORD)}
+    if hasattr(passwords.hashlib, "scrypt"):
+        hashes["scrypt"] = get_passwd_hash(PASSWORD, "scrypt")
+    hashes["pbkdf2_sha256"] = get_passwd_hash(PASSWORD, "pbkdf2_sha256")
+
+    print(f"\n{'algorithm':<18}{'logins/s/core':>15}{'ms/login':>10}")
+    for name, stored in hashes.items():
+        rate = per_core(stored, args.seconds)
+        print(f"{name:<18}{rate:>15.1f}{1000 / rate:>10.2f}")
+
+    stored = get_passwd_hash(PASSWORD)
+    print(f"\n{'pool workers':<18}{'logins/s':>15}{'per worker':>12}")
+    for workers in args.workers:
+        rate = pooled(stored, workers, args.seconds)
+        print(f"{workers:<18}{rate:>15.1f}{rate / workers:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
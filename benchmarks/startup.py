@@ -0,0 +1,98 @@
+"""Startup time of the terminal UI.
+
+Imports main.py in fresh interpreters under ``-X importtime`` and reports the
+median import time, the slowest modules it pulls in and which of the heavy
+libraries got loaded. With --bootstrap the time open_client() takes to open
+the database, check the schema and the admin account is measured as well,
+against the configured database.
+
+Run from the project root:
+
+    python -m benchmarks.startup --runs 10 --bootstrap
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+MODULE = "main"
+# libraries main.py must not import until a menu entry needs them
+HEAVY_MODULES = ("numpy", "pandas", "matplotlib", "xlsxwriter", "sqlalchemy", "multiprocessing")
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+LOADED_SCRIPT = f"""
+import sys
+import {MODULE}
+print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+BOOTSTRAP_SCRIPT = f"""
+from time import perf_counter
+import {MODULE}
+start = perf_counter()
+client = {MODULE}.open_client()
+seconds = perf_counter() - start
+client.close()
+print(seconds)
+"""
+
+
+def python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True)
+
+
+def import_times() -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """Imports the module in a fresh interpreter.
+
+    Returns:
+        Tuple[float, Dict[str, Tuple[int, int]]]: milliseconds the import took and the
+            (self, cumulative) microseconds of every module it imported
+    """
+    modules = {}
+    for line in python("-X", "importtime", "-c", f"import {MODULE}").stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules[MODULE][1] / 1000, modules
+
+
+def bootstrap_time() -> float:
+    """Returns the seconds open_client() took in a fresh interpreter."""
+    return float(python("-c", BOOTSTRAP_SCRIPT).stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules listed")
+    parser.add_argument("--bootstrap", action="store_true", help="also time open_client() on the configured database")
+    args = parser.parse_args()
+
+    totals: List[float] = []
+    cumulative: Dict[str, List[int]] = {}
+    for _ in range(args.runs):
+        total, modules = import_times()
+        totals.append(total)
+        for name, (_, micros) in modules.items():
+            cumulative.setdefault(name, []).append(micros)
+
+    print(f"import {MODULE}: median {statistics.median(totals):.1f}ms, "
+          f"min {min(totals):.1f}ms over {args.runs} runs")
+    slowest = sorted(((statistics.median(micros), name) for name, micros in cumulative.items() if name != MODULE),
+                     reverse=True)[:args.top]
+    print(f"\n{'module':<40}{'cumulative ms':>15}")
+    for micros, name in slowest:
+        print(f"{name:<40}{micros / 1000:>15.1f}")
+
+    loaded = python("-c", LOADED_SCRIPT).stdout.strip()
+    print(f"\nheavy modules loaded at import: {loaded or 'none'}")
+
+    if args.bootstrap:
+        seconds = [bootstrap_time() for _ in range(args.runs)]
+        print(f"open_client(): median {statistics.median(seconds) * 1000:.1f}ms, "
+              f"min {min(seconds) * 1000:.1f}ms over {args.runs} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Benchmark harness for the NexVerse data-access functions.
+
+Times the feed, the admin view, the category scores, the rollup rebuild and the
+table exports against a throwaway MySQL database or SQLite file, and saves the
+results as JSON so runs can be compared with each other.
+
+Run from the project root:
+
+    python -m benchmarks.suite --database nexverse_bench --generate small --label baseline
+    python -m benchmarks.suite --backend sqlite --generate small --label sqlite
+    python -m benchmarks.suite --database nexverse_bench --label indexed --compare benchmarks/results/baseline-....json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+from datetime import datetime
+from itertools import islice
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from utils import ADMIN_PASSWD
+from database import ConnectionPool, open_pool
+from services import check_admin_exists
+from migrations import migrate
+from datagen import SIZES, Dataset, load_dataset
+from feed import fetch_admin_page, fetch_unseen_page, iter_unseen_posts
+from charts import export_category_scores, fetch_category_scores
+from rollups import rebuild_rollups
+from search import search_posts
+from ranking import CATEGORY_ORDER, Candidates, fetch_ranked_page, score_candidates, top_k
+import exporter
+import profiler
+
+RESULTS_FOLDER = os.path.join("benchmarks", "results")
+SAMPLE_USERS = 20  # users whose feed is timed, user ids 2..21
+
+
+def open_scratch_pool(database: str, reset: bool = False, backend: str = None) -> ConnectionPool:
+    """Returns a pool on a scratch database with the schema and the admin account.
+
+    With ``reset`` the database is dropped first, never point this at real data.
+    """
+    pool = open_pool(database, size=2, backend=backend, replicas=())  # the scratch database has none
+    if reset:
+        # connections are opened lazily, none exists yet
+        pool.backend.drop_database()
+        pool.backend.ensure_database()
+    migrate(pool)
+    with pool.cursor() as cursor:
+        check_admin_exists(cursor, ADMIN_PASSWD)
+    return pool
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Runs func ``repeat`` times, returns its timing statistics in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        samples.append((perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "runs": repeat,
+        "min_ms": samples[0],
+        "median_ms": statistics.median(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "mean_ms": statistics.fmean(samples),
+    }
+
+
+def with_cursor(pool: ConnectionPool, func: Callable, *args: Any, **kwargs: Any) -> Callable[[], Any]:
+    def run():
+        with pool.cursor() as cursor:
+            return func(cursor, *args, **kwargs)
+    return run
+
+
+def synthetic_candidates(size: int, seed: int = 0) -> Candidates:
+    """Candidate arrays of the ranked feed without a database, to time the scoring alone."""
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(0, 50, size).astype(np.float64)
+    return Candidates(np.arange(size, dtype=np.int64), rng.integers(0, len(CATEGORY_ORDER), size),
+                      rng.uniform(1.7e9, 1.73e9, size), counts * rng.uniform(1, 5, size), counts)
+
+
+def rank_synthetic(candidates: Candidates, affinity: np.ndarray) -> np.ndarray:
+    return top_k(score_candidates(candidates, affinity, 1.73e9), 20)
+
+
+def benchmarks(pool: ConnectionPool) -> Dict[str, Callable[[], Any]]:
+    """Returns the named benchmark callables."""
+    users = iter(range(2, 2 + SAMPLE_USERS))
+
+    def next_user():
+        nonlocal users
+        user_id = next(users, None)
+        if user_id is None:
+            users = iter(range(2, 2 + SAMPLE_USERS))
+            user_id = next(users)
+        return user_id
+
+    candidates, affinity = synthetic_candidates(100_000), np.linspace(-1, 1, len(CATEGORY_ORDER))
+    cases = {
+        "feed.first_page": lambda: with_cursor(pool, fetch_unseen_page, next_user())(),
+        "feed.first_1000": lambda: list(islice(iter_unseen_posts(pool, next_user()), 1000)),
+        "feed.ranked_page": lambda: with_cursor(pool, fetch_ranked_page, next_user())(),
+        "ranking.score_100k": lambda: rank_synthetic(candidates, affinity),
+        "admin.first_page": with_cursor(pool, fetch_admin_page),
+        "admin.category_page": with_cursor(pool, fetch_admin_page, category="food"),
+        "admin.date_range_page": with_cursor(pool, fetch_admin_page, since="2024-06-01", until="2024-07-01"),
+        "search.first_page": with_cursor(pool, search_posts, "technology"),
+        "search.category_page": with_cursor(pool, search_posts, "synthetic post", category="food"),
+        "analytics.category_scores": lambda: fetch_category_scores(pool),
+        "charts.category_scores": lambda: export_category_scores(fetch_category_scores(pool)),
+        "rollups.rebuild": lambda: rebuild_rollups(pool),
+    }
+    for table in exporter.EXPORT_TABLES:
+        cases[f"export.{table}"] = lambda table=table: exporter.export_app_data(pool, table, "csv.gz")
+    return cases
+
+
+def table_sizes(pool: ConnectionPool) -> Dict[str, int]:
+    sizes = {}
+    with pool.cursor() as cursor:
+        for table in exporter.EXPORT_TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            sizes[table] = cursor.fetchone()[0]
+    return sizes
+
+
+def run_suite(pool: ConnectionPool, repeat: int, only: List[str] = None) -> Dict[str, Dict[str, float]]:
+    results = {}
+    data_folder = exporter.DATA_FOLDER
+    with tempfile.TemporaryDirectory() as scratch:
+        exporter.DATA_FOLDER = scratch  # keep the benchmark exports out of Data/
+        try:
+            for name, func in benchmarks(pool).items():
+                if only and not any(name.startswith(prefix) for prefix in only):
+                    continue
+                # exports and rebuilds are slow, a few runs are enough
+                runs = max(1, repeat // 5) if name.startswith(("export.", "rollups.")) else repeat
+                results[name] = measure(func, runs)
+                print(f" {name:<28} median {results[name]['median_ms']:10.2f}ms   "
+                      f"p95 {results[name]['p95_ms']:10.2f}ms")
+        finally:
+            exporter.DATA_FOLDER = data_folder
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+    print(f"\n {'benchmark':<28} {'baseline':>12} {'now':>12} {'speedup':>8}")
+    for name, result in results.items():
+        if name in baseline:
+            before, now = baseline[name]["median_ms"], result["median_ms"]
+            print(f" {name:<28} {before:10.2f}ms {now:10.2f}ms {before / now if now else 0:7.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Time the data-access functions against a scratch database.")
+    parser.add_argument("--database", default="nexverse_bench", help="scratch database, dropped by --generate!")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], help="NEXVERSE_BACKEND if not given")
+    parser.add_argument("--generate", choices=list(SIZES), help="(re)generate a dataset of this size first")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", nargs="*", help="only run the benchmarks starting with these prefixes")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--compare", help="results JSON of an earlier run")
+    parser.add_argument("--profile", action="store_true",
+                        help="record every statement, print the costliest and save them next to the results")
+    args = parser.parse_args()
+
+    pool = open_scratch_pool(args.database, reset=bool(args.generate), backend=args.backend)
+    if args.generate:
+        print(f" Generating the '{args.generate}' dataset...")
+        load_dataset(pool, Dataset(SIZES[args.generate], seed=args.seed))
+
+    sizes = table_sizes(pool)
+    print(" " + ", ".join(f"{table}: {count}" for table, count in sizes.items()) + "\n")
+    if args.profile:
+        profiler.enable_profiling()
+    results = run_suite(pool, args.repeat, args.only)
+    pool.close()
+
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    created = datetime.now()
+    path = os.path.join(RESULTS_FOLDER, f"{args.label}-{created.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({
+            "label": args.label,
+            "created": created.isoformat(timespec="seconds"),
+            "dataset": {"size": args.generate, "seed": args.seed, "rows": sizes},
+            "backend": pool.backend.name,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }, file, indent=2)
+    print(f"\n Results saved to {path}")
+
+    if args.profile:
+        metrics = profiler.query_profiler.to_json()
+        with open(path[:-len(".json")] + "-statements.json", "w", encoding="utf-8") as file:
+            json.dump(metrics, file, indent=2)
+        print()
+        profiler.print_statements(metrics["statements"])
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
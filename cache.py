@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+MISSING = object()  # returned by TTLCache.get() for keys that aren't cached
+
+
+class TTLCache:
+    """A thread safe in-memory cache with per entry expiry and LRU eviction.
+
+    Entries live for ``ttl`` seconds (or the ttl given to ``set``). Once
+    ``maxsize`` entries are stored, the least recently used one is evicted.
+    None is a valid cached value, a miss is reported with MISSING.
+
+    Args:
+        maxsize (int): maximum number of entries
+        ttl (float): default seconds an entry stays valid
+        clock (Callable[[], float]): time source, monotonic seconds
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = monotonic):
+        if maxsize < 1:
+            raise ValueError("cache size must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()  # key: (expiry, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Returns the cached value of key, MISSING if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expiry, value = entry
+                if expiry > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return MISSING
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Returns the cached value of key, calling loader and caching its result on a miss."""
+        value = self.get(key)
+        if value is MISSING:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Drops every entry whose key matches the predicate."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,180 @@
+"""Headless chart rendering for the exports.
+
+Charts are drawn with matplotlib's object-oriented API on the Agg backend, no
+pyplot state machine is involved: a ChartRenderer owns a single Figure, clears
+it between charts and releases it when closed, so repeated scheduled exports
+don't accumulate figures. ``render_charts`` draws any set of CHARTS in one
+pass, in every requested format, and returns the time spent on each chart.
+
+    python charts.py --charts bar timeseries --formats png svg
+"""
+import argparse
+from datetime import datetime
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import matplotlib
+
+matplotlib.use("Agg")  # never open a window, even if pyplot gets imported later
+
+import pandas as pd
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from exporter import data_path
+
+CHART_FORMATS = ("png", "svg")
+CHART_SIZE = (10, 6)  # inches
+
+# DATA ==================================================================================
+
+def fetch_category_scores(pool: Any) -> pd.DataFrame:
+    # read from the rollup kept current by the reaction write path, see rollups.py
+    query = """
+    SELECT category, total_score
+    FROM category_score
+    WHERE reaction_count > 0
+    ORDER BY total_score DESC
+    """
+    with pool.cursor(readonly=True) as cursor:
+        cursor.execute(query)
+        df = pd.DataFrame(cursor.fetchall(), columns=["category", "total_score"])
+    return df
+
+
+def fetch_daily_activity(pool: Any) -> pd.DataFrame:
+    """Posts, reactions and average score per day, from the refreshed analytics snapshot."""
+    from analytics import daily_activity, load_snapshot, refresh_snapshot
+
+    refresh_snapshot(pool)
+    return daily_activity(load_snapshot())
+
+
+# data set name: function of the pool returning it
+CHART_DATA: Dict[str, Callable[[Any], pd.DataFrame]] = {
+    "category_scores": fetch_category_scores,
+    "daily_activity": fetch_daily_activity,
+}
+
+
+def fetch_chart_data(pool: Any, charts: Optional[Sequence[str]] = None) -> Dict[str, pd.DataFrame]:
+    """Fetches the data sets the charts (all if None) are drawn from, each one once."""
+    needed = dict.fromkeys(CHARTS[chart][1] for chart in (charts or CHARTS))
+    return {name: CHART_DATA[name](pool) for name in needed}
+
+
+# DATA VISUALIZATION ====================================================================
+
+def render_category_bar(ax: Axes, df: pd.DataFrame) -> None:
+    ax.bar(df['category'], df['total_score'])
+    ax.set_xlabel('Category')
+    ax.set_ylabel('Total Score')
+    ax.set_title('Top Categories by Reaction Score')
+    ax.tick_params(axis='x', labelrotation=45)
+
+
+def render_category_pie(ax: Axes, df: pd.DataFrame) -> None:
+    ax.pie(df['total_score'], labels=df['category'], autopct='%1.1f%%')
+    ax.set_title('Top Categories by Reaction Score')
+
+
+def render_daily_activity(ax: Axes, df: pd.DataFrame) -> None:
+    days = df.set_index('day')
+    if len(days):
+        days = days.asfreq('D', fill_value=0)  # days without activity are missing from the report
+    ax.plot(days.index, days['reactions'], label='Reactions')
+    ax.plot(days.index, days['posts'], label='Posts')
+    ax.set_xlabel('Day')
+    ax.set_ylabel('Count')
+    ax.set_title('Daily Activity')
+    ax.legend()
+    ax.figure.autofmt_xdate()
+
+
+# chart name: (renderer, data set from CHART_DATA); every renderer draws df on the axes
+CHARTS = {
+    "bar": (render_category_bar, "category_scores"),
+    "pie": (render_category_pie, "category_scores"),
+    "timeseries": (render_daily_activity, "daily_activity"),
+}
+
+
+def chart_path(chart: str, fmt: str = "png") -> str:
+    today = datetime.now().strftime('%d%m%Y')  # DDMMYYYY
+    prefix = "cat-score" if CHARTS[chart][1] == "category_scores" else "activity"
+    return data_path(f"{prefix}-{chart}-{today}.{fmt}")
+
+
+class ChartRenderer:
+    """Draws charts one after another on a single reused figure.
+
+    Use it as a context manager, or call close() when done.
+    """
+
+    def __init__(self, size: Sequence[float] = CHART_SIZE):
+        self.figure = Figure(figsize=size)
+        FigureCanvasAgg(self.figure)  # attaches itself to the figure
+
+    def render(self, chart: str, df: pd.DataFrame, formats: Sequence[str] = ("png",)) -> float:
+        """Draws a chart and saves it in each format, returns the seconds it took."""
+        start = perf_counter()
+        self.figure.clear()
+        CHARTS[chart][0](self.figure.add_subplot(), df)
+        for fmt in formats:
+            self.figure.savefig(chart_path(chart, fmt), format=fmt)
+        return perf_counter() - start
+
+    def close(self) -> None:
+        self.figure.clear()
+        self.figure = None
+
+    def __enter__(self) -> "ChartRenderer":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def render_charts(data: Dict[str, pd.DataFrame], charts: Optional[Sequence[str]] = None,
+                  formats: Sequence[str] = ("png",)) -> Dict[str, float]:
+    """Renders the charts in one pass over a single figure.
+
+    Args:
+        data (Dict[str, pd.DataFrame]): the data sets, see fetch_chart_data
+        charts (Optional[Sequence[str]]): names from CHARTS, all if None
+        formats (Sequence[str]): any of CHART_FORMATS, each chart is saved once per format
+
+    Returns:
+        Dict[str, float]: seconds spent per chart
+    """
+    unknown = set(charts or ()) - set(CHARTS) | set(formats) - set(CHART_FORMATS)
+    if unknown:
+        raise ValueError(f"unknown charts or formats: {', '.join(sorted(unknown))}")
+    with ChartRenderer() as renderer:
+        return {chart: renderer.render(chart, data[CHARTS[chart][1]], formats) for chart in (charts or CHARTS)}
+
+
+def export_category_scores(df: pd.DataFrame, formats: Sequence[str] = ("png",)) -> Dict[str, float]:
+    """Renders every category score chart in this process, returns the seconds per chart."""
+    charts = [chart for chart, (_, data) in CHARTS.items() if data == "category_scores"]
+    return render_charts({"category_scores": df}, charts, formats)
+
+
+def main() -> None:
+    from database import open_pool
+
+    parser = argparse.ArgumentParser(description="Render the export charts into the data folder.")
+    parser.add_argument("--charts", nargs="+", choices=list(CHARTS), help="all if not given")
+    parser.add_argument("--formats", nargs="+", choices=CHART_FORMATS, default=["png"])
+    args = parser.parse_args()
+
+    pool = open_pool(size=1)
+    data = fetch_chart_data(pool, args.charts)
+    pool.close()
+    for chart, seconds in render_charts(data, args.charts, args.formats).items():
+        print(f" {chart:<12}{seconds * 1000:>9.1f} ms  {', '.join(chart_path(chart, fmt) for fmt in args.formats)}")
+
+
+if __name__ == "__main__":
+    main()
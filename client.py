@@ -0,0 +1,91 @@
+"""Clients of the NexVerse session protocol, see server.py.
+
+RemoteClient talks to a session server over TCP. LocalClient serves the same
+requests in-process for single-user runs without a server. Its responses go
+through JSON as well, so the terminal UI sees the same data either way.
+"""
+import json
+import os
+import socket
+from typing import Any, Dict, Optional
+
+from services import ServiceError
+
+# "host:port" of the session server, the terminal UI runs in-process if unset
+SERVER_ADDRESS = os.environ.get("NEXVERSE_SERVER", "")
+
+
+class RemoteClient:
+    """A session on a NexVerse session server."""
+
+    def __init__(self, host: str, port: int, timeout: Optional[float] = None):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.file = self.sock.makefile("rwb")
+
+    def call(self, op: str, **args: Any) -> Any:
+        """Sends one request and returns its result.
+
+        Raises:
+            ServiceError: if the server refused the request
+            ConnectionError: if the server closed the session
+        """
+        self.file.write(json.dumps({"op": op, **args}).encode() + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("the session server closed the connection")
+        return unwrap(json.loads(line))
+
+    def close(self) -> None:
+        self.file.close()
+        self.sock.close()
+
+
+class LocalClient:
+    """A session served in-process from a connection pool."""
+
+    def __init__(self, pool: Any):
+        from server import Session
+
+        self.pool = pool
+        self.session = Session(pool)
+
+    def call(self, op: str, **args: Any) -> Any:
+        response = self.session.handle({"op": op, **json.loads(json.dumps(args))})
+        return unwrap(json.loads(json.dumps(response, default=str)))
+
+    def close(self) -> None:
+        from passwords import close_verifier
+        from profiler import write_metrics
+        from services import cache_stats
+
+        close_verifier()
+        stats = self.pool.stats()
+        print(f"({stats['checkouts']} connection checkouts, {stats['wait_total'] * 1000:.1f}ms spent waiting)")
+        for name, stats in cache_stats().items():
+            print(f"({name} cache: {stats['hits']} hits, {stats['misses']} misses)")
+        for path in write_metrics():
+            print(f"(statement metrics written to {path})")
+        self.pool.close()
+
+
+def unwrap(response: Dict[str, Any]) -> Any:
+    if not response["ok"]:
+        raise ServiceError(response["error"])
+    return response["result"]
+
+
+def open_client(address: str = SERVER_ADDRESS) -> Any:
+    """Returns a RemoteClient for a "host:port" address, otherwise a LocalClient
+    on a fresh pool with the schema brought up to date."""
+    if address:
+        host, _, port = address.rpartition(":")
+        return RemoteClient(host or "127.0.0.1", int(port))
+
+    from utils import ADMIN_PASSWD
+    from database import open_pool
+    from services import prepare_database
+
+    pool = open_pool()
+    prepare_database(pool, ADMIN_PASSWD)
+    return LocalClient(pool)
@@ -0,0 +1,220 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from time import monotonic, perf_counter
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+from backends import Backend, MySQLBackend, create_backend
+
+# pool defaults, the size can be overridden from the environment
+DEFAULT_POOL_SIZE = int(os.environ.get("NEXVERSE_POOL_SIZE", 5))
+# comma separated replicas the readonly queries go to, see replicas.py
+REPLICAS = [address.strip() for address in os.environ.get("NEXVERSE_REPLICAS", "").split(",") if address.strip()]
+DEFAULT_CHECKOUT_TIMEOUT = 30  # seconds to wait for a free connection
+HEALTH_CHECK_INTERVAL = 60  # seconds a connection may sit idle before it is pinged
+
+
+class PoolError(Exception):
+    """Raised when no connection could be checked out of the pool."""
+
+
+class ConnectionPool:
+    """A fixed size pool of database connections shared by every database function.
+
+    Connections are opened lazily up to ``size``, pinged before reuse when they have
+    been idle for longer than ``health_check_interval`` and replaced when they turn
+    out to be broken. Checkout counts and wait times are kept for ``stats()``.
+
+    Args:
+        backend (Optional[Backend]): engine to connect to, MySQL with connect_args if None
+        size (int): maximum number of open connections
+        timeout (float): seconds to wait for a free connection before giving up
+        health_check_interval (float): idle seconds after which a connection is pinged
+        **connect_args: passed to ``MySQLBackend`` when no backend is given
+    """
+
+    def __init__(self, backend: Optional[Backend] = None, size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_CHECKOUT_TIMEOUT,
+                 health_check_interval: float = HEALTH_CHECK_INTERVAL, **connect_args: Any):
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        self.backend = backend or MySQLBackend(**connect_args)
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = queue.LifoQueue()  # (connection, last used) - most recent first
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+        self.schema_version: Optional[int] = None  # cached by migrations.current_version()
+
+        # statistics
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._reconnects = 0
+        self._discarded = 0
+
+    def _connect(self) -> Any:
+        return self.backend.connect()
+
+    def _discard(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except self.backend.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+            self._discarded += 1
+
+    def _check_health(self, conn: Any, last_used: float) -> Any:
+        """Pings connections that were idle for too long, reconnecting dead ones."""
+        if monotonic() - last_used < self.health_check_interval:
+            return conn
+        conn, reconnected = self.backend.check_connection(conn)
+        if reconnected:
+            with self._lock:
+                self._reconnects += 1
+        return conn
+
+    def acquire(self) -> Any:
+        """Checks a connection out of the pool, blocking while all are in use."""
+        start = perf_counter()
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn, last_used = self._connect(), monotonic()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                try:
+                    conn, last_used = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolError(f"no free connection after {self.timeout}s (pool size {self.size})")
+
+        try:
+            conn = self._check_health(conn, last_used)
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+        waited = perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn: Any, broken: bool = False) -> None:
+        """Returns a connection to the pool, closing it instead if it is broken."""
+        if broken or self._closed:
+            self._discard(conn)
+            return
+        self._idle.put((conn, monotonic()))
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Borrows a connection for the duration of the ``with`` block.
+
+        Any transaction left open by a failing block is rolled back; connections
+        that failed with a connection level error are discarded and replaced on
+        the next checkout.
+        """
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except self.backend.connection_errors:
+            broken = True
+            raise
+        except BaseException:
+            try:
+                conn.rollback()
+            except self.backend.Error:
+                broken = True
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    @contextmanager
+    def cursor(self, commit: bool = True, buffered: bool = True, readonly: bool = False) -> Iterator[Any]:
+        """Borrows a connection and yields a cursor on it, committing on success.
+
+        Cursors are buffered by default so a ``fetchone()`` never leaves unread
+        rows behind on a connection that goes back to the pool. ``readonly`` marks
+        reads that may be served by a replica, a single pool serves them itself
+        (see replicas.ReplicaRouter).
+        """
+        with self.connection() as conn:
+            cursor = self.backend.cursor(conn, buffered=buffered)
+            try:
+                yield cursor
+            finally:
+                cursor.close()  # before the commit, a profiled statement is explained in its transaction
+            if commit:
+                conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns checkout counts and wait times of the pool."""
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._opened,
+                "idle": self._idle.qsize(),
+                "checkouts": self._checkouts,
+                "wait_total": self._wait_total,
+                "wait_avg": self._wait_total / self._checkouts if self._checkouts else 0.0,
+                "wait_max": self._wait_max,
+                "reconnects": self._reconnects,
+                "discarded": self._discarded,
+            }
+
+    def close(self) -> None:
+        """Closes every idle connection, connections in use are closed on release."""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+def open_pool(database: Optional[str] = None, size: int = DEFAULT_POOL_SIZE,
+              backend: Optional[str] = None, replicas: Optional[Sequence[str]] = None) -> Any:
+    """Returns a pool on the configured database, creating the database if needed.
+
+    With replicas the pool is a replicas.ReplicaRouter with the same interface,
+    holding one pool of ``size`` connections per server.
+
+    Args:
+        database (Optional[str]): database name, DATABASE from utils if None
+        size (int): maximum number of open connections
+        backend (Optional[str]): "mysql" or "sqlite", NEXVERSE_BACKEND if None
+        replicas (Optional[Sequence[str]]): replica addresses, REPLICAS if None
+    """
+    from utils import HOST, USER, PASSWD, DATABASE
+
+    engine = create_backend(backend, database=database or DATABASE, host=HOST, user=USER, passwd=PASSWD)
+    engine.ensure_database()
+    pool = ConnectionPool(engine, size=size)
+    replicas = REPLICAS if replicas is None else replicas
+    if not replicas:
+        return pool
+
+    from replicas import ReplicaRouter
+
+    router = ReplicaRouter(pool, {address: ConnectionPool(engine.replica(address), size=size) for address in replicas})
+    router.start()
+    return router
@@ -0,0 +1,269 @@
+"""Deterministic synthetic datasets for the NexVerse schema.
+
+The same seed always yields the same accounts, posts and reactions:
+
+- post authorship follows a Zipf distribution, a few users write most posts
+- reaction counts per post are Zipf skewed as well, every reaction comes from
+  a different user
+- posts are spread over all nine categories, with a skew towards some of them
+- timestamps cover ``--days`` days from 2024-01-01, reactions come after their post
+
+Datasets are either loaded straight into a throwaway database or written as
+csv files that ``ingest.py`` can load.
+
+    python datagen.py --size small --database nexverse_bench
+    python datagen.py --size medium --out Data/dataset
+"""
+import argparse
+import csv
+import os
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from passwords import get_passwd_hash
+from validators import CATEGORY_NAMES, REACTION_SCORES
+
+# total rows (accounts + posts + reactions) of each preset
+SIZES = {
+    "tiny": 10_000,
+    "small": 100_000,
+    "medium": 1_000_000,
+    "large": 10_000_000,
+    "xlarge": 50_000_000,
+}
+# share of the rows going to each table
+ACCOUNT_SHARE, POST_SHARE = 0.01, 0.09
+
+ZIPF_EXPONENT = 1.2
+CATEGORY_WEIGHTS = [0.18, 0.14, 0.16, 0.12, 0.1, 0.1, 0.08, 0.07, 0.05]
+SCORE_WEIGHTS = [0.08, 0.12, 0.3, 0.32, 0.18]  # reaction_score 1..5
+CHUNK_SIZE = 100_000
+EPOCH = datetime(2024, 1, 1)
+
+
+class Dataset:
+    """Shape of a dataset, derived from its total row count and seed.
+
+    Generated accounts get the user ids ``first_user_id .. first_user_id + accounts - 1``
+    (user id 1 is the admin created at startup) and posts the ids ``1 .. posts``.
+    """
+
+    def __init__(self, rows: int, seed: int = 42, days: int = 365, first_user_id: int = 2):
+        self.rows = rows
+        self.seed = seed
+        self.days = days
+        self.first_user_id = first_user_id
+        self.accounts = max(10, int(rows * ACCOUNT_SHARE))
+        self.posts = max(10, int(rows * POST_SHARE))
+        self.reactions = max(0, rows - self.accounts - self.posts)
+
+    def rng(self, stream: int) -> np.random.Generator:
+        # one independent stream per table, so the tables don't depend on each other
+        return np.random.default_rng([self.seed, stream])
+
+    def zipf_weights(self, n: int) -> np.ndarray:
+        weights = 1.0 / np.arange(1, n + 1) ** ZIPF_EXPONENT
+        return weights / weights.sum()
+
+    def post_times(self) -> np.ndarray:
+        """Minutes since EPOCH of every post, ascending with the post id."""
+        rng = self.rng(3)
+        minutes = np.sort(rng.integers(0, self.days * 24 * 60, self.posts))
+        return minutes
+
+    def reaction_counts(self) -> np.ndarray:
+        """Number of reactions per post, Zipf skewed over a shuffled post order.
+
+        A post can't get more reactions than there are users, what a capped post
+        can't take is handed out again to the posts below the cap.
+        """
+        rng = self.rng(4)
+        weights = self.zipf_weights(self.posts)
+        rng.shuffle(weights)
+        counts = np.zeros(self.posts, dtype=np.int64)
+        remaining = self.reactions
+        while remaining > 0:
+            open_posts = counts < self.accounts
+            if not open_posts.any():
+                break
+            shares = np.where(open_posts, weights, 0.0)
+            shares /= shares.sum()
+            added = np.minimum(np.floor(shares * remaining).astype(np.int64), self.accounts - counts)
+            if not added.any():
+                # only rounding leftovers are left, one more reaction for the heaviest posts
+                heaviest = np.argsort(-shares)[:remaining]
+                added[heaviest[open_posts[heaviest]]] = 1
+            counts += added
+            remaining -= int(added.sum())
+        return counts
+
+
+def stamp(minutes: int) -> datetime:
+    return EPOCH + timedelta(minutes=int(minutes))
+
+
+def generate_accounts(dataset: Dataset) -> Iterator[Tuple[Tuple, Tuple]]:
+    """Yields (account row, user row) pairs."""
+    rng = dataset.rng(1)
+    password = get_passwd_hash("password123")  # the same for every generated user
+    for index in range(dataset.accounts):
+        username = f"user{dataset.first_user_id + index}"
+        join = stamp(rng.integers(0, dataset.days * 24 * 60))
+        account = (username, password, f"{username}@example.com", join.date(), join, "Y")
+        user = (username, f"First{index}", f"Last{index}", None, None, int(rng.integers(18, 80)))
+        yield account, user
+
+
+def generate_posts(dataset: Dataset) -> Iterator[Tuple]:
+    """Yields (user_id, content, category, timestamp) rows in post id order."""
+    rng = dataset.rng(2)
+    times = dataset.post_times()
+    authors = dataset.zipf_weights(dataset.accounts)
+    categories = sorted(CATEGORY_NAMES)
+    for start in range(0, dataset.posts, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, dataset.posts - start)
+        user_ids = rng.choice(dataset.accounts, size=size, p=authors) + dataset.first_user_id
+        category_ids = rng.choice(len(categories), size=size, p=CATEGORY_WEIGHTS)
+        for offset in range(size):
+            post_id = start + offset + 1
+            yield (int(user_ids[offset]), f"Synthetic post #{post_id} about {categories[category_ids[offset]]}",
+                   categories[category_ids[offset]], stamp(times[start + offset]))
+
+
+def generate_reactions(dataset: Dataset) -> Iterator[Tuple]:
+    """Yields (post_id, user_id, reaction_score, timestamp) rows.
+
+    The reactions of a post come from a window of consecutive user ids starting
+    at a random user, so no user reacts twice to the same post.
+    """
+    rng = dataset.rng(5)
+    times = dataset.post_times()
+    counts = dataset.reaction_counts()
+    horizon = dataset.days * 24 * 60
+    scores = np.array(REACTION_SCORES)
+    for post_index in np.flatnonzero(counts):
+        count = int(counts[post_index])
+        first = rng.integers(0, dataset.accounts)
+        user_ids = (first + np.arange(count)) % dataset.accounts + dataset.first_user_id
+        post_scores = rng.choice(scores, size=count, p=SCORE_WEIGHTS)
+        delays = rng.integers(0, max(1, horizon - times[post_index]), size=count)
+        for user_id, score, delay in zip(user_ids, post_scores, delays):
+            yield int(post_index + 1), int(user_id), int(score), stamp(times[post_index] + delay)
+
+
+# OUTPUT ================================================================================
+
+def batched(rows: Iterator, size: int) -> Iterator[List]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_dataset(pool: Any, dataset: Dataset, batch_size: int = 5000) -> Dict[str, float]:
+    """Inserts the dataset into empty tables and rebuilds the rollups and the search index.
+
+    The data is valid by construction, so the checks of ``ingest.py`` are skipped.
+
+    Returns:
+        Dict[str, float]: seconds spent per table
+    """
+    from rollups import rebuild_reaction_pairs, rebuild_rollups
+    from search import rebuild_search_index
+
+    timings = {}
+    with pool.connection() as db_conn:
+        cursor = pool.backend.cursor(db_conn)
+        start = perf_counter()
+        for batch in batched(generate_accounts(dataset), batch_size):
+            cursor.executemany("INSERT INTO account (username, password, email, join_date, last_login, is_private) "
+                               "VALUES (%s, %s, %s, %s, %s, %s)", [account for account, _ in batch])
+            cursor.executemany("INSERT INTO user (username, fname, lname, bio, location, age) "
+                               "VALUES (%s, %s, %s, %s, %s, %s)", [user for _, user in batch])
+            db_conn.commit()
+        timings["account"] = perf_counter() - start
+
+        for table, rows, query in (
+            ("post", generate_posts(dataset),
+             "INSERT INTO post (user_id, content, category, timestamp) VALUES (%s, %s, %s, %s)"),
+            ("reaction", generate_reactions(dataset),
+             "INSERT INTO reaction (post_id, user_id, reaction_score, timestamp) VALUES (%s, %s, %s, %s)"),
+        ):
+            start = perf_counter()
+            for batch in batched(rows, batch_size):
+                cursor.executemany(query, batch)
+                db_conn.commit()
+            timings[table] = perf_counter() - start
+        cursor.close()
+
+    start = perf_counter()
+    rebuild_rollups(pool)
+    rebuild_reaction_pairs(pool)
+    timings["rollups"] = perf_counter() - start
+    start = perf_counter()
+    rebuild_search_index(pool)
+    timings["search"] = perf_counter() - start
+    return timings
+
+
+def write_dataset(dataset: Dataset, folder: str) -> None:
+    """Writes the dataset as accounts.csv, posts.csv and reactions.csv for ingest.py.
+
+    Passwords are written in clear text ("password123") since ingest.py hashes them.
+    """
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "accounts.csv"), "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["username", "password", "email", "join_date", "last_login",
+                         "fname", "lname", "bio", "location", "age"])
+        for account, user in generate_accounts(dataset):
+            writer.writerow([account[0], "password123", account[2], account[3], account[4], *user[1:]])
+
+    for filename, header, rows in (
+        ("posts.csv", ["user_id", "content", "category", "timestamp"], generate_posts(dataset)),
+        ("reactions.csv", ["post_id", "user_id", "reaction_score", "timestamp"], generate_reactions(dataset)),
+    ):
+        with open(os.path.join(folder, filename), "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic NexVerse dataset.")
+    parser.add_argument("--size", choices=list(SIZES), default="small")
+    parser.add_argument("--rows", type=int, help="total rows, overrides --size")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365, help="time span of the posts")
+    parser.add_argument("--database", help="throwaway database to fill, created if missing")
+    parser.add_argument("--backend", choices=["mysql", "sqlite"], help="NEXVERSE_BACKEND if not given")
+    parser.add_argument("--out", help="folder to write csv files to instead")
+    args = parser.parse_args()
+
+    dataset = Dataset(args.rows or SIZES[args.size], seed=args.seed, days=args.days)
+    print(f" {dataset.accounts} accounts, {dataset.posts} posts, {dataset.reactions} reactions (seed {args.seed})")
+
+    if args.out:
+        write_dataset(dataset, args.out)
+        print(f" Dataset written to {args.out}")
+        return
+    if not args.database:
+        parser.error("either --database or --out is required")
+
+    from benchmarks.suite import open_scratch_pool
+
+    pool = open_scratch_pool(args.database, reset=True, backend=args.backend)
+    for table, seconds in load_dataset(pool, dataset).items():
+        print(f" {table:<10} {seconds:8.2f}s")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
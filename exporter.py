@@ -0,0 +1,364 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# tables the admin is allowed to export
+EXPORT_TABLES = ("account", "user", "post", "reaction")
+EXPORT_FORMATS = ("xlsx", "csv", "csv.gz")
+INCREMENTAL_FORMATS = ("csv", "csv.gz")  # deltas have to be readable back for compaction
+
+DATA_FOLDER = "Data"
+EXPORT_BATCH_SIZE = 5000  # rows pulled from the server per fetchmany() call
+EXCEL_MAX_ROWS = 1048576  # rows per worksheet, header included
+MANIFEST_FILE = "manifest.json"  # high-water marks of the incremental exports
+
+# table: (high-water column, query for the rows added after a given high-water mark);
+# the queries must order by the high-water column, which has to come first
+INCREMENTAL_QUERIES = {
+    "account": ("user_id", "SELECT * FROM account WHERE user_id > %s ORDER BY user_id"),
+    "user": ("user_id", "SELECT a.user_id, u.* FROM user u JOIN account a ON a.username = u.username "
+                        "WHERE a.user_id > %s ORDER BY a.user_id"),
+    "post": ("post_id", "SELECT * FROM post WHERE post_id > %s ORDER BY post_id"),
+    "reaction": ("reaction_id", "SELECT * FROM reaction WHERE reaction_id > %s ORDER BY reaction_id"),
+}
+
+# AUTO_INCREMENT keys are handed out at insert time, a transaction committing late can
+# land below a high-water mark already recorded: the rows this many keys behind the mark
+# are read again, and the keys skipped below it are exported once their rows show up
+SAFETY_WINDOW = 1000
+
+manifest_lock = threading.Lock()  # tables are exported from several threads
+
+
+def data_path(filename: str) -> str:
+    """Returns the path of a file inside the data folder, creating the folder."""
+    if not os.path.exists(DATA_FOLDER):
+        os.makedirs(DATA_FOLDER)
+    return os.path.join(DATA_FOLDER, filename)
+
+
+def export_stamp() -> str:
+    """Returns the DDMMYYYY-HHMMSS stamp put in export file names."""
+    return datetime.now().strftime('%d%m%Y-%H%M%S')
+
+
+def load_manifest() -> Dict[str, Dict[str, Any]]:
+    """Returns the incremental export manifest, one entry per table."""
+    try:
+        with open(data_path(MANIFEST_FILE), encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(manifest: Dict[str, Dict[str, Any]]) -> None:
+    """Atomically replaces the manifest so a crash never leaves half of it."""
+    path = data_path(MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+@contextmanager
+def fetch_table_data(pool: Any, table_name: str,
+                     batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Tuple[List[str], Iterator[List[tuple]]]]:
+    """Streams a whole table from the server in ``fetchmany`` batches.
+
+    An unbuffered cursor is used so the server streams the result set and only
+    one batch is held in memory at a time. The connection stays borrowed until
+    the ``with`` block ends.
+
+    Args:
+        pool (Any): the connection pool
+        table_name (str): one of EXPORT_TABLES
+        batch_size (int): rows per batch
+
+    Returns:
+        Tuple[List[str], Iterator[List[tuple]]]: column names and the row batches
+    """
+    if table_name not in EXPORT_TABLES:
+        raise ValueError(f"table '{table_name}' can't be exported")
+
+    with pool.cursor(buffered=False, readonly=True) as cursor:
+        cursor.execute(f"SELECT * FROM {table_name}", name=f"exporter.dump_{table_name}")
+        header = [column[0] for column in cursor.description]
+
+        def batches():
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+
+        yield header, batches()
+
+
+def write_xlsx(filepath: str, header: Sequence[str], batches: Iterable[List[tuple]]) -> int:
+    """Writes the rows to an Excel workbook in constant memory mode.
+
+    Rows beyond Excel's row limit continue on a new worksheet.
+
+    Returns:
+        int: number of rows written, header rows included
+    """
+    import xlsxwriter  # slow to import, only the xlsx exports need it
+
+    workbook = xlsxwriter.Workbook(filepath, {"constant_memory": True,
+                                              "default_date_format": "yyyy-mm-dd hh:mm"})
+    header_cell_format = workbook.add_format({'bold': True, 'border': True, 'bg_color': 'yellow'})
+    body_cell_format = workbook.add_format({'border': True})
+
+    written = 0
+    worksheet, row_index = None, EXCEL_MAX_ROWS
+    for rows in batches:
+        for row in rows:
+            if row_index == EXCEL_MAX_ROWS:  # current sheet is full, start a new one
+                worksheet = workbook.add_worksheet(f"Sheet{len(workbook.worksheets()) + 1}")
+                worksheet.write_row(0, 0, header, header_cell_format)
+                row_index = 1
+                written += 1
+            worksheet.write_row(row_index, 0, row, body_cell_format)
+            row_index += 1
+            written += 1
+
+    if worksheet is None:  # empty table, header only
+        worksheet = workbook.add_worksheet("Sheet1")
+        worksheet.write_row(0, 0, header, header_cell_format)
+        written += 1
+    workbook.close()
+    return written
+
+
+def write_csv(filepath: str, header: Sequence[str], batches: Iterable[List[tuple]],
+              compress: bool = False) -> int:
+    """Writes the rows to a CSV file, gzip compressed if asked to.
+
+    Returns:
+        int: number of rows written, header row included
+    """
+    opener = gzip.open if compress else open
+    with opener(filepath, "wt", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        written = 1
+        for rows in batches:
+            writer.writerows(rows)
+            written += len(rows)
+    return written
+
+
+def export_app_data(pool: Any, table_name: str, fmt: str = "xlsx") -> str:
+    """Exports a table to the data folder as xlsx, csv or gzip compressed csv.
+
+    Args:
+        pool (Any): the connection pool
+        table_name (str): one of EXPORT_TABLES
+        fmt (str): one of EXPORT_FORMATS
+
+    Returns:
+        str: path of the exported file
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format '{fmt}'")
+
+    filepath = data_path(f"{table_name}-{export_stamp()}.{fmt}")
+
+    with fetch_table_data(pool, table_name) as (header, batches):
+        if fmt == "xlsx":
+            row_index = write_xlsx(filepath, header, batches)
+        else:
+            row_index = write_csv(filepath, header, batches, compress=fmt == "csv.gz")
+    print(f' {row_index} Records successfully exported to {filepath}\n')
+    return filepath
+
+
+# INCREMENTAL EXPORT ====================================================================
+
+class HighWater:
+    """High-water mark of an incremental read, with the keys skipped below it.
+
+    The read starts ``SAFETY_WINDOW`` keys behind the mark (see ``start``);
+    ``new_rows`` drops the rows read already and keeps the late ones, then
+    moves the mark. A skipped key is given up once the mark is a whole window
+    past it, it belonged to a rolled back insert or a deleted row.
+    """
+
+    def __init__(self, mark: int = 0, pending: Iterable[int] = ()):
+        self.mark = mark
+        self.pending = set(pending)
+
+    def start(self) -> int:
+        return max(self.mark - SAFETY_WINDOW, 0)
+
+    def new_rows(self, rows: List[tuple]) -> List[tuple]:
+        """Returns the rows not read before, ``rows`` ordered by their first column, the key."""
+        fresh = []
+        for row in rows:
+            key = row[0]
+            if key <= self.mark:
+                if key not in self.pending:
+                    continue
+                self.pending.discard(key)
+            else:
+                self.pending.update(range(max(self.mark, key - SAFETY_WINDOW) + 1, key))
+                self.mark = key
+            fresh.append(row)
+        self.pending = {key for key in self.pending if key > self.mark - SAFETY_WINDOW}
+        return fresh
+
+
+def export_increment(pool: Any, table_name: str, fmt: str = "csv.gz",
+                     batch_size: int = EXPORT_BATCH_SIZE) -> Optional[str]:
+    """Exports only the rows added to a table since its last incremental export.
+
+    The rows above the high-water mark recorded in the manifest, and the ones a
+    late commit put below it (see HighWater), are written to a delta file named
+    after the time and the old and new marks, then the mark is moved to the
+    last exported key. Only new rows are picked up, rows updated in place (e.g.
+    ``account.last_login``) are only refreshed by a full export.
+
+    Args:
+        pool (Any): the connection pool
+        table_name (str): one of INCREMENTAL_QUERIES
+        fmt (str): one of INCREMENTAL_FORMATS
+        batch_size (int): rows per fetchmany() call
+
+    Returns:
+        Optional[str]: path of the delta file, None when there was nothing new
+    """
+    if table_name not in INCREMENTAL_QUERIES:
+        raise ValueError(f"table '{table_name}' can't be exported incrementally")
+    if fmt not in INCREMENTAL_FORMATS:
+        raise ValueError(f"unknown incremental export format '{fmt}'")
+
+    key, query = INCREMENTAL_QUERIES[table_name]
+    with manifest_lock:
+        entry = load_manifest().get(table_name, {})
+        high_water = entry.get("high_water", 0)
+        # manifests written before the safety window have no pending keys
+        keys = HighWater(high_water, entry.get("pending", []))
+
+    stamp = export_stamp()
+    partpath = data_path(f"{table_name}-delta-{stamp}-{high_water}.{fmt}.part")
+    with pool.cursor(buffered=False, readonly=True) as cursor:
+        cursor.execute(query, (keys.start(),))
+        header = [column[0] for column in cursor.description]
+
+        def batches():
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                rows = keys.new_rows(rows)
+                if rows:
+                    yield rows
+
+        # written under a temporary name, a failed run leaves no delta behind
+        row_index = write_csv(partpath, header, batches(), compress=fmt == "csv.gz")
+
+    last_key = keys.mark
+    if row_index == 1:
+        os.remove(partpath)
+        print(f' No new {table_name} records since the last export\n')
+        return None
+    # the keys tell apart the deltas written within the same second, a delta of late rows
+    # only ends on the mark it started from
+    filepath = data_path(f"{table_name}-delta-{stamp}-{high_water}-{last_key}.{fmt}")
+    if os.path.exists(filepath):
+        os.remove(partpath)
+        raise FileExistsError(f"delta '{filepath}' exists already, the {table_name} rows were exported twice")
+    os.replace(partpath, filepath)
+
+    with manifest_lock:
+        manifest = load_manifest()
+        entry = manifest.setdefault(table_name, {"key": key, "high_water": 0, "snapshot": None, "deltas": []})
+        entry["high_water"] = last_key
+        entry["pending"] = sorted(keys.pending)
+        entry["deltas"].append(os.path.basename(filepath))
+        save_manifest(manifest)
+    print(f' {row_index - 1} new Records exported to {filepath}\n')
+    return filepath
+
+
+def read_csv_header(filepath: str) -> List[str]:
+    """Returns the header row of an exported csv/csv.gz file."""
+    opener = gzip.open if filepath.endswith(".gz") else open
+    with opener(filepath, "rt", newline="", encoding="utf-8") as file:
+        return next(csv.reader(file))
+
+
+def read_csv_batches(filepath: str, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[List[List[str]]]:
+    """Yields the rows of an exported csv/csv.gz file in batches, header excluded."""
+    opener = gzip.open if filepath.endswith(".gz") else open
+    with opener(filepath, "rt", newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        next(reader)
+        while True:
+            batch = list(islice(reader, batch_size))
+            if not batch:
+                return
+            yield batch
+
+
+def compact(table_name: str, fmt: str = "csv.gz") -> Optional[str]:
+    """Merges the last snapshot and every delta of a table into a new snapshot.
+
+    The merged files are deleted and the manifest is pointed at the new
+    snapshot; the high-water mark is kept, so the next increment continues
+    where the last one ended.
+
+    Returns:
+        Optional[str]: path of the new snapshot, None when there was nothing to merge
+    """
+    if fmt not in INCREMENTAL_FORMATS:
+        raise ValueError(f"unknown snapshot format '{fmt}'")
+
+    with manifest_lock:
+        manifest = load_manifest()
+        entry = manifest.get(table_name)
+        if not entry or not entry["deltas"]:
+            return None
+
+        # a delta listed twice by an older manifest is merged once
+        parts = list(dict.fromkeys(([entry["snapshot"]] if entry["snapshot"] else []) + entry["deltas"]))
+        header = read_csv_header(data_path(parts[0]))
+        batches = chain.from_iterable(read_csv_batches(data_path(part)) for part in parts)
+
+        # named after the high-water mark too, the merged snapshot may be from the same second
+        filepath = data_path(f"{table_name}-snapshot-{export_stamp()}-{entry['high_water']}.{fmt}")
+        row_index = write_csv(filepath + ".part", header, batches, compress=fmt == "csv.gz")
+        os.replace(filepath + ".part", filepath)
+
+        entry["snapshot"] = os.path.basename(filepath)
+        entry["deltas"] = []
+        save_manifest(manifest)
+
+    for part in parts:
+        os.remove(data_path(part))
+    print(f' {row_index - 1} Records compacted into {filepath}\n')
+    return filepath
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintenance of the incremental exports.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compact_parser = subparsers.add_parser("compact", help="merge the deltas of tables into snapshots")
+    compact_parser.add_argument("tables", nargs="*", default=list(INCREMENTAL_QUERIES))
+    compact_parser.add_argument("--format", choices=INCREMENTAL_FORMATS, default="csv.gz")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        for table in args.tables:
+            if compact(table, args.format) is None:
+                print(f" Nothing to compact for {table}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+from typing import Any, Iterator, List, Optional, Tuple
+
+# number of posts pulled from the database per round trip
+FEED_PAGE_SIZE = 50
+
+# unseen posts for a user, newest first, resumed from a (timestamp, post_id) keyset;
+# the NOT EXISTS anti-join is served by the reaction(user_id, post_id) index and the
+# ordering by the post(timestamp, post_id) index. The reactions moved out by the
+# archival job (see archive.py) are anti-joined through the primary key of
+# reaction_archive_seen
+UNSEEN_POSTS_QUERY = """
+SELECT p.post_id, p.content, p.timestamp
+FROM post p
+WHERE NOT EXISTS (
+    SELECT 1 FROM reaction r WHERE r.user_id = %s AND r.post_id = p.post_id
+)
+AND NOT EXISTS (
+    SELECT 1 FROM reaction_archive_seen a WHERE a.user_id = %s AND a.post_id = p.post_id
+)
+{keyset}
+ORDER BY p.timestamp DESC, p.post_id DESC
+LIMIT %s
+"""
+
+KEYSET_CLAUSE = "AND (p.timestamp < %s OR (p.timestamp = %s AND p.post_id < %s))"
+
+
+def fetch_unseen_page(cursor: Any, user_id: int, after: Optional[Tuple[str, int]] = None,
+                      page_size: int = FEED_PAGE_SIZE) -> List[Tuple[int, str, str]]:
+    """Fetches one page of posts the user has not reacted to yet.
+
+    Args:
+        cursor (Any): the cursor object
+        user_id (int): user whose feed is being built
+        after (Optional[Tuple[str, int]]): (timestamp, post_id) of the last post of
+            the previous page, None for the first page
+        page_size (int): maximum number of posts returned
+
+    Returns:
+        List[Tuple[int, str, str]]: (post_id, content, timestamp) rows
+    """
+    if after is None:
+        cursor.execute(UNSEEN_POSTS_QUERY.format(keyset=""), (user_id, user_id, page_size))
+    else:
+        timestamp, post_id = after
+        cursor.execute(
+            UNSEEN_POSTS_QUERY.format(keyset=KEYSET_CLAUSE),
+            (user_id, user_id, timestamp, timestamp, post_id, page_size),
+        )
+    return cursor.fetchall()
+
+
+def iter_unseen_posts(pool: Any, user_id: int,
+                      page_size: int = FEED_PAGE_SIZE) -> Iterator[Tuple[int, str, str]]:
+    """Yields every unseen post of the user, newest first, one page at a time.
+
+    A connection is only borrowed from the pool while a page is fetched, so none
+    is held while the user is reading and reacting to the posts.
+    """
+    after = None
+    while True:
+        with pool.cursor(readonly=True) as cursor:
+            page = fetch_unseen_page(cursor, user_id, after, page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        post_id, _, timestamp = page[-1]
+        after = (timestamp, post_id)
+
+
+# ADMIN VIEW ============================================================================
+
+ADMIN_PAGE_SIZE = 20
+
+# one page of posts with their average score; the average comes from the post_score
+# rollup through its primary key, so only the rows of the visible page are touched
+ADMIN_POSTS_QUERY = """
+SELECT p.post_id, p.content, p.category, p.timestamp, ps.total_score * 1.0 / NULLIF(ps.reaction_count, 0) as avg_score
+FROM post p
+LEFT JOIN post_score ps ON ps.post_id = p.post_id
+WHERE {filters}
+ORDER BY p.timestamp DESC, p.post_id DESC
+LIMIT %s
+"""
+
+
+def fetch_admin_page(cursor: Any, after: Optional[Tuple[str, int]] = None,
+                     page_size: int = ADMIN_PAGE_SIZE, category: Optional[str] = None,
+                     since: Optional[str] = None, until: Optional[str] = None) -> List[tuple]:
+    """Fetches one page of posts, newest first, with their average reaction score.
+
+    The category filter is served by the post(category, timestamp, post_id) index
+    and the date range by the leading timestamp column of either post index.
+
+    Args:
+        cursor (Any): the cursor object
+        after (Optional[Tuple[str, int]]): (timestamp, post_id) of the last post of
+            the previous page, None for the first page
+        page_size (int): maximum number of posts returned
+        category (Optional[str]): only posts of this category
+        since (Optional[str]): only posts at or after this timestamp
+        until (Optional[str]): only posts before this timestamp
+
+    Returns:
+        List[tuple]: (post_id, content, category, timestamp, avg_score) rows
+    """
+    filters, values = ["1 = 1"], []
+    if category is not None:
+        filters.append("p.category = %s")
+        values.append(category)
+    if since is not None:
+        filters.append("p.timestamp >= %s")
+        values.append(since)
+    if until is not None:
+        filters.append("p.timestamp < %s")
+        values.append(until)
+    if after is not None:
+        timestamp, post_id = after
+        filters.append("(p.timestamp < %s OR (p.timestamp = %s AND p.post_id < %s))")
+        values.extend((timestamp, timestamp, post_id))
+
+    cursor.execute(ADMIN_POSTS_QUERY.format(filters=" AND ".join(filters)), (*values, page_size))
+    return cursor.fetchall()
@@ -0,0 +1,307 @@
+"""Bulk ingestion of accounts, posts and reactions from CSV or JSONL files.
+
+Records are validated with the same constraints as the interactive prompts,
+inserted in batches (``executemany``, posts one at a time for their ids) and
+committed every ``--commit-every`` rows. Lines that can't be parsed are
+rejected like invalid records. Account records carry the columns of both the ``account`` and the
+``user`` table.
+
+    python ingest.py account accounts.csv
+    python ingest.py post posts.jsonl --batch-size 2000 --commit-every 20000
+    python ingest.py reaction reactions.csv.gz
+"""
+import argparse
+import csv
+import gzip
+import json
+from datetime import datetime
+from itertools import islice
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+from passwords import close_verifier, hash_passwds
+from rollups import record_reaction_pairs, record_reaction_totals, record_user_reactions
+from validators import (parse_timestamp, prepare_account, validate_account_field, validate_post,
+                        validate_reaction, validate_timestamp)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_COMMIT_EVERY = 10000
+MAX_REPORTED_ERRORS = 20
+
+ACCOUNT_FIELDS = ("username", "password", "email", "fname", "lname", "bio", "location", "age")
+
+# (line number, record) as read from the input file
+Record = Tuple[int, Dict[str, Any]]
+# (line number, error message)
+Reject = Tuple[int, str]
+
+
+def read_records(path: str) -> Iterator[Union[Record, Reject]]:
+    """Yields the records of a .csv or .jsonl file, optionally gzip compressed, and
+    a reject for every line that isn't valid JSON."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", newline="", encoding="utf-8") as file:
+        if path.removesuffix(".gz").endswith((".jsonl", ".json")):
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as err:
+                    yield line_number, f"Invalid JSON: {err.msg}."
+                    continue
+                if not isinstance(record, dict):
+                    yield line_number, "Invalid JSON: not an object."
+                    continue
+                yield line_number, record
+        else:
+            # line 1 is the header
+            yield from enumerate(csv.DictReader(file), start=2)
+
+
+def placeholders(count: int, width: int = 1) -> str:
+    """Returns '%s, %s, ...' (or '(%s, %s), ...' for width > 1) for an IN list."""
+    item = "%s" if width == 1 else "(" + ", ".join(["%s"] * width) + ")"
+    return ", ".join([item] * count)
+
+
+def existing_ids(cursor: Any, table: str, column: str, ids: Iterable[int]) -> set:
+    ids = list(set(ids))
+    if not ids:
+        return set()
+    cursor.execute(f"SELECT {column} FROM {table} WHERE {column} IN ({placeholders(len(ids))})", ids)
+    return {row[0] for row in cursor.fetchall()}
+
+
+def reacted_pairs(cursor: Any, pairs: List[Tuple[int, int]]) -> set:
+    """Returns the (post_id, user_id) pairs that have a reaction already, stored in the
+    reaction table or archived out of it, see rollups.record_reaction_pairs."""
+    if not pairs:
+        return set()
+    cursor.execute(
+        f"SELECT post_id, user_id FROM reaction_pair WHERE (user_id, post_id) IN ({placeholders(len(pairs), 2)})",
+        [value for post_id, user_id in pairs for value in (user_id, post_id)],
+    )
+    return set(cursor.fetchall())
+
+
+# LOADERS ===============================================================================
+
+def load_accounts(cursor: Any, batch: List[Record]) -> Tuple[int, List[Reject]]:
+    rejects, valid = [], []
+    for line_number, record in batch:
+        error = None if record.get("username") else "Username cannot be empty."
+        for column in ACCOUNT_FIELDS:
+            error = error or validate_account_field(column, record.get(column))
+        for column in ("join_date", "last_login"):
+            error = error or validate_timestamp(record, column)
+        if error:
+            rejects.append((line_number, error))
+            continue
+        # the password stays plain until the accounts to insert are known, see below
+        data = prepare_account({column: record.get(column)
+                                for column in ACCOUNT_FIELDS + ("join_date", "last_login")}, hasher=str)
+        valid.append((line_number, data))
+
+    # uniqueness, inside the batch and against the stored accounts
+    usernames = [data["username"] for _, data in valid]
+    emails = [data["email"] for _, data in valid]
+    taken_usernames, taken_emails = set(), set()
+    if valid:
+        cursor.execute(
+            f"SELECT username, email FROM account WHERE username IN ({placeholders(len(usernames))}) "
+            f"OR email IN ({placeholders(len(emails))})",
+            usernames + emails,
+        )
+        for username, email in cursor.fetchall():
+            taken_usernames.add(username)
+            taken_emails.add(email)
+
+    accepted = []
+    for line_number, data in valid:
+        if data["username"] in taken_usernames:
+            rejects.append((line_number, "Username already exists!"))
+            continue
+        if data["email"] in taken_emails:
+            rejects.append((line_number, "User with email already exists!"))
+            continue
+        taken_usernames.add(data["username"])
+        taken_emails.add(data["email"])
+        accepted.append(data)
+
+    # a hash costs tens of milliseconds of CPU, the batch is hashed on every core at once
+    hashes = hash_passwds([data["password"] for data in accepted]) if accepted else []
+    accounts = [(data["username"], passwd, data["email"], data["join_date"], data["last_login"], data["is_private"])
+                for data, passwd in zip(accepted, hashes)]
+    users = [(data["username"], data["fname"], data["lname"], data["bio"], data["location"], data["age"])
+             for data in accepted]
+
+    if accounts:
+        cursor.executemany("INSERT INTO account (username, password, email, join_date, last_login, is_private) "
+                           "VALUES (%s, %s, %s, %s, %s, %s)", accounts)
+        cursor.executemany("INSERT INTO user (username, fname, lname, bio, location, age) "
+                           "VALUES (%s, %s, %s, %s, %s, %s)", users)
+    return len(accounts), rejects
+
+
+def load_posts(cursor: Any, batch: List[Record]) -> Tuple[int, List[Reject]]:
+    from search import index_posts  # search.py imports placeholders() from here
+
+    rejects, valid = [], []
+    for line_number, record in batch:
+        error = validate_post(record)
+        if error:
+            rejects.append((line_number, error))
+        else:
+            valid.append((line_number, record))
+
+    known_users = existing_ids(cursor, "account", "user_id", (int(record["user_id"]) for _, record in valid))
+    posts = []
+    now = datetime.now().replace(microsecond=0)
+    for line_number, record in valid:
+        if int(record["user_id"]) not in known_users:
+            rejects.append((line_number, f"User #{record['user_id']} doesn't exist."))
+            continue
+        posts.append((int(record["user_id"]), record.get("content"), record["category"].lower(),
+                      parse_timestamp(record.get("timestamp")) or now))
+
+    # one INSERT per post, the ids come from lastrowid: a range above MAX(post_id) would
+    # also take in the posts committed concurrently by other connections
+    stored = []
+    for user_id, content, category, timestamp in posts:
+        cursor.execute("INSERT INTO post (user_id, content, category, timestamp) VALUES (%s, %s, %s, %s)",
+                       (user_id, content, category, timestamp))
+        stored.append((cursor.lastrowid, category, content))
+    if stored:
+        # empty rollup rows of the new posts, see rollups.record_post
+        cursor.executemany("INSERT INTO post_score (post_id, category, total_score, reaction_count) "
+                           "VALUES (%s, %s, 0, 0)", [(post_id, category) for post_id, category, _ in stored])
+        index_posts(cursor, stored)
+    return len(posts), rejects
+
+
+def load_reactions(cursor: Any, batch: List[Record]) -> Tuple[int, List[Reject]]:
+    rejects, valid = [], []
+    for line_number, record in batch:
+        error = validate_reaction(record)
+        if error:
+            rejects.append((line_number, error))
+            continue
+        valid.append((line_number, int(record["post_id"]), int(record["user_id"]),
+                      int(record["reaction_score"]), parse_timestamp(record.get("timestamp"))))
+
+    known_posts = existing_ids(cursor, "post", "post_id", (row[1] for row in valid))
+    known_users = existing_ids(cursor, "account", "user_id", (row[2] for row in valid))
+    seen = reacted_pairs(cursor, list({(post_id, user_id) for _, post_id, user_id, _, _ in valid}))
+
+    reactions, totals = [], {}
+    now = datetime.now().replace(microsecond=0)
+    for line_number, post_id, user_id, score, timestamp in valid:
+        if post_id not in known_posts:
+            rejects.append((line_number, f"Post #{post_id} doesn't exist."))
+        elif user_id not in known_users:
+            rejects.append((line_number, f"User #{user_id} doesn't exist."))
+        elif (post_id, user_id) in seen:
+            rejects.append((line_number, f"User #{user_id} already reacted to post #{post_id}."))
+        else:
+            seen.add((post_id, user_id))
+            reactions.append((post_id, user_id, score, timestamp or now))
+            total, count = totals.get(post_id, (0, 0))
+            totals[post_id] = (total + score, count + 1)
+
+    if reactions:
+        record_reaction_pairs(cursor, [(user_id, post_id) for post_id, user_id, _, _ in reactions])
+        cursor.executemany("INSERT INTO reaction (post_id, user_id, reaction_score, timestamp) "
+                           "VALUES (%s, %s, %s, %s)", reactions)
+        record_reaction_totals(cursor, totals)
+        record_user_reactions(cursor, [(user_id, post_id, score) for post_id, user_id, score, _ in reactions])
+    return len(reactions), rejects
+
+
+LOADERS: Dict[str, Callable[[Any, List[Record]], Tuple[int, List[Reject]]]] = {
+    "account": load_accounts,
+    "post": load_posts,
+    "reaction": load_reactions,
+}
+
+
+# INGESTION =============================================================================
+
+def ingest(pool: Any, kind: str, records: Iterable[Union[Record, Reject]], batch_size: int = DEFAULT_BATCH_SIZE,
+           commit_every: int = DEFAULT_COMMIT_EVERY) -> Dict[str, Any]:
+    """Streams records into the database in batches on a single pooled connection.
+
+    Args:
+        pool (Any): the connection pool
+        kind (str): one of LOADERS
+        records (Iterable[Union[Record, Reject]]): (line number, record) pairs and the
+            lines already rejected while reading, see read_records
+        batch_size (int): records per executemany() call
+        commit_every (int): records between two commits
+
+    Returns:
+        Dict[str, Any]: inserted/rejected counts, elapsed seconds, rows per second
+            and the first rejected records
+    """
+    loader = LOADERS[kind]
+    records = iter(records)
+    inserted = rejected = uncommitted = 0
+    errors = []
+    start = perf_counter()
+
+    with pool.connection() as db_conn:
+        cursor = pool.backend.cursor(db_conn)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            # lines the reader couldn't parse are rejected before the loader sees them
+            unreadable = [(line_number, record) for line_number, record in batch if isinstance(record, str)]
+            count, rejects = loader(cursor, [item for item in batch if not isinstance(item[1], str)])
+            rejects = sorted(unreadable + rejects)
+            inserted += count
+            rejected += len(rejects)
+            errors.extend(rejects[:MAX_REPORTED_ERRORS - len(errors)])
+
+            uncommitted += len(batch)
+            if uncommitted >= commit_every:
+                db_conn.commit()
+                uncommitted = 0
+                elapsed = perf_counter() - start
+                print(f" {inserted} rows committed ({inserted / elapsed:.0f} rows/s)")
+        db_conn.commit()
+        cursor.close()
+
+    elapsed = perf_counter() - start
+    return {
+        "inserted": inserted,
+        "rejected": rejected,
+        "seconds": elapsed,
+        "rows_per_second": inserted / elapsed if elapsed else 0.0,
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    from database import open_pool
+
+    parser = argparse.ArgumentParser(description="Bulk load accounts, posts or reactions.")
+    parser.add_argument("kind", choices=list(LOADERS))
+    parser.add_argument("path", help=".csv or .jsonl file, optionally .gz compressed")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--commit-every", type=int, default=DEFAULT_COMMIT_EVERY)
+    args = parser.parse_args()
+
+    pool = open_pool(size=1)
+    result = ingest(pool, args.kind, read_records(args.path), args.batch_size, args.commit_every)
+    pool.close()
+    close_verifier()
+
+    for line_number, error in result["errors"]:
+        print(f" [!] line {line_number}: {error}")
+    print(f"\n {result['inserted']} {args.kind} rows loaded, {result['rejected']} rejected "
+          f"in {result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""Versioned schema migrations.
+
+Every schema change is a numbered migration; the version reached so far is kept
+in the ``schema_version`` table, so starting the application (or running this
+module) applies only the migrations a database hasn't seen yet. Migrations are
+never edited once released, a later change gets a new migration at the end of
+MIGRATIONS.
+
+    python migrations.py status
+    python migrations.py migrate [--to VERSION]
+"""
+import argparse
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from passwords import HASH_COLUMN_TYPE
+from replicas import HEARTBEAT_TABLES
+from rollups import AFFINITY_TABLES, ROLLUP_TABLES, rebuild_affinities, rebuild_reaction_pairs, rebuild_rollups
+from search import TERM_COLUMN_TYPE, rebuild_search_index
+
+VERSION_TABLE = "schema_version"
+MIGRATION_BATCH_SIZE = 10000  # rows backfilled per transaction when converting a column
+
+
+class MigrationError(Exception):
+    """Raised when a migration can't be applied before the data is fixed by hand."""
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Any], None]  # takes the connection pool
+
+
+# HELPERS ===============================================================================
+
+def create_tables(cursor: Any, tables: Dict[str, str], options: str = "") -> None:
+    """Creates the tables that don't exist yet (table name: column definitions)."""
+    for table, attributes in tables.items():
+        if not cursor.backend.table_exists(cursor, table):
+            cursor.execute(f"CREATE TABLE {table}({cursor.backend.column_definitions(attributes)}) {options}")
+            print(f"Table '{table}' created successfully...")
+
+
+def create_indexes(cursor: Any, indexes: Dict[str, Tuple[str, str]], unique: bool = False) -> None:
+    """Creates the indexes that don't exist yet (index name: (table, columns))."""
+    for index, (table, columns) in indexes.items():
+        if not cursor.backend.index_exists(cursor, table, index):
+            cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {index} ON {table}({columns})")
+            print(f"Index '{index}' created successfully...")
+
+
+def convert_column(pool: Any, table: str, key: str, column: str, sql_type: str,
+                   indexes: Dict[str, Tuple[str, str]] = None,
+                   batch_size: int = MIGRATION_BATCH_SIZE) -> None:
+    """Converts a legacy string column to a native DATETIME or DATE column in place.
+
+    The converted values are written to a new column in primary key batches, one
+    transaction each, so the table stays writable while the backfill runs. Rows
+    inserted meanwhile are picked up by a final pass, then the indexes on the
+    column are dropped, the old column is swapped for the new one and the
+    indexes are created again. Every step checks where a previous run stopped, so
+    an interrupted conversion is resumed by running it again.
+
+    Rows updated in place during the backfill keep their old value, migrate
+    before the application starts serving users.
+
+    Args:
+        pool (Any): the connection pool
+        table (str): table of the column
+        key (str): integer primary key of the table, used to cut the batches
+        column (str): the column to convert
+        sql_type (str): DATETIME or DATE
+        indexes (Dict[str, Tuple[str, str]]): indexes covering the column, rebuilt after the swap
+        batch_size (int): rows per backfill transaction
+    """
+    indexes = indexes or {}
+    new_column = f"{column}_new"
+    with pool.cursor() as cursor:
+        backend = cursor.backend
+        current_type = backend.column_type(cursor, table, column)
+        pending = backend.column_type(cursor, table, new_column) is not None
+        if current_type == sql_type.lower() and not pending:
+            return  # already converted
+        if current_type is not None and not pending:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {new_column} {sql_type}")
+        cursor.execute(f"SELECT MIN({key}), MAX({key}) FROM {table}")
+        low, high = cursor.fetchone()
+
+    if current_type is not None:
+        converted = backend.cast_temporal(column, sql_type)
+        low, high = low or 0, high or 0
+        for start in range(low, high + 1, batch_size):
+            with pool.cursor() as cursor:
+                cursor.execute(f"UPDATE {table} SET {new_column} = {converted} WHERE {key} >= %s AND {key} < %s",
+                               (start, start + batch_size))
+
+        with pool.cursor() as cursor:
+            cursor.execute(f"UPDATE {table} SET {new_column} = {converted} WHERE {key} > %s", (high,))
+            for index in indexes:
+                if backend.index_exists(cursor, table, index):
+                    backend.drop_index(cursor, table, index)
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+    # the old column is gone, only the rename and the indexes are left
+    with pool.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} RENAME COLUMN {new_column} TO {column}")
+        create_indexes(cursor, indexes)
+    print(f"Column '{table}.{column}' converted to {sql_type}...")
+
+
+# MIGRATIONS ============================================================================
+
+# the schema as it was before migrations existed, kept as it was so that existing
+# databases and new ones go through the same steps
+BASE_TABLES = {
+    "account": "user_id INT(10) AUTO_INCREMENT PRIMARY KEY, username VARCHAR(20), password VARCHAR(64), email VARCHAR(30), join_date VARCHAR(10), last_login VARCHAR(16), is_private VARCHAR(1)",
+    "user": "username VARCHAR(20) PRIMARY KEY, fname VARCHAR(20), lname VARCHAR(20), bio VARCHAR(120), location VARCHAR(100), age INT(3)",
+    "post": "post_id INT(10) AUTO_INCREMENT PRIMARY KEY, user_id INT(10), content VARCHAR(500), category VARCHAR(20), timestamp VARCHAR(16)",
+    "reaction": "reaction_id INT(10) AUTO_INCREMENT PRIMARY KEY, post_id INT(10), user_id INT(10), reaction_score INT(1), timestamp VARCHAR(16)",
+}
+
+# composite indexes needed by the feed and the admin view (index name: (table, columns))
+FEED_INDEXES = {
+    "idx_reaction_user_post": ("reaction", "user_id, post_id"),  # unseen-post anti-join
+    "idx_post_timestamp": ("post", "timestamp, post_id"),  # feed keyset ordering
+    "idx_post_category_timestamp": ("post", "category, timestamp, post_id"),  # admin category filter
+}
+
+# lookups that scanned whole tables
+LOOKUP_INDEXES = {
+    "idx_account_username": ("account", "username"),  # login, profile and signup checks
+    "idx_account_email": ("account", "email"),  # signup checks
+    "idx_reaction_post": ("reaction", "post_id, reaction_score"),  # rollup rebuild, covering
+}
+
+
+def create_base_tables(pool: Any) -> None:
+    with pool.cursor() as cursor:
+        create_tables(cursor, BASE_TABLES)
+
+
+def create_feed_indexes(pool: Any) -> None:
+    with pool.cursor() as cursor:
+        create_indexes(cursor, FEED_INDEXES)
+
+
+def create_rollups(pool: Any) -> None:
+    with pool.cursor() as cursor:
+        create_tables(cursor, ROLLUP_TABLES)
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM post), EXISTS(SELECT 1 FROM post_score)")
+        has_posts, has_rollups = cursor.fetchone()
+    if has_posts and not has_rollups:
+        rebuild_rollups(pool)
+
+
+def convert_timestamps(pool: Any) -> None:
+    post_indexes = {index: FEED_INDEXES[index] for index in ("idx_post_timestamp", "idx_post_category_timestamp")}
+    convert_column(pool, "post", "post_id", "timestamp", "DATETIME", post_indexes)
+    convert_column(pool, "reaction", "reaction_id", "timestamp", "DATETIME")
+    convert_column(pool, "account", "user_id", "join_date", "DATE")
+    convert_column(pool, "account", "user_id", "last_login", "DATETIME")
+
+
+def create_lookup_indexes(pool: Any) -> None:
+    with pool.cursor() as cursor:
+        create_indexes(cursor, LOOKUP_INDEXES)
+
+
+# the archive tables as migration 6 created them, later changes need a migration of their own
+ARCHIVE_TABLES = {
+    # score totals of the archived reactions, per month and post
+    "reaction_archive_summary": "month DATE, post_id INT(10), total_score BIGINT, reaction_count INT(10), PRIMARY KEY (month, post_id)",
+    # months already archived, written with the summary so a rerun never counts a month twice
+    "archive_log": "table_name VARCHAR(20), month DATE, month_end DATE, target VARCHAR(10), row_count INT(10), archived_at DATETIME, PRIMARY KEY (table_name, month)",
+}
+# archived reactions, no secondary index since they are only read back in bulk
+REACTION_ARCHIVE_TABLE = {
+    "reaction_archive": "reaction_id INT(10) PRIMARY KEY, post_id INT(10), user_id INT(10), reaction_score INT(1), timestamp DATETIME",
+}
+
+
+def create_archive_tables(pool: Any) -> None:
+    with pool.cursor() as cursor:
+        create_tables(cursor, ARCHIVE_TABLES)
+        create_tables(cursor, REACTION_ARCHIVE_TABLE, cursor.backend.compressed_table_options())
+        # the archival job selects reactions by age, partition pruning does it on partitioned tables
+        create_indexes(cursor, {"idx_reaction_timestamp": ("reaction", "timestamp")})
+
+
+# uniqueness the application relied on without the schema enforcing it
+UNIQUE_INDEXES = {
+    "uq_account_username": ("account", "username"),
+    "uq_account_email": ("account", "email"),
+    "uq_reaction_post_user": ("reaction", "post_id, user_id"),
+}
+MAX_REPORTED_DUPLICATES = 20
+
+
+def find_duplicates(cursor: Any, table: str, columns: str) -> List[tuple]:
+    """Returns (values..., count) of the values stored more than once, NULLs excluded."""
+    not_null = " AND ".join(f"{column.strip()} IS NOT NULL" for column in columns.split(","))
+    cursor.execute(f"SELECT {columns}, COUNT(*) FROM {table} WHERE {not_null} "
+                   f"GROUP BY {columns} HAVING COUNT(*) > 1 LIMIT %s", (MAX_REPORTED_DUPLICATES,))
+    return cursor.fetchall()
+
+
+def create_unique_indexes(pool: Any) -> None:
+    """Adds the unique indexes, after checking that no stored rows violate them.
+
+    Duplicates are reported and stop the migration, which account keeps a username
+    or which reaction counts is for an admin to decide. A partitioned reaction
+    table can't have the reaction index, since every unique index of a
+    partitioned table has to contain the timestamp; archive.partition_table
+    drops it when partitioning later. The reaction_pair table of migration 14
+    keeps the rule either way.
+    """
+    indexes = dict(UNIQUE_INDEXES)
+    with pool.cursor() as cursor:
+        if cursor.backend.partitions(cursor, "reaction"):
+            print("Table 'reaction' is partitioned, uniqueness of reactions stays with the application...")
+            del indexes["uq_reaction_post_user"]
+
+        report = []
+        for index, (table, columns) in indexes.items():
+            for *values, count in find_duplicates(cursor, table, columns):
+                report.append(f"  {table}({columns}) = {tuple(values)}: {count} rows")
+        if report:
+            raise MigrationError("duplicates have to be removed before adding the unique indexes:\n"
+                                 + "\n".join(report))
+
+        create_indexes(cursor, indexes, unique=True)
+        # the unique indexes serve the lookups too
+        for index in ("idx_account_username", "idx_account_email"):
+            if cursor.backend.index_exists(cursor, "account", index):
+                cursor.backend.drop_index(cursor, "account", index)
+
+
+def widen_password_column(pool: Any) -> None:
+    # salted hashes carry algorithm, parameters and salt, the SHA-256 hex digests
+    # of older accounts stay until their next login rehashes them
+    with pool.cursor() as cursor:
+        cursor.backend.widen_column(cursor, "account", "password", HASH_COLUMN_TYPE)
+
+
+# the search tables as migration 9 created them, migration 13 changed the term collation
+SEARCH_TABLES = {
+    "search_term": "term VARCHAR(40) PRIMARY KEY, post_count INT(10) DEFAULT 0",
+    "search_posting": "term VARCHAR(40), post_id INT(10), category VARCHAR(20), term_count INT(5), "
+                      "post_terms INT(5), PRIMARY KEY (term, post_id)",
+    "search_stats": "name VARCHAR(20) PRIMARY KEY, value BIGINT DEFAULT 0",
+}
+SEARCH_INDEXES = {
+    "idx_search_posting_category": ("search_posting", "term, category, post_id"),  # category filter
+}
+
+
+def create_search_index(pool: Any) -> None:
+    with pool.cursor() as cursor:
+        create_tables(cursor, SEARCH_TABLES)
+        create_indexes(cursor, SEARCH_INDEXES)
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM post)")
+        has_posts = cursor.fetchone()[0]
+    if has_posts:
+        rebuild_search_index(pool)
+
+
+def create_affinities(pool: Any) -> None:
+    with pool.cursor() as cursor:
+        create_tables(cursor, AFFINITY_TABLES)
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM reaction)")
+        has_reactions = cursor.fetchone()[0]
+    if has_reactions:
+        rebuild_affinities(pool)
+
+
+def create_archive_seen(pool: Any) -> None:
+    # months archived before into the reaction_archive table are backfilled, the
+    # pairs of months archived to Parquet files can't be read back from here
+    with pool.cursor() as cursor:
+        # (user, post) of every archived reaction, the feeds anti-join it like the hot reactions
+        create_tables(cursor, {
+            "reaction_archive_seen": "user_id INT(10), post_id INT(10), PRIMARY KEY (user_id, post_id)",
+        })
+        cursor.execute("INSERT INTO reaction_archive_seen (user_id, post_id) "
+                       "SELECT DISTINCT user_id, post_id FROM reaction_archive")
+
+
+def create_heartbeat(pool: Any) -> None:
+    with pool.cursor() as cursor:
+        create_tables(cursor, HEARTBEAT_TABLES)
+
+
+def binary_search_terms(pool: Any) -> None:
+    # terms that collided under the old collation were merged or refused, index again
+    with pool.cursor() as cursor:
+        for table in ("search_term", "search_posting"):
+            cursor.backend.widen_column(cursor, table, "term", TERM_COLUMN_TYPE)
+    if pool.backend.name == "mysql":
+        rebuild_search_index(pool)
+
+
+def create_reaction_pairs(pool: Any) -> None:
+    with pool.cursor() as cursor:
+        create_tables(cursor, {
+            "reaction_pair": "user_id INT(10), post_id INT(10), PRIMARY KEY (user_id, post_id)",
+        })
+    rebuild_reaction_pairs(pool)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "base tables", create_base_tables),
+    Migration(2, "feed and admin view indexes", create_feed_indexes),
+    Migration(3, "score rollups", create_rollups),
+    Migration(4, "native DATETIME/DATE timestamps", convert_timestamps),
+    Migration(5, "account and reaction lookup indexes", create_lookup_indexes),
+    Migration(6, "reaction archive tables", create_archive_tables),
+    Migration(7, "unique usernames, emails and reactions", create_unique_indexes),
+    Migration(8, "room for salted password hashes", widen_password_column),
+    Migration(9, "post search index", create_search_index),
+    Migration(10, "user category affinities", create_affinities),
+    Migration(11, "replication heartbeat", create_heartbeat),
+    Migration(12, "seen-state of archived reactions", create_archive_seen),
+    Migration(13, "binary collation of search terms", binary_search_terms),
+    Migration(14, "one reaction per user and post", create_reaction_pairs),
+]
+
+
+# ENGINE ================================================================================
+
+def current_version(pool: Any) -> int:
+    """Returns the version of the database schema, 0 for an empty database.
+
+    An up to date database answers with a single query, the version table is
+    only looked for (and created) when reading it fails. The version is cached
+    on the pool and kept current by migrate(), later calls don't query again.
+    """
+    if pool.schema_version is not None:
+        return pool.schema_version
+    query = f"SELECT COALESCE(MAX(version), 0) FROM {VERSION_TABLE}"
+    try:
+        with pool.cursor() as cursor:
+            cursor.execute(query)
+            version = cursor.fetchone()[0]
+    except pool.backend.Error:
+        with pool.cursor() as cursor:
+            create_tables(cursor, {
+                VERSION_TABLE: "version INT(10) PRIMARY KEY, description VARCHAR(100), applied_at DATETIME",
+            })
+            cursor.execute(query)
+            version = cursor.fetchone()[0]
+    pool.schema_version = version
+    return version
+
+
+def migrate(pool: Any, target: Optional[int] = None) -> List[Migration]:
+    """Applies the pending migrations in order, up to ``target`` (the latest by default).
+
+    Each migration is recorded as soon as it succeeded, a failing one stops the
+    run and is retried from the start the next time.
+
+    Args:
+        pool (Any): the connection pool
+        target (Optional[int]): version to stop at
+
+    Returns:
+        List[Migration]: the migrations applied
+    """
+    version = current_version(pool)
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version <= version or (target is not None and migration.version > target):
+            continue
+        print(f"Applying migration {migration.version}: {migration.description}...")
+        migration.apply(pool)
+        with pool.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {VERSION_TABLE} (version, description, applied_at) VALUES (%s, %s, %s)",
+                           (migration.version, migration.description, datetime.now().replace(microsecond=0)))
+        pool.schema_version = migration.version
+        applied.append(migration)
+    return applied
+
+
+def main() -> None:
+    from database import open_pool
+
+    parser = argparse.ArgumentParser(description="Schema migrations of the NexVerse database.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="show the schema version and the pending migrations")
+    migrate_parser = subparsers.add_parser("migrate", help="apply the pending migrations")
+    migrate_parser.add_argument("--to", type=int, help="stop at this version")
+    args = parser.parse_args()
+
+    pool = open_pool(size=1)
+    if args.command == "status":
+        version = current_version(pool)
+        print(f" Schema version {version} of {MIGRATIONS[-1].version}")
+        for migration in MIGRATIONS:
+            if migration.version > version:
+                print(f"  pending {migration.version}: {migration.description}")
+    else:
+        try:
+            applied = migrate(pool, args.to)
+            print(f" {len(applied)} migrations applied, schema version {current_version(pool)}")
+        except MigrationError as err:
+            print(f"ERROR: {err}")
+            print(f" Schema version {current_version(pool)}, fix the data and run the migration again")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Password hashing of NexVerse accounts.
+
+Passwords are stored as salted, memory-hard hashes together with their
+algorithm and cost parameters:
+
+    scrypt$n=16384,r=8,p=1$<salt>$<hash>
+    pbkdf2_sha256$i=600000$<salt>$<hash>
+
+salt and hash in unpadded base64. Hashes of older accounts (unsalted SHA-256 hex
+digests, or an algorithm or cost below the current one) still verify, and
+``needs_rehash`` tells the login to store a fresh hash.
+
+A verification costs tens of milliseconds of CPU on purpose. Logins run it on a
+bounded process pool (see ``verify_passwd``) so that concurrent logins don't
+queue behind each other on the interpreter of the server.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+# scrypt needs a hashlib built against OpenSSL 1.1+, PBKDF2 is always there
+ALGORITHM = "scrypt" if hasattr(hashlib, "scrypt") else "pbkdf2_sha256"
+SCRYPT_PARAMS = {"n": 2 ** 14, "r": 8, "p": 1}  # 16 MiB of memory per hash
+PBKDF2_PARAMS = {"i": 600000}
+SALT_SIZE = 16  # bytes
+HASH_SIZE = 32
+HASH_COLUMN_TYPE = "VARCHAR(255)"  # account.password
+
+# processes verifying passwords, 0 verifies in the calling thread
+VERIFY_WORKERS = int(os.environ.get("NEXVERSE_VERIFY_WORKERS", os.cpu_count() or 1))
+VERIFY_QUEUE = 4  # verifications waiting per worker before callers block
+
+T = TypeVar("T")
+
+
+def b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def b64decode(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def current_params(algorithm: str = ALGORITHM) -> Dict[str, int]:
+    return dict(SCRYPT_PARAMS if algorithm == "scrypt" else PBKDF2_PARAMS)
+
+
+def derive(algorithm: str, params: Dict[str, int], passwd: str, salt: bytes) -> bytes:
+    if algorithm == "scrypt":
+        n, r, p = params["n"], params["r"], params["p"]
+        # OpenSSL refuses anything above its default 32 MiB limit, give it room
+        return hashlib.scrypt(passwd.encode("UTF-8"), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r * p, dklen=HASH_SIZE)
+    if algorithm == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", passwd.encode("UTF-8"), salt, params["i"], dklen=HASH_SIZE)
+    raise ValueError(f"unknown password hash algorithm '{algorithm}'")
+
+
+def parse_hash(stored: str) -> Tuple[str, Dict[str, int], bytes, bytes]:
+    """Splits a stored hash into (algorithm, parameters, salt, hash)."""
+    algorithm, params, salt, digest = stored.split("$")
+    params = {key: int(value) for key, value in (item.split("=") for item in params.split(","))}
+    return algorithm, params, b64decode(salt), b64decode(digest)
+
+
+def get_legacy_passwd_hash(passwd: str) -> str:
+    """Returns the unsalted SHA256 hash of the provided password, as accounts
+    created before salted hashes stored it"""
+    return hashlib.sha256(passwd.encode("UTF-8")).hexdigest()
+
+
+def is_legacy_hash(stored: str) -> bool:
+    return "$" not in stored
+
+
+def get_passwd_hash(passwd: str, algorithm: str = ALGORITHM, params: Optional[Dict[str, int]] = None) -> str:
+    """Returns the salted hash of the provided password, ready to be stored
+
+    Args:
+        passwd (str): the password
+        algorithm (str): "scrypt" or "pbkdf2_sha256"
+        params (Optional[Dict[str, int]]): cost parameters, the current ones if None
+
+    Returns:
+        str: algorithm, parameters, salt and hash
+    """
+    params = params or current_params(algorithm)
+    salt = secrets.token_bytes(SALT_SIZE)
+    digest = derive(algorithm, params, passwd, salt)
+    encoded = ",".join(f"{key}={value}" for key, value in params.items())
+    return f"{algorithm}${encoded}${b64encode(salt)}${b64encode(digest)}"
+
+
+def check_passwd(passwd: str, stored: Optional[str]) -> bool:
+    """Returns True if the password matches the stored hash, in constant time"""
+    if not stored:
+        return False
+    if is_legacy_hash(stored):
+        return hmac.compare_digest(get_legacy_passwd_hash(passwd), stored)
+    try:
+        algorithm, params, salt, digest = parse_hash(stored)
+        return hmac.compare_digest(derive(algorithm, params, passwd, salt), digest)
+    except ValueError:
+        return False  # malformed or unknown hash
+
+
+def needs_rehash(stored: str) -> bool:
+    """Returns True if the stored hash is weaker than what get_passwd_hash() creates"""
+    if is_legacy_hash(stored):
+        return True
+    try:
+        algorithm, params, _, _ = parse_hash(stored)
+    except ValueError:
+        return True
+    return algorithm != ALGORITHM or params != current_params()
+
+
+_dummy_hash: Optional[str] = None
+_cache_key = secrets.token_bytes(32)  # per process, cache digests mean nothing elsewhere
+
+
+def dummy_hash() -> str:
+    """Returns a hash at the current cost that no password matches, verified
+    when the account doesn't exist so unknown usernames take as long as wrong
+    passwords."""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = get_passwd_hash(secrets.token_hex(16))
+    return _dummy_hash
+
+
+def cache_digest(passwd: str) -> str:
+    """Returns a fast keyed digest of the password, to key in-memory caches
+    without keeping the password itself"""
+    return hashlib.blake2b(passwd.encode("UTF-8"), key=_cache_key, digest_size=16).hexdigest()
+
+
+# VERIFICATION POOL =====================================================================
+
+class Verifier:
+    """Runs password hashing and verification on a process pool.
+
+    At most ``workers * VERIFY_QUEUE`` verifications are queued, callers beyond
+    that block until one finishes, so a burst of logins can't pile up work
+    without bound.
+
+    Args:
+        workers (int): processes, 0 verifies in the calling thread
+    """
+
+    def __init__(self, workers: int = VERIFY_WORKERS):
+        from concurrent.futures import ProcessPoolExecutor  # loads multiprocessing, only once a pool is needed
+
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        self._slots = threading.BoundedSemaphore(max(workers, 1) * VERIFY_QUEUE)
+
+    def run(self, func: Callable[..., T], *args: Any) -> T:
+        if self._executor is None:
+            return func(*args)
+        with self._slots:
+            return self._executor.submit(func, *args).result()
+
+    def verify(self, passwd: str, stored: Optional[str]) -> bool:
+        return self.run(check_passwd, passwd, stored)
+
+    def hash(self, passwd: str) -> str:
+        return self.run(get_passwd_hash, passwd)
+
+    def hash_many(self, passwds: Sequence[str]) -> List[str]:
+        """Hashes a batch of passwords spread over every worker, in order."""
+        if self._executor is None:
+            return [get_passwd_hash(passwd) for passwd in passwds]
+        chunksize = max(1, len(passwds) // (self.workers * VERIFY_QUEUE))
+        return list(self._executor.map(get_passwd_hash, passwds, chunksize=chunksize))
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+_verifier: Optional[Verifier] = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier() -> Verifier:
+    """Returns the process wide Verifier, started on first use."""
+    global _verifier
+    with _verifier_lock:
+        if _verifier is None:
+            _verifier = Verifier()
+        return _verifier
+
+
+def verify_passwd(passwd: str, stored: Optional[str]) -> bool:
+    """Checks a password against its stored hash on the verification pool"""
+    return get_verifier().verify(passwd, stored)
+
+
+def hash_passwd(passwd: str) -> str:
+    """Returns get_passwd_hash(passwd), computed on the verification pool"""
+    return get_verifier().hash(passwd)
+
+
+def hash_passwds(passwds: Sequence[str]) -> List[str]:
+    """Returns get_passwd_hash() of every password, computed in parallel on the verification pool"""
+    return get_verifier().hash_many(passwds)
+
+
+def close_verifier() -> None:
+    global _verifier
+    with _verifier_lock:
+        if _verifier is not None:
+            _verifier.close()
+            _verifier = None
@@ -0,0 +1,283 @@
+"""Statement level instrumentation of the database calls.
+
+With profiling on (NEXVERSE_PROFILE=1, or enable_profiling()) every statement
+run through a backends.Cursor is recorded under a statement name: the ``name``
+given to execute(), otherwise the module and function issuing it, such as
+``feed.fetch_unseen_page``. Per name and normalized query the profiler counts
+the calls, errors and rows returned (or changed), keeps a latency histogram and
+captures the EXPLAIN plan of the slowest call over SLOW_QUERY_MS. A call lasts
+from execute() to the next statement on the cursor or its close, the time spent
+fetching the rows is part of it.
+
+The metrics are exported as Prometheus text or JSON; the session server and
+the local client write both to Data/ on shutdown, the admin can read them with
+the "metrics" request. Statements with many calls per request are the N+1 spots.
+
+    NEXVERSE_PROFILE=1 python server.py
+    python profiler.py Data/query-metrics.json --by calls
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+PROFILE_QUERIES = os.environ.get("NEXVERSE_PROFILE", "") not in ("", "0")
+SLOW_QUERY_MS = float(os.environ.get("NEXVERSE_SLOW_QUERY_MS", 100))  # calls explained above this
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # seconds
+METRICS_FILE = "query-metrics"  # .prom and .json inside the data folder
+METRIC_PREFIX = "nexverse_query"
+
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+CALLER_SKIPPED = frozenset({"backends", "database", "contextlib", __name__})  # not statement names
+
+# normalization of a query, every call of a statement has to give the same text
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+\b")
+PLACEHOLDER_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+ROW_LIST = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)  # the queries are mostly constant strings
+def normalize(query: str) -> str:
+    """Returns the query with literals and placeholder lists collapsed, ``IN (%s, %s)`` and
+    ``IN (%s)`` both become ``IN (...)``."""
+    query = WHITESPACE.sub(" ", query).strip()
+    query = NUMBER_LITERAL.sub("N", STRING_LITERAL.sub("?", query))
+    return ROW_LIST.sub("(...)", PLACEHOLDER_LIST.sub("(...)", query))
+
+
+def caller_name() -> str:
+    """Returns "module.function" of the code running the statement."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module not in CALLER_SKIPPED:
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+class StatementStats:
+    """Counters of one statement, a name and a normalized query."""
+
+    def __init__(self, name: str, query: str):
+        self.name = name
+        self.query = query
+        self.query_id = hashlib.blake2b(query.encode(), digest_size=4).hexdigest()
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # calls per latency bucket, the last one unbounded
+        self.plan: Optional[Dict[str, Any]] = None  # EXPLAIN of the slowest call over the threshold
+
+    def record(self, seconds: float, rows: int, failed: bool) -> None:
+        self.calls += 1
+        self.errors += failed
+        self.rows += rows
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def quantile(self, fraction: float) -> float:
+        """Returns the upper bound of the bucket holding the given fraction of the calls,
+        the slowest call for the unbounded bucket."""
+        rank, seen = fraction * self.calls, 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank and seen:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name, "query_id": self.query_id, "query": self.query,
+            "calls": self.calls, "errors": self.errors, "rows": self.rows,
+            "total_ms": round(self.seconds * 1000, 3),
+            "avg_ms": round(self.seconds * 1000 / self.calls, 3) if self.calls else 0.0,
+            "p50_ms": round(self.quantile(0.5) * 1000, 3), "p95_ms": round(self.quantile(0.95) * 1000, 3),
+            "max_ms": round(self.max_seconds * 1000, 3),
+            "buckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.buckets)),
+            "plan": self.plan,
+        }
+
+
+class Call:
+    """One statement run on a cursor, from execute() until the cursor moves on."""
+
+    def __init__(self, profiler: "QueryProfiler", stats: StatementStats, query: str, params: Any,
+                 seconds: float, rows: int, explainable: bool):
+        self.profiler = profiler
+        self.stats = stats
+        self.query = query  # as sent to the driver
+        self.params = params
+        self.seconds = seconds
+        self.rows = rows
+        self.explainable = explainable
+
+    def fetched(self, rows: int, seconds: float) -> None:
+        self.rows += rows
+        self.seconds += seconds
+
+    def finish(self, cursor: Any, backend: Any) -> None:
+        """Records the call; explains it on the raw driver cursor, whose result is no longer
+        needed, if it is the slowest one over the threshold so far."""
+        plan = None
+        if self.explainable and self.profiler.wants_plan(self.stats, self.seconds):
+            try:
+                cursor.execute(backend.explain_prefix + self.query, self.params)
+                plan = [[str(value) for value in row] for row in cursor.fetchall()]
+            except backend.Error as err:  # e.g. unread rows left on an unbuffered MySQL cursor
+                plan = [[f"EXPLAIN failed: {err}"]]
+        self.profiler.record(self.stats, self.seconds, self.rows, failed=False, plan=plan, params=self.params)
+
+
+class QueryProfiler:
+    """Thread safe registry of the statements run while profiling.
+
+    Args:
+        slow_query_ms (float): calls at least this slow get their plan captured
+    """
+
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS):
+        self.slow_seconds = slow_query_ms / 1000
+        self._statements: Dict[Tuple[str, str], StatementStats] = {}
+        self._lock = threading.Lock()
+
+    def statement(self, query: str, name: Optional[str] = None) -> StatementStats:
+        """Returns the counters of a statement, created on its first call."""
+        key = (name or caller_name(), normalize(query))
+        stats = self._statements.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._statements.setdefault(key, StatementStats(*key))
+        return stats
+
+    def start(self, stats: StatementStats, query: str, params: Any, seconds: float, rows: int,
+              single: bool = True) -> Call:
+        """Returns the call of a statement that just ran, only single statements get explained."""
+        explainable = single and query.lstrip()[:8].upper().startswith(EXPLAINABLE)
+        return Call(self, stats, query, params, seconds, rows, explainable)
+
+    def wants_plan(self, stats: StatementStats, seconds: float) -> bool:
+        return seconds >= self.slow_seconds and (stats.plan is None or seconds > stats.plan["ms"] / 1000)
+
+    def record(self, stats: StatementStats, seconds: float, rows: int, failed: bool,
+               plan: Optional[List[List[str]]] = None, params: Any = None) -> None:
+        with self._lock:
+            stats.record(seconds, rows, failed)
+            if plan is not None:
+                stats.plan = {"ms": round(seconds * 1000, 3), "params": [str(value) for value in params or ()],
+                              "rows": plan}
+
+    def statements(self) -> List[StatementStats]:
+        """The statements recorded so far, most total time first."""
+        with self._lock:
+            return sorted(self._statements.values(), key=lambda stats: stats.seconds, reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements.clear()
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            statements = [stats.as_dict() for stats in self._statements.values()]
+        return {"slow_query_ms": self.slow_seconds * 1000,
+                "statements": sorted(statements, key=lambda entry: entry["total_ms"], reverse=True)}
+
+    def to_prometheus(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {METRIC_PREFIX}_duration_seconds Latency of the database statements, fetching included.",
+            f"# TYPE {METRIC_PREFIX}_duration_seconds histogram",
+        ]
+        statements = self.statements()
+        for stats in statements:
+            labels = f'statement="{stats.name}",query_id="{stats.query_id}"'
+            cumulative = 0
+            for bound, count in zip([*map(str, LATENCY_BUCKETS), "+Inf"], stats.buckets):
+                cumulative += count
+                lines.append(f'{METRIC_PREFIX}_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{METRIC_PREFIX}_duration_seconds_sum{{{labels}}} {stats.seconds:.6f}")
+            lines.append(f"{METRIC_PREFIX}_duration_seconds_count{{{labels}}} {stats.calls}")
+        for metric, attribute, help_text in (("rows_total", "rows", "Rows returned, or changed by writes."),
+                                             ("errors_total", "errors", "Statements that raised.")):
+            lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} counter")
+            for stats in statements:
+                lines.append(f'{METRIC_PREFIX}_{metric}{{statement="{stats.name}",query_id="{stats.query_id}"}} '
+                             f'{getattr(stats, attribute)}')
+        return "\n".join(lines) + "\n"
+
+
+query_profiler: Optional[QueryProfiler] = QueryProfiler() if PROFILE_QUERIES else None
+
+
+def enable_profiling(slow_query_ms: float = SLOW_QUERY_MS) -> QueryProfiler:
+    """Starts recording the statements of every cursor, returns the profiler."""
+    global query_profiler
+    if query_profiler is None:
+        query_profiler = QueryProfiler(slow_query_ms)
+    return query_profiler
+
+
+def disable_profiling() -> None:
+    global query_profiler
+    query_profiler = None
+
+
+def write_metrics(basename: str = METRICS_FILE) -> List[str]:
+    """Writes the metrics to <basename>.prom and <basename>.json in the data folder.
+
+    Returns:
+        List[str]: the paths written, none if profiling is off
+    """
+    from exporter import data_path
+
+    if query_profiler is None:
+        return []
+    paths = []
+    for extension, text in (("prom", query_profiler.to_prometheus()),
+                            ("json", json.dumps(query_profiler.to_json(), indent=2))):
+        path = data_path(f"{basename}.{extension}")
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(path + ".tmp", path)
+        paths.append(path)
+    return paths
+
+
+def print_statements(statements: Sequence[Dict[str, Any]], by: str = "total_ms", top: int = 20) -> None:
+    print(f"{'statement':<42}{'query':>10}{'calls':>9}{'rows':>10}{'total ms':>11}{'avg ms':>9}"
+          f"{'p95 ms':>9}{'max ms':>9}")
+    for entry in sorted(statements, key=lambda entry: entry[by], reverse=True)[:top]:
+        print(f"{entry['name'][:41]:<42}{entry['query_id']:>10}{entry['calls']:>9}{entry['rows']:>10}"
+              f"{entry['total_ms']:>11.1f}{entry['avg_ms']:>9.2f}{entry['p95_ms']:>9.2f}{entry['max_ms']:>9.2f}")
+        if entry["plan"]:
+            print(f"    plan of a {entry['plan']['ms']:.1f}ms call: {entry['query'][:100]}")
+            for row in entry["plan"]["rows"]:
+                print(f"      {' | '.join(row)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Print the costliest statements of a JSON metrics file.")
+    parser.add_argument("path", nargs="?", default=os.path.join("Data", f"{METRICS_FILE}.json"))
+    parser.add_argument("--by", choices=["total_ms", "calls", "rows", "max_ms", "p95_ms", "errors"], default="total_ms")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8") as file:
+        metrics = json.load(file)
+    print_statements(metrics["statements"], args.by, args.top)
+
+
+if __name__ == "__main__":
+    main()
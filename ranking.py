@@ -0,0 +1,148 @@
+"""Ranked, personalized feed.
+
+The chronological feed (feed.py) shows every unseen post newest first. The
+ranked feed scores the newest RANK_CANDIDATES unseen posts and returns the best
+page:
+
+    score = AFFINITY_WEIGHT * affinity of the user for the post's category
+          + QUALITY_WEIGHT  * smoothed average reaction score of the post
+          + RECENCY_WEIGHT  * 2 ** (-age / RECENCY_HALF_LIFE)
+
+Every term lies in [-1, 1] (recency in [0, 1]). The affinities come from the
+user_affinity rollup and the post scores from post_score, both kept current by
+the reaction write paths (see rollups.py), so ranking reads no reactions beyond
+the anti-join selecting the unseen posts. Scoring is vectorized with NumPy and
+the page is picked with a partial sort (argpartition), never sorting every
+candidate.
+"""
+from datetime import datetime
+from typing import Any, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ingest import placeholders
+from validators import CATEGORY_NAMES
+
+CATEGORY_ORDER = sorted(CATEGORY_NAMES)  # position of a category in the affinity vectors
+RANK_CANDIDATES = 5000  # newest unseen posts scored per page
+RANKED_PAGE_SIZE = 20
+
+AFFINITY_WEIGHT = 0.5
+QUALITY_WEIGHT = 0.3
+RECENCY_WEIGHT = 0.2
+NEUTRAL_SCORE = 3  # the middle of the 1-5 reaction scale
+SCORE_PRIOR = 5  # reactions worth of neutral score mixed into every average
+RECENCY_HALF_LIFE = 3 * 24 * 3600  # seconds
+
+# same selection as feed.UNSEEN_POSTS_QUERY, with the rollup columns of each post
+CANDIDATES_QUERY = """
+SELECT p.post_id, p.category, p.timestamp, COALESCE(ps.total_score, 0), COALESCE(ps.reaction_count, 0)
+FROM post p
+LEFT JOIN post_score ps ON ps.post_id = p.post_id
+WHERE NOT EXISTS (
+    SELECT 1 FROM reaction r WHERE r.user_id = %s AND r.post_id = p.post_id
+)
+AND NOT EXISTS (
+    SELECT 1 FROM reaction_archive_seen a WHERE a.user_id = %s AND a.post_id = p.post_id
+)
+ORDER BY p.timestamp DESC, p.post_id DESC
+LIMIT %s
+"""
+
+
+class Candidates(NamedTuple):
+    """Column arrays of the posts to rank, one entry per post."""
+    post_ids: np.ndarray  # int64
+    categories: np.ndarray  # int64 position in CATEGORY_ORDER
+    timestamps: np.ndarray  # float64 epoch seconds of the stored (local) time
+    total_scores: np.ndarray  # float64
+    reaction_counts: np.ndarray  # float64
+
+
+def smoothed_score(total_scores: np.ndarray, reaction_counts: np.ndarray) -> np.ndarray:
+    """Average reaction scores pulled towards neutral by SCORE_PRIOR, scaled to [-1, 1]."""
+    average = (total_scores + NEUTRAL_SCORE * SCORE_PRIOR) / (reaction_counts + SCORE_PRIOR)
+    return (average - NEUTRAL_SCORE) / (5 - NEUTRAL_SCORE)
+
+
+def load_affinity(cursor: Any, user_id: int) -> np.ndarray:
+    """Returns the affinity of the user for each category of CATEGORY_ORDER, 0 for unknown."""
+    cursor.execute("SELECT category, total_score, reaction_count FROM user_affinity WHERE user_id = %s", (user_id,))
+    totals, counts = np.zeros(len(CATEGORY_ORDER)), np.zeros(len(CATEGORY_ORDER))
+    for category, total_score, reaction_count in cursor.fetchall():
+        if category in CATEGORY_NAMES:
+            position = CATEGORY_ORDER.index(category)
+            totals[position], counts[position] = total_score, reaction_count
+    return smoothed_score(totals, counts)
+
+
+def to_candidates(rows: List[tuple]) -> Candidates:
+    post_ids, categories, timestamps, totals, counts = zip(*rows) if rows else ((),) * 5
+    positions = {category: position for position, category in enumerate(CATEGORY_ORDER)}
+    return Candidates(
+        np.array(post_ids, dtype=np.int64),
+        np.array([positions.get(category, 0) for category in categories], dtype=np.int64),
+        # ISO text (SQLite) and datetimes (MySQL) both parse to datetime64
+        np.array(timestamps, dtype="datetime64[s]").astype(np.int64).astype(np.float64),
+        np.array(totals, dtype=np.float64),
+        np.array(counts, dtype=np.float64),
+    )
+
+
+def fetch_candidates(cursor: Any, user_id: int, limit: int = RANK_CANDIDATES) -> Candidates:
+    """Fetches the newest ``limit`` posts the user hasn't reacted to."""
+    cursor.execute(CANDIDATES_QUERY, (user_id, user_id, limit))
+    return to_candidates(cursor.fetchall())
+
+
+def score_candidates(candidates: Candidates, affinity: np.ndarray, now: float) -> np.ndarray:
+    """Returns the ranking score of every candidate, higher is better."""
+    age = np.maximum(now - candidates.timestamps, 0.0)
+    return (AFFINITY_WEIGHT * affinity[candidates.categories]
+            + QUALITY_WEIGHT * smoothed_score(candidates.total_scores, candidates.reaction_counts)
+            + RECENCY_WEIGHT * np.exp2(-age / RECENCY_HALF_LIFE))
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the positions of the k best scores, best first, in O(n + k log k)."""
+    if k <= 0 or not len(scores):
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        best = np.argpartition(-scores, k - 1)[:k]
+    else:
+        best = np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def fetch_ranked_page(cursor: Any, user_id: int, page_size: int = RANKED_PAGE_SIZE,
+                      exclude: Optional[Iterable[int]] = None,
+                      now: Optional[float] = None) -> List[Tuple[int, str, Any]]:
+    """Fetches the best posts for the user among the newest unseen ones.
+
+    Args:
+        cursor (Any): the cursor object
+        user_id (int): user whose feed is being built
+        page_size (int): maximum number of posts returned
+        exclude (Optional[Iterable[int]]): post IDs already shown, reactions still
+            in the reaction buffer aren't visible to the anti-join yet
+        now (Optional[float]): epoch seconds of the local time the recency is measured
+            from, timestamps are stored in local time
+
+    Returns:
+        List[Tuple[int, str, Any]]: (post_id, content, timestamp) rows, best first
+    """
+    exclude = list(exclude or ())
+    candidates = fetch_candidates(cursor, user_id, RANK_CANDIDATES + len(exclude))
+    if exclude:
+        keep = ~np.isin(candidates.post_ids, np.array(exclude, dtype=np.int64))
+        candidates = Candidates(*(column[keep] for column in candidates))
+    if now is None:
+        now = float(np.datetime64(datetime.now().replace(microsecond=0)).astype("datetime64[s]").astype(np.int64))
+    scores = score_candidates(candidates, load_affinity(cursor, user_id), now)
+    post_ids = [int(post_id) for post_id in candidates.post_ids[top_k(scores, page_size)]]
+    if not post_ids:
+        return []
+
+    cursor.execute(f"SELECT post_id, content, timestamp FROM post WHERE post_id IN ({placeholders(len(post_ids))})", post_ids)
+    posts = {row[0]: row for row in cursor.fetchall()}
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
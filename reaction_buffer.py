@@ -0,0 +1,256 @@
+"""Write-behind buffer for reactions, the highest volume write of the application.
+
+Reactions of every session are collected in memory, deduplicated per
+(post_id, user_id) and flushed by a background thread with multi-row INSERTs,
+one transaction per flush, either once ``max_batch`` reactions are waiting or
+every ``flush_interval`` seconds. The rollups and user affinities are updated in
+the same transaction.
+
+Durability is configurable:
+
+- "group": ``add`` returns once the reaction is appended to the local spool;
+  the spool survives a crash or restart of the process and is replayed when
+  the next buffer starts. A reaction shows up in feeds and rollups after the
+  next flush.
+- "sync": ``add`` blocks until the flush holding the reaction is committed. The
+  flusher starts as soon as a reaction waits, the reactions arriving while a
+  flush runs share the next commit (group commit).
+"""
+import glob
+import json
+import os
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ingest import placeholders, reacted_pairs
+from rollups import record_reaction_totals, record_user_reactions
+from validators import parse_timestamp
+
+DURABILITY_MODES = ("group", "sync")
+DEFAULT_MAX_BATCH = 500  # reactions per flush, and rows per INSERT statement
+DEFAULT_FLUSH_INTERVAL = 0.2  # seconds
+SPOOL_FOLDER = os.environ.get("NEXVERSE_SPOOL_DIR", "spool")
+SPOOL_PATTERN = "reaction-spool-*.jsonl"
+
+# (post_id, user_id): (reaction_score, timestamp)
+Batch = Dict[Tuple[int, int], Tuple[int, datetime]]
+# (post_id, user_id, reaction_score, timestamp) as inserted
+Row = Tuple[int, int, int, datetime]
+
+
+def segment_number(path: str) -> int:
+    return int(os.path.basename(path)[len("reaction-spool-"):-len(".jsonl")])
+
+
+class ReactionBuffer:
+    """Collects reactions and writes them to the database in batches.
+
+    One buffer per spool folder, two processes must not share a spool.
+
+    Args:
+        pool (Any): the connection pool
+        durability (str): one of DURABILITY_MODES
+        max_batch (int): pending reactions that trigger a flush
+        flush_interval (float): seconds between two flushes
+        spool_folder (Optional[str]): where the spool segments are kept, SPOOL_FOLDER if None
+        on_write (Optional[Callable[[List[Row]], None]]): called with the rows of
+            every committed flush, on the flusher thread
+    """
+
+    def __init__(self, pool: Any, durability: str = "group", max_batch: int = DEFAULT_MAX_BATCH,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, spool_folder: Optional[str] = None,
+                 on_write: Optional[Callable[[List[Row]], None]] = None):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"unknown durability '{durability}'")
+        self.pool = pool
+        self.durability = durability
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.spool_folder = spool_folder or SPOOL_FOLDER
+        self.on_write = on_write
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._pending: Batch = {}
+        self._done: Future = Future()  # resolved when the pending reactions are committed
+        self._segments: List[str] = []  # spool segments whose reactions aren't committed yet
+        self._spool = None
+        self._spool_path = ""
+        self._closed = False
+        self.added = self.duplicates = self.flushed = self.flushes = self.failures = 0
+
+        os.makedirs(self.spool_folder, exist_ok=True)
+        recovered = self.recover()
+        self._next_segment = max((segment_number(path) for path in self._segments), default=-1) + 1
+        self._open_segment()
+        if recovered:
+            print(f" {recovered} spooled reactions recovered")
+        self._thread = threading.Thread(target=self._run, name="reaction-buffer", daemon=True)
+        self._thread.start()
+
+    # SPOOL =============================================================================
+
+    def recover(self) -> int:
+        """Puts the reactions of the spool segments left by a previous process back
+        in the buffer, returns their number. Reactions already stored are dropped
+        at flush time, so replaying a segment twice is harmless."""
+        for path in sorted(glob.glob(os.path.join(self.spool_folder, SPOOL_PATTERN))):
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        post_id, user_id, score, timestamp = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by the crash
+                    self._pending.setdefault((post_id, user_id), (score, parse_timestamp(timestamp)))
+            self._segments.append(path)
+        return len(self._pending)
+
+    def _open_segment(self) -> None:
+        if self._spool is not None:
+            self._spool.close()
+            self._segments.append(self._spool_path)
+        self._spool_path = os.path.join(self.spool_folder, f"reaction-spool-{self._next_segment:06d}.jsonl")
+        self._next_segment += 1
+        self._spool = open(self._spool_path, "a", encoding="utf-8")
+
+    # BUFFERING =========================================================================
+
+    def add(self, post_id: int, user_id: int, reaction_score: int, timestamp: Optional[datetime] = None) -> None:
+        """Buffers a reaction; a second reaction of the user to the same post is dropped.
+
+        In "sync" mode this waits for the flush and raises its error if it failed.
+        """
+        timestamp = timestamp or datetime.now().replace(microsecond=0)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("the reaction buffer is closed")
+            key = (post_id, user_id)
+            if key in self._pending:
+                self.duplicates += 1
+            else:
+                self._pending[key] = (reaction_score, timestamp)
+                self._spool.write(json.dumps([post_id, user_id, reaction_score, timestamp.isoformat(" ")]) + "\n")
+                self._spool.flush()  # in the OS from here on, a crash of the process doesn't lose it
+                self.added += 1
+                if len(self._pending) >= self.max_batch or self.durability == "sync":
+                    self._cond.notify()
+            done = self._done
+        if self.durability == "sync":
+            done.result()
+
+    def _flush_due(self) -> bool:
+        if self.durability == "sync" and self._pending:
+            return True
+        return self._closed or len(self._pending) >= self.max_batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(self._flush_due, timeout=self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self) -> int:
+        """Writes the pending reactions in one transaction, returns the number stored.
+
+        A failed flush is retried with the next one in "group" mode, in "sync"
+        mode its waiting callers get the error instead.
+        """
+        with self._flush_lock:
+            with self._cond:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                done, self._done = self._done, Future()
+                self._open_segment()  # later reactions go to a new segment
+                segments, self._segments = self._segments, []
+
+            try:
+                stored = self.write(batch)
+            except Exception as err:
+                self.failures += 1
+                print(f"ERROR: reaction flush failed: {err}")
+                if self.durability == "group":
+                    with self._cond:
+                        for key, value in batch.items():
+                            self._pending.setdefault(key, value)
+                        self._segments = segments + self._segments
+                else:
+                    self._remove(segments)
+                done.set_exception(err)
+                return 0
+
+            self._remove(segments)
+            self.flushed += stored
+            self.flushes += 1
+            done.set_result(stored)
+            return stored
+
+    def write(self, batch: Batch) -> int:
+        """Inserts the reactions not stored yet and updates the rollups."""
+        keys = list(batch)
+        with self.pool.cursor() as cursor:
+            stored = set()
+            for start in range(0, len(keys), self.max_batch):
+                stored.update(reacted_pairs(cursor, keys[start:start + self.max_batch]))
+
+            rows: List[Row] = []
+            totals = {}
+            for (post_id, user_id), (score, timestamp) in batch.items():
+                if (post_id, user_id) in stored:
+                    continue
+                rows.append((post_id, user_id, score, timestamp))
+                total, count = totals.get(post_id, (0, 0))
+                totals[post_id] = (total + score, count + 1)
+
+            for start in range(0, len(rows), self.max_batch):
+                chunk = rows[start:start + self.max_batch]
+                # a pair claimed since the lookup fails the flush, the retry leaves it out
+                cursor.execute(f"INSERT INTO reaction_pair (user_id, post_id) VALUES {placeholders(len(chunk), 2)}",
+                               [value for post_id, user_id, _, _ in chunk for value in (user_id, post_id)])
+                cursor.execute(
+                    "INSERT INTO reaction (post_id, user_id, reaction_score, timestamp) "
+                    f"VALUES {placeholders(len(chunk), 4)}",
+                    [value for row in chunk for value in row],
+                )
+            record_reaction_totals(cursor, totals)
+            record_user_reactions(cursor, [(user_id, post_id, score) for post_id, user_id, score, _ in rows])
+        if self.on_write is not None and rows:
+            try:
+                self.on_write(rows)
+            except Exception as err:  # the reactions are stored, don't retry them
+                print(f"ERROR: reaction listener failed: {err}")
+        return len(rows)
+
+    def _remove(self, segments: List[str]) -> None:
+        for path in segments:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def close(self) -> None:
+        """Flushes what is left and stops the flusher; the spool is kept if that flush fails."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        with self._cond:
+            self._spool.close()
+            if not self._pending and not self._segments:
+                self._remove([self._spool_path])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "durability": self.durability,
+                "pending": len(self._pending),
+                "added": self.added,
+                "duplicates": self.duplicates,
+                "flushed": self.flushed,
+                "flushes": self.flushes,
+                "failures": self.failures,
+                "avg_batch": self.flushed / self.flushes if self.flushes else 0.0,
+            }
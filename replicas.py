@@ -0,0 +1,248 @@
+"""Primary/replica routing of the database traffic.
+
+With replicas configured (NEXVERSE_REPLICAS, comma separated) open_pool()
+returns a ReplicaRouter instead of a single ConnectionPool. The router holds a
+pool per server and has the pool's interface, so every database function works
+with either:
+
+- ``cursor(readonly=True)`` is served by a replica, every other checkout by the
+  primary. Writes and the reads that have to see them (signup, login,
+  create_post, reactions, profiles) never pass readonly; the feeds, search,
+  admin view, exports, charts and analytics do.
+- A monitor thread writes a heartbeat row to the primary every
+  HEARTBEAT_INTERVAL and reads it back from each replica, how far behind the
+  replica's row is gives its lag. Replicas lagging more than ``max_lag`` are
+  skipped until they catch up.
+- Reads rotate over the replicas that are current. A replica whose connection
+  fails is left out for RETRY_INTERVAL; when none is usable the primary serves
+  the read, and when the primary fails too a lagging replica does.
+
+For MySQL a replica is "host[:port]", with the credentials and database name of
+utils. For SQLite it is the name of another database file in the same folder,
+enough to try the routing locally: nothing replicates between the files, the
+copy's lag grows until it is skipped.
+
+    NEXVERSE_REPLICAS=127.0.0.1:3307,127.0.0.1:3308 python server.py
+    python replicas.py status
+"""
+import argparse
+import itertools
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from time import monotonic, time
+from typing import Any, Dict, Iterator, List, Optional
+
+from database import ConnectionPool, PoolError
+
+MAX_REPLICA_LAG = float(os.environ.get("NEXVERSE_MAX_REPLICA_LAG", 5))  # seconds
+HEARTBEAT_INTERVAL = 1.0  # seconds between two lag checks
+RETRY_INTERVAL = 10.0  # seconds a failed replica is left out
+
+HEARTBEAT_TABLE = "replication_heartbeat"
+HEARTBEAT_TABLES = {
+    HEARTBEAT_TABLE: "id INT(10) PRIMARY KEY, beat DOUBLE",  # one row, epoch seconds of the last beat
+}
+
+
+class Replica:
+    """A replica's pool and what the router knows about it."""
+
+    def __init__(self, address: str, pool: ConnectionPool):
+        self.address = address
+        self.pool = pool
+        self.lag: Optional[float] = None  # seconds behind the primary, None until measured
+        self.down_until = 0.0  # monotonic time before which the replica isn't used
+        self.failures = 0
+        self.reads = 0
+
+    @property
+    def healthy(self) -> bool:
+        return monotonic() >= self.down_until
+
+    def current(self, max_lag: float) -> bool:
+        return self.healthy and self.lag is not None and self.lag <= max_lag
+
+    def failed(self) -> None:
+        self.down_until = monotonic() + RETRY_INTERVAL
+        self.failures += 1
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.pool.stats()
+        return {"address": self.address, "healthy": self.healthy, "lag": self.lag, "reads": self.reads,
+                "failures": self.failures, "checkouts": pool["checkouts"], "open": pool["open"]}
+
+
+def read_heartbeat(pool: ConnectionPool) -> Optional[float]:
+    with pool.cursor() as cursor:
+        cursor.execute(f"SELECT beat FROM {HEARTBEAT_TABLE} WHERE id = 1")
+        row = cursor.fetchone()
+    return float(row[0]) if row else None
+
+
+def write_heartbeat(pool: ConnectionPool, beat: float) -> None:
+    with pool.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {HEARTBEAT_TABLE} (id, beat) VALUES (1, %s) "
+                       f"{cursor.backend.upsert_clause('id', 'beat = %s')}", (beat, beat))
+
+
+class ReplicaRouter:
+    """Routes the readonly checkouts to replicas and everything else to the primary.
+
+    Args:
+        primary (ConnectionPool): pool of the primary, every write goes there
+        replicas (Dict[str, ConnectionPool]): pool of each replica by address
+        max_lag (float): seconds a replica may be behind and still serve reads
+        heartbeat_interval (float): seconds between two lag checks
+    """
+
+    def __init__(self, primary: ConnectionPool, replicas: Dict[str, ConnectionPool],
+                 max_lag: float = MAX_REPLICA_LAG, heartbeat_interval: float = HEARTBEAT_INTERVAL):
+        self.primary = primary
+        self.replicas = [Replica(address, pool) for address, pool in replicas.items()]
+        self.max_lag = max_lag
+        self.heartbeat_interval = heartbeat_interval
+        self.backend = primary.backend
+        self.size = primary.size
+        self.schema_version: Optional[int] = None  # cached by migrations.current_version()
+        self.primary_reads = 0  # readonly checkouts the primary served
+
+        self._turn = itertools.count()
+        self._lock = threading.Lock()  # read counters
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # MONITOR ===========================================================================
+
+    def check(self) -> None:
+        """Measures the lag of every replica, then writes the next heartbeat.
+
+        A replica's lag is how far its heartbeat is behind the one on the
+        primary, measured to HEARTBEAT_INTERVAL. Until the heartbeat table
+        exists (see migrations.py) no lag is known and the primary serves
+        every read.
+        """
+        try:
+            beat = read_heartbeat(self.primary)
+        except (self.primary.backend.Error, PoolError):
+            return  # the table isn't there yet, or the primary is down
+        for replica in self.replicas:
+            try:
+                replica_beat = read_heartbeat(replica.pool)
+            except (replica.pool.backend.Error, PoolError):
+                replica.lag = None
+                replica.failed()
+                continue
+            if beat is None or replica_beat is None:
+                replica.lag = None
+            else:
+                replica.lag = max(beat - replica_beat, 0.0)
+                replica.down_until = 0.0  # answered, whatever happened before
+        try:
+            write_heartbeat(self.primary, time())
+        except (self.primary.backend.Error, PoolError):
+            pass
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            self.check()
+
+    def start(self) -> None:
+        """Runs a first check, then checks every heartbeat_interval on a daemon thread."""
+        self.check()
+        self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+        self._thread.start()
+
+    # ROUTING ===========================================================================
+
+    def read_order(self) -> List[Any]:
+        """Pools to try for a read, best first: the current replicas in turn, the
+        primary, then the healthy replicas lagging behind."""
+        current = [replica for replica in self.replicas if replica.current(self.max_lag)]
+        if current:
+            start = next(self._turn) % len(current)
+            current = current[start:] + current[:start]
+        lagging = [replica for replica in self.replicas if replica.healthy and replica not in current]
+        return [*current, None, *lagging]  # None stands for the primary
+
+    @contextmanager
+    def cursor(self, commit: bool = True, buffered: bool = True, readonly: bool = False) -> Iterator[Any]:
+        """Yields a cursor like ConnectionPool.cursor(), on a replica if readonly.
+
+        A server whose connection can't be checked out is skipped for the next
+        one in read_order(); errors raised inside the ``with`` block aren't
+        retried, a replica failing with a connection error is left out for
+        RETRY_INTERVAL.
+        """
+        if not readonly:
+            with self.primary.cursor(commit, buffered) as cursor:
+                yield cursor
+            return
+
+        with ExitStack() as stack:
+            cursor, replica, error = None, None, None
+            for replica in self.read_order():
+                pool = self.primary if replica is None else replica.pool
+                try:
+                    cursor = stack.enter_context(pool.cursor(commit, buffered))
+                    break
+                except (pool.backend.Error, PoolError) as err:
+                    error = err
+                    if replica is not None:
+                        replica.failed()
+            if cursor is None:
+                raise error
+            with self._lock:
+                if replica is None:
+                    self.primary_reads += 1
+                else:
+                    replica.reads += 1
+            try:
+                yield cursor
+            except BaseException as err:
+                if replica is not None and isinstance(err, replica.pool.backend.connection_errors):
+                    replica.failed()
+                raise
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Borrows a connection of the primary, see ConnectionPool.connection()."""
+        with self.primary.connection() as conn:
+            yield conn
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the primary's pool statistics with the state of the replicas."""
+        return {**self.primary.stats(), "primary_reads": self.primary_reads,
+                "replicas": [replica.stats() for replica in self.replicas]}
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.primary.close()
+        for replica in self.replicas:
+            replica.pool.close()
+
+
+def main() -> None:
+    from database import open_pool
+
+    parser = argparse.ArgumentParser(description="Show the lag and health of the replicas.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="check every replica once")
+    args = parser.parse_args()
+
+    router = open_pool(size=1)
+    if isinstance(router, ConnectionPool):
+        print(" No replicas configured, set NEXVERSE_REPLICAS")
+        return
+    if args.command == "status":
+        for replica in router.replicas:
+            lag = "unknown" if replica.lag is None else f"{replica.lag:.1f}s"
+            state = "current" if replica.current(router.max_lag) else "healthy, lagging" if replica.healthy else "down"
+            print(f" {replica.address:<30} lag {lag:<10} {state}")
+    router.close()
+
+
+if __name__ == "__main__":
+    main()
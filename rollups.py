@@ -0,0 +1,176 @@
+import argparse
+from typing import Any, Dict, Iterable, Tuple
+
+# running SUM/COUNT of reaction_score, kept current by the post and reaction write
+# paths so the analytics never have to aggregate the reaction table
+ROLLUP_TABLES = {
+    "post_score": "post_id INT(10) PRIMARY KEY, category VARCHAR(20), total_score BIGINT DEFAULT 0, reaction_count INT(10) DEFAULT 0",
+    "category_score": "category VARCHAR(20) PRIMARY KEY, total_score BIGINT DEFAULT 0, reaction_count INT(10) DEFAULT 0",
+}
+
+
+def record_post(cursor: Any, post_id: int, category: str) -> None:
+    """Adds the empty rollup row of a new post, call it in the post's transaction."""
+    cursor.execute(
+        "INSERT INTO post_score (post_id, category, total_score, reaction_count) VALUES (%s, %s, 0, 0)",
+        (post_id, category),
+    )
+
+
+# (score sum, reaction count, post_id, score sum, reaction count) per row, the upsert
+# clause comes from the backend
+POST_SCORE_UPSERT = """
+INSERT INTO post_score (post_id, category, total_score, reaction_count)
+SELECT post_id, category, %s, %s FROM post WHERE post_id = %s
+{upsert}
+"""
+CATEGORY_SCORE_UPSERT = """
+INSERT INTO category_score (category, total_score, reaction_count)
+SELECT category, %s, %s FROM post WHERE post_id = %s
+{upsert}
+"""
+INCREMENT_SCORES = "total_score = total_score + %s, reaction_count = reaction_count + %s"
+
+
+def record_reaction_totals(cursor: Any, totals: Dict[int, Tuple[int, int]]) -> None:
+    """Adds (score sum, reaction count) per post to both rollups, call it in the
+    transaction that inserted the reactions."""
+    rows = [(total, count, post_id, total, count) for post_id, (total, count) in totals.items()]
+    if rows:
+        backend = cursor.backend
+        cursor.executemany(POST_SCORE_UPSERT.format(upsert=backend.upsert_clause("post_id", INCREMENT_SCORES)), rows)
+        cursor.executemany(CATEGORY_SCORE_UPSERT.format(upsert=backend.upsert_clause("category", INCREMENT_SCORES)), rows)
+
+
+def record_reaction(cursor: Any, post_id: int, reaction_score: int) -> None:
+    """Adds a reaction to the post and category rollups, call it in the reaction's transaction."""
+    record_reaction_totals(cursor, {post_id: (reaction_score, 1)})
+
+
+# running SUM/COUNT of reaction_score per user and category, the affinities the
+# ranked feed (ranking.py) personalizes with
+AFFINITY_TABLES = {
+    "user_affinity": "user_id INT(10), category VARCHAR(20), total_score BIGINT DEFAULT 0, "
+                     "reaction_count INT(10) DEFAULT 0, PRIMARY KEY (user_id, category)",
+}
+# (user_id, score, post_id, score) per row
+AFFINITY_UPSERT = """
+INSERT INTO user_affinity (user_id, category, total_score, reaction_count)
+SELECT %s, category, %s, 1 FROM post WHERE post_id = %s
+{upsert}
+"""
+INCREMENT_AFFINITY = "total_score = total_score + %s, reaction_count = reaction_count + 1"
+
+
+def record_user_reactions(cursor: Any, reactions: Iterable[Tuple[int, int, int]]) -> None:
+    """Adds (user_id, post_id, reaction_score) reactions to the user affinities,
+    call it in the transaction that inserted the reactions."""
+    rows = [(user_id, score, post_id, score) for user_id, post_id, score in reactions]
+    if rows:
+        upsert = cursor.backend.upsert_clause("user_id, category", INCREMENT_AFFINITY)
+        cursor.executemany(AFFINITY_UPSERT.format(upsert=upsert), rows)
+
+
+def record_reaction_pairs(cursor: Any, pairs: Iterable[Tuple[int, int]]) -> None:
+    """Claims the (user_id, post_id) pairs of new reactions, call it in the transaction
+    inserting them; a pair reacted to already fails with the backend's IntegrityError.
+
+    reaction_pair (migration 14) holds the pair of every reaction stored, in the
+    hot table or archived, so its primary key keeps one reaction per user and
+    post whether or not the reaction table is partitioned.
+    """
+    pairs = list(pairs)
+    if pairs:
+        cursor.executemany("INSERT INTO reaction_pair (user_id, post_id) VALUES (%s, %s)", pairs)
+
+
+def rebuild_reaction_pairs(pool: Any) -> None:
+    """Fills reaction_pair again from the hot and the archived reactions."""
+    with pool.cursor() as cursor:
+        cursor.execute("DELETE FROM reaction_pair")
+        cursor.execute("INSERT INTO reaction_pair (user_id, post_id) "
+                       "SELECT user_id, post_id FROM reaction "
+                       "UNION SELECT user_id, post_id FROM reaction_archive_seen")
+
+
+# score totals of the archived reactions per post, see archive.py
+ARCHIVE_TOTALS = """
+SELECT post_id, SUM(total_score) AS total_score, SUM(reaction_count) AS reaction_count
+FROM reaction_archive_summary
+GROUP BY post_id
+"""
+NO_ARCHIVE = "SELECT NULL AS post_id, 0 AS total_score, 0 AS reaction_count"
+
+
+def rebuild_rollups(pool: Any) -> None:
+    """Recomputes both rollups from the posts, the hot reactions and the archive
+    summaries to repair any drift.
+
+    Runs in one transaction, the INSERT ... SELECT holds shared locks on the
+    reactions it reads so no concurrent reaction is lost while rebuilding.
+    """
+    with pool.cursor() as cursor:
+        # databases still being migrated have no archive yet
+        archive = ARCHIVE_TOTALS if cursor.backend.table_exists(cursor, "reaction_archive_summary") else NO_ARCHIVE
+        cursor.execute("DELETE FROM post_score")
+        cursor.execute(f"""
+        INSERT INTO post_score (post_id, category, total_score, reaction_count)
+        SELECT p.post_id, p.category, COALESCE(h.total_score, 0) + COALESCE(a.total_score, 0),
+               COALESCE(h.reaction_count, 0) + COALESCE(a.reaction_count, 0)
+        FROM post p
+        LEFT JOIN (
+            SELECT post_id, SUM(reaction_score) AS total_score, COUNT(*) AS reaction_count
+            FROM reaction
+            GROUP BY post_id
+        ) h ON h.post_id = p.post_id
+        LEFT JOIN ({archive}) a ON a.post_id = p.post_id
+        """)
+        posts = cursor.rowcount
+        cursor.execute("DELETE FROM category_score")
+        cursor.execute("""
+        INSERT INTO category_score (category, total_score, reaction_count)
+        SELECT category, SUM(total_score), SUM(reaction_count)
+        FROM post_score
+        GROUP BY category
+        """)
+        categories = cursor.rowcount
+    print(f" Rollups rebuilt: {posts} posts, {categories} categories")
+    with pool.cursor() as cursor:
+        has_affinities = cursor.backend.table_exists(cursor, "user_affinity")
+    if has_affinities:
+        rebuild_affinities(pool)
+
+
+def rebuild_affinities(pool: Any) -> None:
+    """Recomputes the user affinities from the hot and the archived reactions,
+    in one transaction. Reactions archived to Parquet only are left out."""
+    with pool.cursor() as cursor:
+        reactions = "SELECT post_id, user_id, reaction_score FROM reaction"
+        if cursor.backend.table_exists(cursor, "reaction_archive"):
+            reactions += " UNION ALL SELECT post_id, user_id, reaction_score FROM reaction_archive"
+        cursor.execute("DELETE FROM user_affinity")
+        cursor.execute(f"""
+        INSERT INTO user_affinity (user_id, category, total_score, reaction_count)
+        SELECT r.user_id, p.category, SUM(r.reaction_score), COUNT(*)
+        FROM ({reactions}) r
+        JOIN post p ON p.post_id = r.post_id
+        GROUP BY r.user_id, p.category
+        """)
+        rows = cursor.rowcount
+    print(f" User affinities rebuilt: {rows} (user, category) pairs")
+
+
+def main() -> None:
+    from database import open_pool
+
+    parser = argparse.ArgumentParser(description="Maintenance of the score rollups.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    pool = open_pool(size=1)
+    rebuild_rollups(pool)
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
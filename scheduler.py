@@ -0,0 +1,82 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from exporter import EXPORT_TABLES, export_app_data, export_increment
+from charts import CHARTS, fetch_chart_data, render_charts
+
+
+def timed_call(func: Callable, *args: Any) -> Tuple[float, Any]:
+    """Runs func and returns (elapsed seconds, result), used inside the workers."""
+    start = perf_counter()
+    result = func(*args)
+    return perf_counter() - start, result
+
+
+def print_progress(done: int, total: int, task: str, seconds: float) -> None:
+    print(f"  [{done}/{total}] {task} done in {seconds:.2f}s")
+
+
+def run_export(pool: Any, tables: Sequence[str] = EXPORT_TABLES, fmt: str = "xlsx",
+               incremental: bool = False, charts: Optional[Sequence[str]] = None,
+               chart_formats: Sequence[str] = ("png",),
+               progress: Callable[[int, int, str, float], None] = print_progress) -> Dict[str, float]:
+    """Exports the tables and renders the charts concurrently.
+
+    Every table dump and the chart data fetch run on a thread pool, each
+    worker borrowing its own connection from the pool. The pool is shared with
+    the sessions, so at most ``pool.size - 1`` workers run and one connection
+    is always left for logins and feeds; the other tasks wait for a free
+    worker. The chart data is fetched first, as soon as it is in the charts
+    are rendered in one pass in a worker process, where matplotlib doesn't
+    compete for the GIL with the exports.
+
+    Args:
+        pool (Any): the connection pool
+        tables (Sequence[str]): tables to export
+        fmt (str): export format, see exporter.EXPORT_FORMATS
+        incremental (bool): only export the rows added since the last incremental run
+        charts (Optional[Sequence[str]]): charts to render, see charts.CHARTS, all if None
+        chart_formats (Sequence[str]): image formats of the charts, see charts.CHART_FORMATS
+        progress (Callable): called with (done, total, task, seconds) per finished task
+
+    Returns:
+        Dict[str, float]: seconds spent per task and per chart, plus the wall time under "total"
+    """
+    start = perf_counter()
+    timings = {}
+    charts = list(charts or CHARTS)
+    total = len(tables) + 1 + len(charts)
+
+    workers = max(1, min(len(tables) + 1, pool.size - 1))
+    with ThreadPoolExecutor(max_workers=workers) as threads, \
+            ProcessPoolExecutor(max_workers=1) as processes:
+        export_table = export_increment if incremental else export_app_data
+        # the charts render while the table dumps queue for the workers
+        tasks = {threads.submit(timed_call, fetch_chart_data, pool, charts): "chart data"}
+        for table in tables:
+            tasks[threads.submit(timed_call, export_table, pool, table, fmt)] = f"table {table}"
+
+        pending = set(tasks)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = tasks[future]
+                seconds, result = future.result()
+                if task == "charts":
+                    # one entry per chart, rendered one after another on the same figure
+                    for chart, chart_seconds in result.items():
+                        timings[f"chart {chart}"] = chart_seconds
+                        progress(len(timings), total, f"chart {chart}", chart_seconds)
+                    continue
+                timings[task] = seconds
+                progress(len(timings), total, task, seconds)
+
+                if task == "chart data":
+                    # the data is in, hand the charts over to the process pool
+                    chart_future = processes.submit(timed_call, render_charts, result, charts, chart_formats)
+                    tasks[chart_future] = "charts"
+                    pending.add(chart_future)
+
+    timings["total"] = perf_counter() - start
+    return timings
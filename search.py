@@ -0,0 +1,210 @@
+"""Full-text search over post content.
+
+Posts are tokenized into an inverted index kept in the database next to them:
+one ``search_posting`` row per (term, post), the number of posts holding each
+term in ``search_term`` and the totals of the collection in ``search_stats``.
+The post write paths (services.create_post, ingest.load_posts) index a post in
+the transaction that inserts it.
+
+A query reads at most SEARCH_CANDIDATES postings per term, newest posts first,
+through the (term, post_id) primary key or the (term, category, post_id) index,
+and ranks them with BM25. Its cost depends on the query, not on the number of
+posts. The engine's own FULLTEXT indexes aren't used, MySQL doesn't allow them
+on the partitioned post table (see archive.py).
+
+    python search.py query "retro games" --category gaming
+    python search.py rebuild
+"""
+import argparse
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ingest import placeholders
+
+# terms compare byte for byte, MySQL's default collation would make "resume" and "résumé" one key
+TERM_COLUMN_TYPE = "VARCHAR(40) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin"
+# created by migration 9 and given the binary term collation by migration 13, see migrations.py
+SEARCH_TABLES = ("search_term", "search_posting", "search_stats")
+
+SEARCH_PAGE_SIZE = 10
+SEARCH_CANDIDATES = 1000  # postings read per query term, the newest posts win beyond that
+MAX_QUERY_TERMS = 8
+MAX_TERM_LENGTH = 40
+INDEX_BATCH_SIZE = 1000  # posts per transaction when rebuilding
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+TOKEN_REGEX = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i if in into is it its me my no not of on or our so
+than that the their them then there these they this to too was we were what when which who will
+with you your
+""".split())
+
+# (post_id, category, content) of a post to index
+Document = Tuple[int, str, Optional[str]]
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lower cased words of the text without stopwords and single characters.
+
+    The text is NFC normalized first, an accented letter gives the same term
+    whether it was typed composed or decomposed.
+    """
+    return [token for token in TOKEN_REGEX.findall(unicodedata.normalize("NFC", text or "").lower())
+            if 1 < len(token) <= MAX_TERM_LENGTH and token not in STOPWORDS]
+
+
+# INDEXING ==============================================================================
+
+INCREMENT_COUNT = "post_count = post_count + %s"
+INCREMENT_VALUE = "value = value + %s"
+
+
+def index_posts(cursor: Any, posts: Iterable[Document]) -> int:
+    """Adds posts to the search index, call it in the transaction inserting them.
+
+    Returns:
+        int: number of postings written
+    """
+    postings, post_counts, indexed, total_terms = [], Counter(), 0, 0
+    for post_id, category, content in posts:
+        counts = Counter(tokenize(content))
+        post_terms = sum(counts.values())
+        postings.extend((term, post_id, category, count, post_terms) for term, count in counts.items())
+        post_counts.update(counts.keys())
+        indexed += 1
+        total_terms += post_terms
+    if not indexed:
+        return 0
+
+    backend = cursor.backend
+    if postings:
+        cursor.executemany("INSERT INTO search_posting (term, post_id, category, term_count, post_terms) "
+                           "VALUES (%s, %s, %s, %s, %s)", postings)
+        cursor.executemany(
+            f"INSERT INTO search_term (term, post_count) VALUES (%s, %s) {backend.upsert_clause('term', INCREMENT_COUNT)}",
+            [(term, count, count) for term, count in post_counts.items()],
+        )
+    cursor.executemany(
+        f"INSERT INTO search_stats (name, value) VALUES (%s, %s) {backend.upsert_clause('name', INCREMENT_VALUE)}",
+        [("posts", indexed, indexed), ("terms", total_terms, total_terms)],
+    )
+    return len(postings)
+
+
+def index_post(cursor: Any, post_id: int, category: str, content: Optional[str]) -> None:
+    """Adds a new post to the search index, call it in the post's transaction."""
+    index_posts(cursor, [(post_id, category, content)])
+
+
+def rebuild_search_index(pool: Any, batch_size: int = INDEX_BATCH_SIZE) -> None:
+    """Indexes every post again, in post ID batches of one transaction each.
+
+    Searches return partial results while this runs, don't write posts meanwhile.
+    """
+    with pool.cursor() as cursor:
+        for table in SEARCH_TABLES:
+            cursor.execute(f"DELETE FROM {table}")
+    last_post_id, posts, postings = 0, 0, 0
+    while True:
+        with pool.cursor() as cursor:
+            cursor.execute("SELECT post_id, category, content FROM post WHERE post_id > %s "
+                           "ORDER BY post_id LIMIT %s", (last_post_id, batch_size))
+            batch = cursor.fetchall()
+            postings += index_posts(cursor, batch)
+        if not batch:
+            break
+        posts += len(batch)
+        last_post_id = batch[-1][0]
+    print(f" Search index rebuilt: {posts} posts, {postings} postings")
+
+
+# QUERIES ===============================================================================
+
+def bm25_weight(term_count: int, post_terms: int, idf: float, average_terms: float) -> float:
+    return idf * term_count * (K1 + 1) / (term_count + K1 * (1 - B + B * post_terms / average_terms))
+
+
+def rank_posts(cursor: Any, terms: List[str], category: Optional[str], limit: int) -> List[Tuple[int, float]]:
+    """Returns the (post_id, score) of the best ``limit`` matches, best first."""
+    cursor.execute(f"SELECT term, post_count FROM search_term WHERE term IN ({placeholders(len(terms))})", terms)
+    post_counts = dict(cursor.fetchall())
+    if not post_counts:
+        return []
+    cursor.execute("SELECT name, value FROM search_stats")
+    stats = dict(cursor.fetchall())
+    posts = max(stats.get("posts", 0), 1)
+    average_terms = max(stats.get("terms", 0) / posts, 1.0)
+
+    category_filter = "AND category = %s" if category else ""
+    scores: Dict[int, float] = {}
+    for term, post_count in post_counts.items():
+        idf = math.log(1 + (posts - post_count + 0.5) / (post_count + 0.5))
+        cursor.execute(
+            f"SELECT post_id, term_count, post_terms FROM search_posting WHERE term = %s {category_filter} "
+            "ORDER BY post_id DESC LIMIT %s",
+            (term, category, SEARCH_CANDIDATES) if category else (term, SEARCH_CANDIDATES),
+        )
+        for post_id, term_count, post_terms in cursor.fetchall():
+            scores[post_id] = scores.get(post_id, 0.0) + bm25_weight(term_count, post_terms, idf, average_terms)
+    # ties go to the newer post
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+
+
+def search_posts(cursor: Any, query: str, category: Optional[str] = None, page: int = 0,
+                 page_size: int = SEARCH_PAGE_SIZE) -> List[Tuple[int, str, str, Any, float]]:
+    """Finds the posts matching the words of a query, best match first.
+
+    Args:
+        cursor (Any): the cursor object
+        query (str): the words to look for, a post matches if it holds any of them
+        category (Optional[str]): only posts of this category
+        page (int): page number, 0 for the best matches
+        page_size (int): posts per page
+
+    Returns:
+        List[Tuple[int, str, str, Any, float]]: (post_id, content, category, timestamp, score) rows
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+    ranked = rank_posts(cursor, terms, category, (page + 1) * page_size)[page * page_size:]
+    if not ranked:
+        return []
+    cursor.execute(f"SELECT post_id, content, category, timestamp FROM post "
+                   f"WHERE post_id IN ({placeholders(len(ranked))})", [post_id for post_id, _ in ranked])
+    posts = {row[0]: row for row in cursor.fetchall()}
+    return [(*posts[post_id], round(score, 3)) for post_id, score in ranked if post_id in posts]
+
+
+def main() -> None:
+    from database import open_pool
+
+    parser = argparse.ArgumentParser(description="Search posts, or rebuild the search index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    query_parser = subparsers.add_parser("query", help="print the best matches of a query")
+    query_parser.add_argument("words")
+    query_parser.add_argument("--category")
+    query_parser.add_argument("--page", type=int, default=0)
+    subparsers.add_parser("rebuild", help="index every post again")
+    args = parser.parse_args()
+
+    pool = open_pool(size=1)
+    if args.command == "rebuild":
+        rebuild_search_index(pool)
+    else:
+        with pool.cursor() as cursor:
+            for post_id, content, category, timestamp, score in search_posts(cursor, args.words, args.category, args.page):
+                print(f"#{post_id}  {score:>7.3f}  {timestamp}  {category}\n  {content}\n")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
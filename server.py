@@ -0,0 +1,251 @@
+"""Asyncio session server of NexVerse.
+
+Clients talk a JSON line protocol over TCP, one request and one response per
+line:
+
+    {"op": "login", "username": "alice", "password": "..."}
+    {"ok": true, "result": 42}
+    {"op": "feed", "after": null}
+    {"ok": false, "error": "Please log in first."}
+
+Each connection is one session and remembers the user that logged in on it.
+The event loop only reads and writes sockets, the database work of a request
+runs on a thread pool sized to the connection pool, so thousands of idle or
+reading sessions cost no thread and no database connection.
+
+    python server.py --port 8750
+"""
+import argparse
+import asyncio
+import inspect
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import profiler
+import services
+from backends import database_errors
+from database import PoolError
+from passwords import close_verifier
+from services import ADMIN_USER_ID, ServiceError
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8750
+SESSION_IDLE_TIMEOUT = 900  # seconds without a request before a session is closed
+MAX_REQUEST_SIZE = 64 * 1024  # bytes per request line
+
+
+def encode(response: Dict[str, Any]) -> bytes:
+    # datetimes and dates go out as their ISO text
+    return json.dumps(response, default=str).encode() + b"\n"
+
+
+class Session:
+    """State and request handlers of one client session.
+
+    ``handle`` is blocking, the server calls it from its thread pool; LocalClient
+    calls it directly.
+    """
+
+    def __init__(self, pool: Any):
+        self.pool = pool
+        self.user_id: Optional[int] = None
+        self.handlers: Dict[str, Callable[..., Any]] = {
+            "signup": self.signup,
+            "login": self.login,
+            "logout": self.logout,
+            "profile": self.profile,
+            "feed": self.feed,
+            "ranked_feed": self.ranked_feed,
+            "search": self.search,
+            "react": self.react,
+            "post": self.post,
+            "admin_posts": self.admin_posts,
+            "export": self.export,
+            "stats": self.stats,
+            "trends": self.trends,
+            "metrics": self.metrics,
+        }
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Runs one request, returns the response object."""
+        request = dict(request)
+        handler = self.handlers.get(request.pop("op", None))
+        if handler is None:
+            return {"ok": False, "error": "Unknown operation."}
+        try:
+            inspect.signature(handler).bind(**request)
+        except TypeError:
+            return {"ok": False, "error": "Invalid request arguments."}
+        try:
+            return {"ok": True, "result": handler(**request)}
+        except ServiceError as err:
+            return {"ok": False, "error": str(err)}
+        except (TypeError, ValueError) as err:  # arguments of the wrong type or value, e.g. int("x")
+            return {"ok": False, "error": f"Invalid request arguments: {err}"}
+        except (*database_errors(), PoolError) as err:
+            print(f"ERROR: {err}")
+            return {"ok": False, "error": "The database is unavailable, please try again later."}
+
+    def require_user(self) -> int:
+        if self.user_id is None:
+            raise ServiceError("Please log in first.")
+        return self.user_id
+
+    def require_admin(self) -> None:
+        if self.require_user() != ADMIN_USER_ID:
+            raise ServiceError("Only the admin can do that.")
+
+    def signup(self, fields: Dict[str, Any]) -> int:
+        return services.create_account(self.pool, fields)
+
+    def login(self, username: str, password: str) -> int:
+        user_id = services.authenticate(self.pool, username, password)
+        if user_id is None:
+            raise ServiceError("User doesn't exist or Wrong Password!")
+        self.user_id = user_id
+        return user_id
+
+    def logout(self) -> None:
+        self.user_id = None
+
+    def profile(self, user_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        viewer_id = self.require_user()
+        return services.get_profile(self.pool, viewer_id if user_id is None else int(user_id), viewer_id)
+
+    def feed(self, after: Optional[list] = None) -> list:
+        return services.feed_page(self.pool, self.require_user(), after)
+
+    def ranked_feed(self, exclude: Optional[list] = None) -> list:
+        return services.ranked_feed_page(self.pool, self.require_user(), exclude)
+
+    def search(self, query: str, category: Optional[str] = None, page: int = 0) -> list:
+        self.require_user()
+        return services.search_posts(self.pool, query, category, page)
+
+    def react(self, post_id: int, reaction_score: int) -> None:
+        services.react(self.pool, self.require_user(), post_id, reaction_score)
+
+    def post(self, category: str, content: str) -> int:
+        self.require_admin()
+        return services.create_post(self.pool, self.user_id, category, content)
+
+    def admin_posts(self, after: Optional[list] = None, category: Optional[str] = None,
+                    since: Optional[str] = None, until: Optional[str] = None) -> list:
+        self.require_admin()
+        return services.admin_posts_page(self.pool, after, category, since, until)
+
+    def stats(self) -> Dict[str, Any]:
+        self.require_admin()
+        buffer = services.reaction_buffer
+        return {"pool": self.pool.stats(), "caches": services.cache_stats(),
+                "reactions": buffer.stats() if buffer else None, "trends": services.trend_engine.stats() if services.trend_engine else None}
+
+    def trends(self, window: str = "day", limit: int = 10) -> Dict[str, Any]:
+        self.require_user()
+        return services.trending(self.pool, window, limit)
+
+    def metrics(self) -> Optional[Dict[str, Any]]:
+        """Returns the statement metrics, None unless profiling is on (see profiler.py)."""
+        self.require_admin()
+        return profiler.query_profiler.to_json() if profiler.query_profiler else None
+
+    def export(self, fmt: str, incremental: bool = False) -> Dict[str, float]:
+        from scheduler import run_export
+
+        self.require_admin()
+        return run_export(self.pool, fmt=fmt, incremental=incremental)
+
+
+class SessionServer:
+    """Accepts client connections and serves their requests.
+
+    Args:
+        pool (Any): the connection pool shared by every session
+        workers (Optional[int]): threads running the database work, the pool size if None
+    """
+
+    def __init__(self, pool: Any, workers: Optional[int] = None):
+        self.pool = pool
+        self.executor = ThreadPoolExecutor(max_workers=workers or pool.size, thread_name_prefix="session")
+        self.sessions = 0  # currently connected
+
+    async def serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        session = Session(self.pool)
+        self.sessions += 1
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), SESSION_IDLE_TIMEOUT)
+                except (asyncio.TimeoutError, ValueError):  # idle for too long or line over the limit
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError
+                except ValueError:
+                    response = {"ok": False, "error": "Invalid request."}
+                else:
+                    response = await loop.run_in_executor(self.executor, session.handle, request)
+                writer.write(encode(response))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+        server = await asyncio.start_server(self.serve_client, host, port, limit=MAX_REQUEST_SIZE)
+        print(f"NexVerse session server listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+
+def main() -> None:
+    from utils import ADMIN_PASSWD
+    from database import open_pool
+
+    parser = argparse.ArgumentParser(description="Serve NexVerse sessions over TCP.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--pool-size", type=int, help="database connections, NEXVERSE_POOL_SIZE if not given")
+    parser.add_argument("--workers", type=int, help="threads running the database work, the pool size if not given")
+    parser.add_argument("--reaction-durability", choices=["group", "sync", "off"], default="group",
+                        help="write-behind buffering of reactions, see reaction_buffer.py")
+    args = parser.parse_args()
+
+    pool = open_pool(**({"size": args.pool_size} if args.pool_size else {}))
+    services.prepare_database(pool, ADMIN_PASSWD)
+    print(f" {services.get_trend_engine().warm_up(pool)} reactions of the last week replayed for the trends")
+    buffer = None
+    if args.reaction_durability != "off":
+        buffer = services.enable_reaction_buffer(pool, args.reaction_durability)
+    server = SessionServer(pool, args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        close_verifier()
+        if buffer is not None:
+            buffer.close()
+            print(f"({buffer.flushed} reactions written in {buffer.flushes} flushes)")
+        stats = pool.stats()
+        print(f"({stats['checkouts']} connection checkouts, {stats['wait_total'] * 1000:.1f}ms spent waiting)")
+        for name, stats in services.cache_stats().items():
+            print(f"({name} cache: {stats['hits']} hits, {stats['misses']} misses)")
+        for path in profiler.write_metrics():
+            print(f"(statement metrics written to {path})")
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
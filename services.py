@@ -0,0 +1,339 @@
+"""The operations of a NexVerse session, without any terminal input or output.
+
+Every function borrows its connection from the pool and returns plain data, so
+the same operations serve the session server (server.py) and the scripts.
+Invalid input is reported with ServiceError.
+
+Profiles and login results are cached in memory, see the CACHES section; every
+function writing account or user rows has to call invalidate_account().
+"""
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import MISSING, TTLCache
+from feed import fetch_admin_page, fetch_unseen_page
+from ingest import placeholders
+from migrations import migrate
+from passwords import cache_digest, dummy_hash, get_passwd_hash, hash_passwd, needs_rehash, verify_passwd
+from reaction_buffer import ReactionBuffer
+from rollups import record_post, record_reaction, record_reaction_pairs, record_user_reactions
+from search import index_post, search_posts as search_index
+from validators import CATEGORY_NAMES, prepare_account, validate_account_field, validate_post, validate_reaction
+
+ADMIN_USER_ID = 1  # the admin is the first account
+SIGNUP_FIELDS = ("username", "password", "email", "fname", "lname", "bio", "location", "age")
+
+
+class ServiceError(Exception):
+    """Raised when a request can't be served, the message is shown to the user."""
+
+
+# CACHES ================================================================================
+
+CACHE_SIZE = 10000  # entries per cache
+PROFILE_CACHE_TTL = 300  # seconds
+LOGIN_CACHE_TTL = 600
+FAILED_LOGIN_TTL = 30  # failed logins are cached shortly, repeated attempts don't reach the database
+
+profile_cache = TTLCache(CACHE_SIZE, PROFILE_CACHE_TTL)  # user_id: profile or None
+login_cache = TTLCache(CACHE_SIZE, LOGIN_CACHE_TTL)  # (username, passwords.cache_digest): user_id or None
+
+
+def invalidate_account(user_id: Optional[int] = None, username: Optional[str] = None) -> None:
+    """Drops the cached profile and login results of an account after it was written."""
+    if user_id is not None:
+        profile_cache.invalidate(user_id)
+    if username is not None:
+        login_cache.invalidate_where(lambda key: key[0] == username)
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {"profile": profile_cache.stats(), "login": login_cache.stats()}
+
+
+# SETUP =================================================================================
+
+def check_admin_exists(cursor: Any, admin_passwd: str) -> None:
+    """Checks if the admin account exists or not, if it doesn't exist then it is
+    created. Being the first account, the admin gets user ID 1.
+
+    Args:
+        cursor (Any): the cursor object
+        admin_passwd (str): password of the admin account
+
+    Returns:
+        None
+    """
+    cursor.execute("SELECT user_id FROM account WHERE username = %s", ("admin",))
+    admin_check = cursor.fetchone()
+    if not admin_check:
+        query = "INSERT INTO user (username, fname, lname, bio, location, age) VALUES (%s, %s, %s, %s, %s, %s)"
+        values = ("admin", "Admin", None, None, None, None)
+        cursor.execute(query, values)
+        query = "INSERT INTO account (username, password, email, join_date, last_login, is_private) VALUES (%s, %s, %s, %s, %s, %s)"
+        values = ("admin",  get_passwd_hash(admin_passwd), None, None, None, "Y")
+        cursor.execute(query, values)
+    return None
+
+
+def prepare_database(pool: Any, admin_passwd: str) -> None:
+    """Brings the schema up to date and adds the admin account."""
+    migrate(pool)
+    with pool.cursor() as cursor:
+        check_admin_exists(cursor=cursor, admin_passwd=admin_passwd)
+
+
+# ACCOUNTS ==============================================================================
+
+def duplicate_account_error(pool: Any, err: Exception) -> str:
+    """Returns the message for a signup rejected by a unique index, re-raises other errors."""
+    key = pool.backend.duplicate_key(err)
+    if key is None:
+        raise err
+    # account.email / uq_account_email, anything else is the username (account or user)
+    if "email" in key:
+        return "User with email already exists!"
+    return "Username already exists!"
+
+
+def create_account(pool: Any, fields: Dict[str, Any]) -> int:
+    """Validates the signup fields and creates the account and user rows.
+
+    Args:
+        pool (Any): the connection pool
+        fields (Dict[str, Any]): the SIGNUP_FIELDS as entered by the user
+
+    Returns:
+        int: user ID of the new account
+    """
+    data = {column: fields.get(column) for column in SIGNUP_FIELDS}
+    if not data["username"]:
+        raise ServiceError("Username cannot be empty.")
+    for column in SIGNUP_FIELDS:
+        error = validate_account_field(column, data[column])
+        if error:
+            raise ServiceError(error)
+
+    # empty fields to NULL, hashing password, lower casing, generated columns
+    prepare_account(data, hasher=hash_passwd)
+
+    # adding data to 'account' and 'user' tables, committed together; the unique
+    # indexes on username and email reject duplicates, no lookup beforehand
+    try:
+        with pool.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO account (username, password, email, join_date, last_login, is_private) VALUES (%s, %s, %s, %s, %s, %s)",
+                (data["username"], data["password"], data["email"], data["join_date"], data["last_login"], data["is_private"]),
+            )
+            user_id = cursor.lastrowid
+            cursor.execute(
+                "INSERT INTO user (username, fname, lname, bio, location, age) VALUES (%s, %s, %s, %s, %s, %s)",
+                (data["username"], data["fname"], data["lname"], data["bio"], data["location"], data["age"]),
+            )
+    except pool.backend.IntegrityError as err:
+        raise ServiceError(duplicate_account_error(pool, err)) from None
+    invalidate_account(user_id, data["username"])
+    return user_id
+
+
+def authenticate(pool: Any, username: str, password: str) -> Optional[int]:
+    """Returns the user ID of the account, None if it doesn't exist or the password is wrong.
+
+    The password is verified on the passwords verification pool. A hash older
+    or weaker than the current one is replaced once the password matched.
+    """
+    username, password = username.strip(), password.strip()
+    key = (username, cache_digest(password))
+    user_id = login_cache.get(key)
+    if user_id is MISSING:
+        with pool.cursor() as cursor:
+            cursor.execute("SELECT user_id, password FROM account WHERE username = %s", (username,))
+            result = cursor.fetchone()
+        user_id, stored = result if result else (None, None)
+        # unknown usernames are verified too, against a hash nothing matches
+        if not verify_passwd(password, stored or dummy_hash()):
+            user_id = None
+        elif needs_rehash(stored):
+            rehash_password(pool, user_id, stored, password)
+        login_cache.set(key, user_id, None if user_id else FAILED_LOGIN_TTL)
+    return user_id
+
+
+def rehash_password(pool: Any, user_id: int, stored: str, password: str) -> None:
+    """Stores a current hash of the verified password, unless the password
+    changed in the meantime."""
+    passwd_hash = hash_passwd(password)  # before borrowing a connection, it takes a while
+    with pool.cursor() as cursor:
+        cursor.execute("UPDATE account SET password = %s WHERE user_id = %s AND password = %s",
+                       (passwd_hash, user_id, stored))
+
+
+def get_profile(pool: Any, user_id: int, viewer_id: int) -> Optional[Dict[str, Any]]:
+    """Returns the profile of a user as seen by the viewer, None for an unknown user.
+
+    A private profile is only shown to its owner and the admin.
+    """
+    profile = profile_cache.get_or_load(user_id, lambda: load_profile(pool, user_id))
+    if profile and profile["is_private"] == "Y" and viewer_id not in (user_id, ADMIN_USER_ID):
+        raise ServiceError("This profile is private.")
+    return profile
+
+
+def load_profile(pool: Any, user_id: int) -> Optional[Dict[str, Any]]:
+    query = """
+    SELECT user.username, user.fname, user.lname, user.bio, user.location, account.is_private
+    FROM account
+    JOIN user ON account.username = user.username
+    WHERE account.user_id = %s
+    """
+    with pool.cursor() as cursor:
+        cursor.execute(query, (user_id,))
+        result = cursor.fetchone()
+    if not result:
+        return None
+    return dict(zip(("username", "fname", "lname", "bio", "location", "is_private"), result))
+
+
+# POSTS AND REACTIONS ===================================================================
+
+reaction_buffer: Optional[ReactionBuffer] = None  # write-behind buffer of react(), see enable_reaction_buffer()
+
+
+# fed with every stored reaction once created, see get_trend_engine(); trends.py loads
+# numpy, a session that never asks for the trends doesn't import it
+trend_engine: Optional[Any] = None
+trend_engine_lock = threading.Lock()
+
+
+def get_trend_engine() -> Any:
+    """Returns the process wide trends.TrendEngine, created on first use."""
+    global trend_engine
+    with trend_engine_lock:
+        if trend_engine is None:
+            from trends import TrendEngine
+
+            trend_engine = TrendEngine()
+        return trend_engine
+
+
+def enable_reaction_buffer(pool: Any, durability: str = "group", **options: Any) -> ReactionBuffer:
+    """Routes every later react() through a write-behind ReactionBuffer, close it on shutdown."""
+    global reaction_buffer
+    options.setdefault("on_write", lambda rows: record_trends(pool, rows))
+    reaction_buffer = ReactionBuffer(pool, durability, **options)
+    return reaction_buffer
+
+
+def record_trends(pool: Any, rows: List[tuple]) -> None:
+    """Feeds stored (post_id, user_id, reaction_score, timestamp) reactions to the trend engine."""
+    if trend_engine is None or not trend_engine.warmed:
+        return
+    post_ids = list({row[0] for row in rows})
+    with pool.cursor() as cursor:
+        cursor.execute(f"SELECT post_id, category FROM post_score WHERE post_id IN ({placeholders(len(post_ids))})", post_ids)
+        categories = dict(cursor.fetchall())
+    trend_engine.record_many((post_id, categories.get(post_id), score, timestamp)
+                             for post_id, _, score, timestamp in rows)
+
+
+def create_post(pool: Any, user_id: int, category: str, content: str) -> int:
+    """Stores a new post, returns its post ID."""
+    category = str(category).lower()
+    error = validate_post({"user_id": user_id, "category": category, "content": content})
+    if error:
+        raise ServiceError(error)
+
+    query = "INSERT INTO post (user_id, content, category, timestamp) VALUES (%s, %s, %s, %s)"
+    with pool.cursor() as cursor:
+        cursor.execute(query, (user_id, content, category, datetime.now().replace(microsecond=0)))
+        post_id = cursor.lastrowid
+        record_post(cursor, post_id, category)
+        index_post(cursor, post_id, category, content)
+    return post_id
+
+
+def search_posts(pool: Any, query: str, category: Optional[str] = None, page: int = 0) -> List[tuple]:
+    """Returns a page of the posts matching the query, best first, see search.search_posts."""
+    if not str(query or "").strip():
+        raise ServiceError("Please enter something to search for.")
+    if category is not None and category not in CATEGORY_NAMES:
+        raise ServiceError(f"Unknown category '{category}'.")
+    with pool.cursor(readonly=True) as cursor:
+        return search_index(cursor, str(query), category, max(int(page), 0))
+
+
+def feed_page(pool: Any, user_id: int, after: Optional[Tuple[Any, int]] = None) -> List[tuple]:
+    """Returns the next page of posts the user hasn't reacted to, see feed.fetch_unseen_page."""
+    with pool.cursor(readonly=True) as cursor:
+        return fetch_unseen_page(cursor, user_id, tuple(after) if after else None)
+
+
+MAX_EXCLUDED_POSTS = 1000  # post IDs a ranked feed request can leave out
+
+
+def ranked_feed_page(pool: Any, user_id: int, exclude: Optional[List[int]] = None) -> List[tuple]:
+    """Returns the best unseen posts for the user, see ranking.fetch_ranked_page.
+
+    The caller passes the posts it already showed (the most recent ones are
+    enough), their reactions may still wait in the reaction buffer.
+    """
+    from ranking import fetch_ranked_page  # loads numpy
+
+    exclude = [int(post_id) for post_id in (exclude or [])][-MAX_EXCLUDED_POSTS:]
+    with pool.cursor(readonly=True) as cursor:
+        return fetch_ranked_page(cursor, user_id, exclude=exclude)
+
+
+def react(pool: Any, user_id: int, post_id: int, reaction_score: int) -> None:
+    """Stores the reaction of a user to a post, through the reaction buffer if one is enabled."""
+    error = validate_reaction({"post_id": post_id, "user_id": user_id, "reaction_score": reaction_score})
+    if error:
+        raise ServiceError(error)
+
+    if reaction_buffer is not None:
+        reaction_buffer.add(int(post_id), int(user_id), int(reaction_score))
+        return
+    values = (post_id, user_id, reaction_score, datetime.now().replace(microsecond=0))
+    try:
+        with pool.cursor() as cursor:
+            # the primary key of reaction_pair refuses a second reaction, archived or partitioned
+            record_reaction_pairs(cursor, [(user_id, post_id)])
+            cursor.execute("INSERT INTO reaction (post_id, user_id, reaction_score, timestamp) VALUES (%s, %s, %s, %s)", values)
+            record_reaction(cursor, post_id, reaction_score)
+            record_user_reactions(cursor, [(user_id, post_id, reaction_score)])
+            category = None
+            if trend_engine is not None and trend_engine.warmed:
+                cursor.execute("SELECT category FROM post_score WHERE post_id = %s", (post_id,))
+                category = cursor.fetchone()
+    except pool.backend.IntegrityError as err:
+        if pool.backend.duplicate_key(err) is None:
+            raise
+        raise ServiceError("You already reacted to this post.") from None
+    if category:
+        trend_engine.record(int(post_id), category[0], int(reaction_score), values[3])
+
+
+def trending(pool: Any, window: str = "day", limit: int = 10) -> Dict[str, Any]:
+    """Returns the categories and posts trending in the window, see trends.TrendEngine.
+
+    The first call replays the last week of stored reactions.
+    """
+    from trends import WINDOWS
+
+    if window not in WINDOWS:
+        raise ServiceError(f"Unknown window '{window}', expected one of {', '.join(WINDOWS)}.")
+    engine = get_trend_engine()
+    if not engine.warmed:
+        engine.warm_up(pool)
+    return {"categories": engine.categories(window), "posts": engine.posts(window, limit)}
+
+
+def admin_posts_page(pool: Any, after: Optional[Tuple[Any, int]] = None, category: Optional[str] = None,
+                     since: Optional[str] = None, until: Optional[str] = None) -> List[tuple]:
+    """Returns a page of posts with their average score, see feed.fetch_admin_page."""
+    if category is not None and category not in CATEGORY_NAMES:
+        raise ServiceError(f"Unknown category '{category}'.")
+    with pool.cursor(readonly=True) as cursor:
+        return fetch_admin_page(cursor, tuple(after) if after else None,
+                                category=category, since=since, until=until)
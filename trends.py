@@ -0,0 +1,332 @@
+"""Real-time trend profiling of reactions.
+
+The trend engine keeps, in memory, sliding-window counters of the reactions
+written in the last hour, day and week:
+
+- per category, exact: a ring of time buckets per window, one column per category;
+- per post, approximate: the same rings holding count-min sketches, plus a
+  bounded set of candidate posts per window (the heavy hitters).
+
+Every window keeps the running total of its buckets; a bucket leaving the
+window is subtracted once. Recording a reaction and answering "what's
+trending" therefore cost the same however many reactions there are, and
+never touch the reaction table. A category or post is rising when its rate in
+a window beats its rate over the next longer window.
+
+The engine is fed by the reaction write paths (services.react and the
+reaction buffer) once their transaction committed. It ignores them until
+warm_up() replayed the last week of stored reactions, services.trending() does
+that on first use.
+
+    python trends.py --window day
+"""
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from validators import CATEGORY_NAMES
+
+CATEGORY_ORDER = sorted(CATEGORY_NAMES)
+# window: (bucket seconds, buckets)
+WINDOWS = {
+    "hour": (300, 12),
+    "day": (3600, 24),
+    "week": (6 * 3600, 28),
+}
+BASELINE_WINDOW = {"hour": "day", "day": "week"}  # what a window's rate is compared with
+SKETCH_DEPTH = 4  # hash rows of the count-min sketches
+SKETCH_WIDTH = 2048  # counters per row, a post is overestimated by e / width of the window's reactions at most (mostly)
+TRENDING_CANDIDATES = 200  # posts tracked per window
+RISING_FACTOR = 1.5  # growth above which a category or post is rising
+MIN_TRENDING_REACTIONS = 5  # reactions in the window before growth counts
+WARM_UP_BATCH_SIZE = 10000
+
+
+class RingCounter:
+    """Reaction counts and score sums per column over a sliding window of time buckets.
+
+    Args:
+        bucket_seconds (int): width of a bucket
+        buckets (int): buckets in the window
+        columns (int): counters per bucket
+    """
+
+    def __init__(self, bucket_seconds: int, buckets: int, columns: int):
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.counts = np.zeros((buckets, columns), dtype=np.int64)
+        self.sums = np.zeros((buckets, columns), dtype=np.int64)
+        self.total_counts = np.zeros(columns, dtype=np.int64)
+        self.total_sums = np.zeros(columns, dtype=np.int64)
+        self.head = 0  # number of the newest bucket
+
+    @property
+    def seconds(self) -> int:
+        return self.bucket_seconds * self.buckets
+
+    def advance(self, now: float) -> None:
+        """Moves the window to end at now, dropping the buckets that left it."""
+        bucket = int(now // self.bucket_seconds)
+        if bucket <= self.head:
+            return
+        if bucket - self.head >= self.buckets:
+            for array in (self.counts, self.sums, self.total_counts, self.total_sums):
+                array[...] = 0
+        else:
+            for number in range(self.head + 1, bucket + 1):
+                slot = number % self.buckets
+                self.total_counts -= self.counts[slot]
+                self.total_sums -= self.sums[slot]
+                self.counts[slot] = 0
+                self.sums[slot] = 0
+        self.head = bucket
+
+    def add(self, timestamp: float, columns: Any, score: int) -> bool:
+        """Counts a reaction in the given column(s), returns False if it is older than the window."""
+        self.advance(timestamp)
+        bucket = int(timestamp // self.bucket_seconds)
+        if bucket <= self.head - self.buckets:
+            return False
+        slot = bucket % self.buckets
+        self.counts[slot, columns] += 1
+        self.sums[slot, columns] += score
+        self.total_counts[columns] += 1
+        self.total_sums[columns] += score
+        return True
+
+
+class Window:
+    """Category counters, post sketches and trending candidates of one window."""
+
+    def __init__(self, bucket_seconds: int, buckets: int):
+        self.categories = RingCounter(bucket_seconds, buckets, len(CATEGORY_ORDER))
+        self.posts = RingCounter(bucket_seconds, buckets, SKETCH_DEPTH * SKETCH_WIDTH)
+        self.candidates: Dict[int, int] = {}  # post_id: estimated reactions, see refresh()
+
+    @property
+    def seconds(self) -> int:
+        return self.categories.seconds
+
+    def advance(self, now: float) -> None:
+        head = self.posts.head
+        self.categories.advance(now)
+        self.posts.advance(now)
+        if self.posts.head != head:
+            self.refresh()
+
+    def refresh(self) -> None:
+        """Sets the candidates to their current estimates, once buckets left the
+        window, and drops the posts without reactions left in it."""
+        for post_id in list(self.candidates):
+            count, _ = self.estimate(sketch_columns(post_id))
+            if count:
+                self.candidates[post_id] = count
+            else:
+                del self.candidates[post_id]
+
+    def estimate(self, columns: np.ndarray) -> Tuple[int, int]:
+        """Returns the estimated (reactions, score sum) of a post from its sketch columns."""
+        return int(self.posts.total_counts[columns].min()), int(self.posts.total_sums[columns].min())
+
+    def add(self, post_id: int, category: int, columns: np.ndarray, score: int, timestamp: float) -> None:
+        head = self.posts.head
+        if not self.categories.add(timestamp, category, score):
+            return
+        self.posts.add(timestamp, columns, score)
+        if self.posts.head != head:
+            self.refresh()  # the counts of the posts not seen since are too high now
+        count, _ = self.estimate(columns)
+        if post_id in self.candidates or len(self.candidates) < TRENDING_CANDIDATES:
+            self.candidates[post_id] = count
+            return
+        weakest = min(self.candidates, key=self.candidates.get)
+        if count > self.candidates[weakest]:
+            del self.candidates[weakest]
+            self.candidates[post_id] = count
+
+
+def sketch_columns(post_id: int) -> np.ndarray:
+    """Returns the counter of each sketch row a post maps to."""
+    rows = np.arange(SKETCH_DEPTH, dtype=np.uint64)
+    # multiply-shift hashing with a distinct odd multiplier per row
+    hashed = (np.uint64(post_id) + np.uint64(1)) * (rows * np.uint64(0x9E3779B97F4A7C15) | np.uint64(1))
+    return (rows * SKETCH_WIDTH + (hashed >> np.uint64(40)) % np.uint64(SKETCH_WIDTH)).astype(np.int64)
+
+
+def growth(count: float, seconds: float, baseline_count: float, baseline_seconds: float) -> float:
+    """Ratio of the rate in a window to the rate over its baseline window,
+    smoothed so a handful of reactions doesn't count as a surge."""
+    return (count / seconds) / ((baseline_count + MIN_TRENDING_REACTIONS) / baseline_seconds)
+
+
+class TrendEngine:
+    """Sliding-window reaction statistics of the categories and posts, see the module docstring.
+
+    Args:
+        clock (Callable[[], float]): epoch seconds of the local time, reaction
+            timestamps are stored in local time
+    """
+
+    def __init__(self, clock: Optional[Callable[[], float]] = None):
+        self.clock = clock or (lambda: datetime.now().timestamp())
+        self.windows = {name: Window(*shape) for name, shape in WINDOWS.items()}
+        self._positions = {category: position for position, category in enumerate(CATEGORY_ORDER)}
+        self._lock = threading.Lock()
+        self.warmed = False
+        self.recorded = 0
+
+    def record(self, post_id: int, category: str, reaction_score: int, timestamp: Optional[Any] = None) -> None:
+        """Counts a stored reaction, the timestamp defaults to now."""
+        self.record_many([(post_id, category, reaction_score, timestamp)])
+
+    def record_many(self, reactions: Iterable[Tuple[int, str, int, Optional[Any]]]) -> None:
+        """Counts stored (post_id, category, reaction_score, timestamp) reactions,
+        once the engine is warmed up."""
+        with self._lock:
+            if self.warmed:
+                self._record(reactions)
+
+    def _record(self, reactions: Iterable[Tuple[int, str, int, Optional[Any]]]) -> None:
+        for post_id, category, score, timestamp in reactions:
+            position = self._positions.get(category)
+            if position is None:
+                continue
+            if timestamp is None:
+                seconds = self.clock()
+            elif isinstance(timestamp, datetime):
+                seconds = timestamp.timestamp()
+            else:
+                seconds = datetime.fromisoformat(str(timestamp)).timestamp()
+            columns = sketch_columns(post_id)
+            for window in self.windows.values():
+                window.add(post_id, position, columns, score, seconds)
+            self.recorded += 1
+
+    def _baseline(self, name: str) -> Optional[Window]:
+        baseline = BASELINE_WINDOW.get(name)
+        return self.windows[baseline] if baseline else None
+
+    def categories(self, name: str = "day") -> List[Dict[str, Any]]:
+        """Returns the categories with reactions in the window, fastest rising first.
+
+        Each entry holds category, reactions, avg_score, growth (rate against
+        the baseline window, None for the week) and rising.
+        """
+        now = self.clock()
+        with self._lock:
+            window, baseline = self.windows[name], self._baseline(name)
+            window.advance(now)
+            counts, sums = window.categories.total_counts.copy(), window.categories.total_sums.copy()
+            if baseline is not None:
+                baseline.advance(now)
+                baseline_counts = baseline.categories.total_counts.copy()
+        trends = []
+        for position, category in enumerate(CATEGORY_ORDER):
+            if not counts[position]:
+                continue
+            rate = None
+            if baseline is not None:
+                rate = growth(counts[position], window.seconds, baseline_counts[position], baseline.seconds)
+            trends.append(trend_entry({"category": category}, counts[position], sums[position], rate))
+        return sorted(trends, key=lambda entry: (entry["growth"] or 0, entry["reactions"]), reverse=True)
+
+    def posts(self, name: str = "day", limit: int = 10) -> List[Dict[str, Any]]:
+        """Returns the most reacted posts of the window, with the same fields as
+        categories() but post_id instead of category. Counts are estimates that
+        can only be too high."""
+        now = self.clock()
+        with self._lock:
+            window, baseline = self.windows[name], self._baseline(name)
+            window.advance(now)
+            if baseline is not None:
+                baseline.advance(now)
+            trends = []
+            for post_id in window.candidates:
+                columns = sketch_columns(post_id)
+                count, total = window.estimate(columns)
+                if not count:
+                    continue
+                rate = None
+                if baseline is not None:
+                    rate = growth(count, window.seconds, baseline.estimate(columns)[0], baseline.seconds)
+                trends.append(trend_entry({"post_id": post_id}, count, total, rate))
+        trends.sort(key=lambda entry: (entry["reactions"], entry["growth"] or 0), reverse=True)
+        return trends[:limit]
+
+    def warm_up(self, pool: Any, batch_size: int = WARM_UP_BATCH_SIZE) -> int:
+        """Counts the stored reactions of the longest window, returns their number.
+
+        Reactions are recorded live from here on, the replay stops at the last
+        reaction stored when it started. A flush committing right then can be
+        counted twice.
+        """
+        since = datetime.fromtimestamp(self.clock() - max(window.seconds for window in self.windows.values()))
+        with self._lock:
+            if self.warmed:
+                return 0
+            with pool.cursor() as cursor:
+                cursor.execute("SELECT COALESCE(MAX(reaction_id), 0) FROM reaction")
+                high = cursor.fetchone()[0]
+            self.warmed = True
+
+        last_id, replayed = 0, 0
+        while True:
+            with pool.cursor() as cursor:
+                cursor.execute("""
+                SELECT r.reaction_id, r.post_id, p.category, r.reaction_score, r.timestamp
+                FROM reaction r
+                JOIN post p ON p.post_id = r.post_id
+                WHERE r.timestamp >= %s AND r.reaction_id > %s AND r.reaction_id <= %s
+                ORDER BY r.reaction_id
+                LIMIT %s
+                """, (since.replace(microsecond=0), last_id, high, batch_size))
+                rows = cursor.fetchall()
+            if not rows:
+                return replayed
+            with self._lock:
+                self._record(row[1:] for row in rows)
+            replayed += len(rows)
+            last_id = rows[-1][0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"recorded": self.recorded,
+                "candidates": {name: len(window.candidates) for name, window in self.windows.items()}}
+
+
+def trend_entry(key: Dict[str, Any], count: int, total: int, rate: Optional[float]) -> Dict[str, Any]:
+    count, rate = int(count), None if rate is None else float(rate)
+    return {
+        **key,
+        "reactions": count,
+        "avg_score": round(int(total) / count, 2),
+        "growth": None if rate is None else round(rate, 2),
+        "rising": rate is not None and rate >= RISING_FACTOR and count >= MIN_TRENDING_REACTIONS,
+    }
+
+
+def main() -> None:
+    from database import open_pool
+
+    parser = argparse.ArgumentParser(description="Show what is trending in the stored reactions of the last week.")
+    parser.add_argument("--window", choices=list(WINDOWS), default="day")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    pool = open_pool(size=1)
+    engine = TrendEngine()
+    print(f" {engine.warm_up(pool)} reactions replayed\n")
+    for entry in engine.categories(args.window):
+        print(f" {entry['category']:<15}{entry['reactions']:>8} reactions  avg {entry['avg_score']:.2f}"
+              f"  growth {entry['growth'] or 0:>5.2f}{'  rising' if entry['rising'] else ''}")
+    print()
+    for entry in engine.posts(args.window, args.limit):
+        print(f" post #{entry['post_id']:<10}{entry['reactions']:>8} reactions  avg {entry['avg_score']:.2f}"
+              f"  growth {entry['growth'] or 0:>5.2f}{'  rising' if entry['rising'] else ''}")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from passwords import get_passwd_hash
+
+# constraints shared by the interactive prompts and the bulk ingestion tool
+
+EMAIL_REGEX = r"[^@]+@[^@]+\.[^@]+"  # email regex
+MIN_AGE = 18
+MIN_PASSWORD_LENGTH = 8
+NULLABLE_USER_FIELDS = ("lname", "bio", "location")
+
+# post categories
+CATEGORIES = {
+    0: "Education",
+    1: "Food",
+    2: "Technology",
+    3: "Animals",
+    4: "Fitness",
+    5: "Travel",
+    6: "Gaming",
+    7: "Literature",
+    8: "Art",
+}
+CATEGORY_NAMES = {category.lower() for category in CATEGORIES.values()}  # as stored in post.category
+
+REACTION_SCORES = range(1, 6)
+MAX_POST_LENGTH = 500
+
+
+def validate_account_field(column: str, value: Any) -> Optional[str]:
+    """Checks one signup field, returns the error message or None if it is valid."""
+    value = "" if value is None else str(value)
+
+    # check for age constraint
+    if column == "age" and (not value.isdigit() or int(value) < MIN_AGE):
+        return f"You must be at least {MIN_AGE} years old to use this service!"
+
+    # check for password length constraint
+    if column == "password" and len(value) < MIN_PASSWORD_LENGTH:
+        return f"Password must be at least {MIN_PASSWORD_LENGTH} characters long."
+
+    # check for email format constraint
+    if column == "email" and not re.match(EMAIL_REGEX, value):
+        return "Please enter a valid email address."
+
+    # check for non-null constraint on Fname
+    if column == "fname" and not value:
+        return "First name cannot be empty."
+    return None
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """Parses an ISO 8601 date or 'YYYY-MM-DD HH:MM[:SS]' timestamp, None if empty.
+
+    Raises:
+        ValueError: if the value isn't a valid timestamp
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    return datetime.fromisoformat(value) if value else None
+
+
+def validate_timestamp(row: Dict[str, Any], column: str) -> Optional[str]:
+    try:
+        parse_timestamp(row.get(column))
+    except ValueError:
+        return f"Invalid {column} '{row.get(column)}', expected YYYY-MM-DD HH:MM."
+    return None
+
+
+def prepare_account(data: Dict[str, Any], hasher: Callable[[str], str] = get_passwd_hash) -> Dict[str, Any]:
+    """Fills in the generated account columns of validated signup data.
+
+    Empty optional fields become NULL, the password is hashed with ``hasher``
+    and username and email are lower cased. Join date and last login default
+    to now.
+    """
+    now = datetime.now()
+    for column in NULLABLE_USER_FIELDS:
+        if not data.get(column):
+            data[column] = None   # replaced NULL with None
+    join_date = parse_timestamp(data.get("join_date"))
+    data["join_date"] = join_date.date() if join_date else now.date()
+    data["last_login"] = parse_timestamp(data.get("last_login")) or now.replace(microsecond=0)
+    data["is_private"] = data.get("is_private") or "Y"  # by default, user account is private
+    data["password"] = hasher(data["password"])  # hashing password
+    data["username"] = data["username"].lower()  # converting to lower
+    data["email"] = data["email"].lower()  # converting to lower
+    return data
+
+
+def validate_post(row: Dict[str, Any]) -> Optional[str]:
+    """Checks a post record, returns the error message or None if it is valid."""
+    if str(row.get("category", "")).lower() not in CATEGORY_NAMES:
+        return f"Unknown category '{row.get('category')}'."
+    if len(str(row.get("content") or "")) > MAX_POST_LENGTH:
+        return f"Post content is longer than {MAX_POST_LENGTH} characters."
+    if not str(row.get("user_id", "")).isdigit():
+        return "Post user_id must be a number."
+    return validate_timestamp(row, "timestamp")
+
+
+def validate_reaction(row: Dict[str, Any]) -> Optional[str]:
+    """Checks a reaction record, returns the error message or None if it is valid."""
+    for column in ("post_id", "user_id"):
+        if not str(row.get(column, "")).isdigit():
+            return f"Reaction {column} must be a number."
+    score = str(row.get("reaction_score", ""))
+    if not score.isdigit() or int(score) not in REACTION_SCORES:
+        return f"Reaction score must be between {REACTION_SCORES.start} and {REACTION_SCORES.stop - 1}."
+    return validate_timestamp(row, "timestamp")